@@ -1,8 +1,16 @@
 #!/usr/bin/env python -*- coding: utf-8 -*-
 import ctypes as c
+import os
+import sys
 import time
 import numpy as np
 
+try:
+    from Example2.ni845xlib import NiHandle, loadLibrary
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from Example2.ni845xlib import NiHandle, loadLibrary
+
 DEV_SIZE = 256
 MAX_SIZE = 1024
 '''
@@ -15,7 +23,11 @@ class NI8452Interface():
     This class makes Python calls to the C DLL of NI USB 8452 (ni845x.dll)
     """
 
-    def __init__(self):
+    def __init__(self, backend=None):
+        """
+        :param backend: Ni845x library to use, see ni845xlib.loadLibrary()
+                        (None=NI845X_BACKEND env or the DLL, 'emu'=emulator, or an object)
+        """
         self.first_device = None
         self.find_device_handle = None
         self.number_found = None
@@ -30,8 +42,9 @@ class NI8452Interface():
         self._cIOdataIn = c.c_uint8()
 
         self.dll_location = "C:\\Windows\\System32\\Ni845x.dll"
+        self.spi = None
         try:
-            self.spi = c.cdll.LoadLibrary(self.dll_location)
+            self.spi = loadLibrary(backend, callConv='cdll')
         except Exception as e:
             print(e)
 
@@ -42,19 +55,44 @@ class NI8452Interface():
         :return: name of first device
         """
         self.first_device = c.create_string_buffer(DEV_SIZE)
-        self.find_device_handle = (c.c_ulong * 5)()
-        c.cast(self.find_device_handle, c.POINTER(c.c_ulong))
-        number_found = (c.c_ulong * 5)()
-        c.cast(number_found, c.POINTER(c.c_ulong))
+        self.find_device_handle = NiHandle()
+        number_found = c.c_uint32()
 
-        self.status_code = self.spi.ni845xFindDevice(self.first_device, self.find_device_handle, number_found)
+        self.status_code = self.spi.ni845xFindDevice(self.first_device, c.byref(self.find_device_handle),
+                                                     c.byref(number_found))
         print("returnValue ni845xFindDevice", self.status_code)
         # print("First Device Name:\n", repr(self.first_device.raw))
         print("First DeviceName:\n", str(self.first_device.value))
         # print("Number Found: ", number_found[0])
-        self.number_found = number_found[0]
+        self.number_found = number_found.value
         return self.first_device
 
+    def ni845xFindDeviceNext(self):
+        """
+        Calls NI USB-8452 C API function ni845xFindDeviceNext whose prototype is:
+        int32 ni845xFindDeviceNext (NiHandle FindDeviceHandle, char * pNextDevice);
+        Call after ni845xFindDevice, once per further device (number_found - 1 times)
+        :return: name of next device
+        """
+        next_device = c.create_string_buffer(DEV_SIZE)
+        self.status_code = self.spi.ni845xFindDeviceNext(self.find_device_handle.value, next_device)
+        print("NextDeviceName:\n", str(next_device.value))
+        return next_device
+
+    def ni845xFindDevices(self):
+        """
+        Enumerates all devices: ni845xFindDevice, ni845xFindDeviceNext for each
+        further device, then ni845xCloseFindDeviceHandle
+        :return: list of device names
+        """
+        devices = [self.ni845xFindDevice()]
+        if not self.number_found:
+            return []
+        for i in range(1, self.number_found):
+            devices.append(self.ni845xFindDeviceNext())
+        self.ni845xCloseFindDeviceHandle()
+        return devices
+
     def ni845xCloseFindDeviceHandle(self):
         """
         Calls NI USB-8452 C API function ni845xCloseFindDeviceHandle whose prototype is:
@@ -62,7 +100,7 @@ class NI8452Interface():
         :return: None
         """
 
-        self.status_code = self.spi.ni845xCloseFindDeviceHandle(self.find_device_handle)
+        self.status_code = self.spi.ni845xCloseFindDeviceHandle(self.find_device_handle.value)
         # print("returnValue", self.status_code)
         # print("Running StatusToString")
         returnValue = self.ni845xStatusToString(self.status_code)
@@ -282,7 +320,7 @@ class NI8452Interface():
                     The default value for this property is kNi845xSpiClockPhaseFirstEdge.
         :return: None
         """
-        cClockPhase = c.c_uint32(ClockPhase)
+        cClockPhase = c.c_int32(ClockPhase)
         returnValue = self.spi.ni845xSpiConfigurationSetClockPhase(self.configuration_handle, cClockPhase)
         print("cClockPhase set to: ", cClockPhase)
         print("Return values of ni845xSpiConfigurationSetClockPhase: ", returnValue)
@@ -359,7 +397,7 @@ class NI8452Interface():
 
         PortNumber = c.c_uint8(PortNumber)
         LineNumber = c.c_uint8(LineNumber)
-        WriteData = c.c_uint32(WriteData)
+        WriteData = c.c_int32(WriteData)
         returnValue = self.spi.ni845xSpiScriptDioWriteLine(self.script_handle, PortNumber, LineNumber, WriteData)
         print("PortNumber set to: ", PortNumber)
         print("LineNumber set to: ", LineNumber)
@@ -379,7 +417,7 @@ class NI8452Interface():
                 The default value for this property is kNi845xSpiClockPolarityIdleLow.
         :return: None
         """
-        cClockPolarity = c.c_uint32(ClockPolarity)
+        cClockPolarity = c.c_int32(ClockPolarity)
         returnValue = self.spi.ni845xSpiConfigurationSetClockPolarity(self.configuration_handle, cClockPolarity)
         print("cClockPolarity set to: ", cClockPolarity)
         print("Return values of ni845xSpiConfigurationSetClockPolarity: ", returnValue)
@@ -0,0 +1,487 @@
+#-------------------------------------------------------------------------------
+# Name:        AWMF beam-steering codebook
+# Purpose:     Precomputed, quantized BW0/BW1 register settings of a grid of
+#              steering angles for arrays of AWMF-0132/0133 Quad ASICs
+#
+# Authors:      astreet and  Daskalakispiros
+#
+# Created:     25/04/2020
+# Copyright:   (c) astreet 2020
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+
+
+#-------------------------------------------------------------------------------
+# Usage
+#
+#   cb = get_codebook(positions, 28e9, az=np.arange(-45, 46, 5), el=[0],
+#                     cacheDir='codebooks')
+#   AwmfCommander.load_codebook(cb)
+#   AwmfCommander.set_beam_index(cb.nearest(20, 0))
+#
+#   write_codebook_file('panel.awcb', cb)      # large tables: on-disk format
+#   AwmfCommander.load_codebook('panel.awcb')  # memory-mapped, read lazily
+#
+#   packets = build_packets(positions, [27.5e9, 28e9], az, el, workers=8)
+#   build_codebook_file('panel.awcb', positions, 28e9, az, el, workers=8)
+#   (process pool: call from under `if __name__ == '__main__':` on Windows)
+#
+# Geometry: positions (m) of every element, shape (nChips, 8, 3) in ELEMENT_*
+# order per chip. Direction of (az, el) in degrees:
+#   u = (cos(el) sin(az), sin(el), cos(el) cos(az))      broadside = +z
+# Element n gets phase -k (r_n . u), quantized to PHASE_STEP (6 bit code).
+# An optional amplitude taper is quantized to ATTEN_STEP dB codes (4 bit).
+#-------------------------------------------------------------------------------
+import hashlib
+import mmap
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from Example2.fake_spiwrite import (AwmfCommander, COMM_ATT_0dB, REG_ADDR_SHIFT,
+                                    REG_BW0, REG_BW1)
+
+# Register order of the packets of one chip and beam
+CODEBOOK_REGS = (REG_BW1, REG_BW0)
+
+SPEED_OF_LIGHT = 299792458.0
+PHASE_STEP = 360.0 / 64      # deg per phase code
+ATTEN_STEP = 0.5             # dB per attenuation code
+
+# In-memory LRU of built codebooks: key -> Codebook
+cacheSize = 16
+_cache = OrderedDict()
+
+
+class Codebook(object):
+    """
+    Quantized settings of nBeams steering angles for nChips chips
+
+    angles:  (nBeams, 2) float, az/el in degrees
+    phases:  (nBeams, nChips, 8) uint8 phase codes 0-63
+    atten:   (nBeams, nChips, 8) uint8 attenuation codes 0-15
+    bw0:     (nBeams, nChips) uint64 BW0 register data
+    bw1:     (nBeams, nChips) uint64 BW1 register data
+    key:     cache key of geometry + frequency + grid + settings
+    """
+
+    regs = CODEBOOK_REGS
+
+    def __init__(self, angles, phases, atten, bw0, bw1, key=None):
+        self.angles = np.asarray(angles, dtype=np.float64)
+        self.phases = np.asarray(phases, dtype=np.uint8)
+        self.atten = np.asarray(atten, dtype=np.uint8)
+        self.bw0 = np.asarray(bw0, dtype=np.uint64)
+        self.bw1 = np.asarray(bw1, dtype=np.uint64)
+        self.key = key
+
+    def __len__(self):
+        return self.bw1.shape[0]
+
+    @property
+    def nChips(self):
+        return self.bw1.shape[1]
+
+    def packets(self, index):
+        """
+        :return: (nChips, 2) uint64 array of the BW1, BW0 packets of beam index
+                 (index may be a slice: (n, nChips, 2))
+        """
+        return np.stack(((np.uint64(REG_BW1) << np.uint64(REG_ADDR_SHIFT)) | self.bw1[index],
+                         (np.uint64(REG_BW0) << np.uint64(REG_ADDR_SHIFT)) | self.bw0[index]), axis=-1)
+
+    def nearest(self, az, el=0.0):
+        """
+        :return: index of the beam closest (in direction cosines) to az/el (deg)
+        """
+        return _nearest(self.angles, az, el)
+
+    def save(self, fSpec):
+        """
+        Stores the codebook as a NumPy .npz file
+        """
+        np.savez(fSpec, angles=self.angles, phases=self.phases, atten=self.atten,
+                 bw0=self.bw0, bw1=self.bw1, key=np.asarray(self.key or ''))
+
+    @classmethod
+    def load(cls, fSpec):
+        """
+        Reads a codebook stored by save()
+        """
+        with np.load(fSpec) as f:
+            return cls(f['angles'], f['phases'], f['atten'], f['bw0'], f['bw1'], str(f['key']) or None)
+
+
+#-------------------------------------------------------------------------------
+# On-disk format (little endian), memory-mapped by MappedCodebook
+#
+#   header    CB_HEADER (128 bytes)
+#   angles    float64 (nBeams, 2) az/el deg, at anglesOffset
+#   packets   uint64 (nBeams, nChips, nRegs) 60 bit register packets
+#             (address in bits 48-55), at packetsOffset (8 byte aligned)
+#-------------------------------------------------------------------------------
+CB_MAGIC = b'AWMFCB01'
+CB_VERSION = 1
+CB_HEADER = np.dtype([('magic', 'S8'), ('version', '<u4'), ('nBeams', '<u4'),
+                      ('nChips', '<u4'), ('nRegs', '<u4'), ('anglesOffset', '<u8'),
+                      ('packetsOffset', '<u8'), ('regs', 'u1', (8,)), ('key', 'S40'),
+                      ('reserved', 'S40')])
+
+
+class MappedCodebook(object):
+    """
+    Codebook file opened with numpy.memmap: only the pages of the beams used
+    are read, so tables larger than memory open instantly
+
+    mode:  'r' read only, 'r+' to fill a file made by create_codebook_file()
+    """
+
+    def __init__(self, fSpec, mode='r'):
+        self.fSpec = fSpec
+        hdr = np.fromfile(fSpec, dtype=CB_HEADER, count=1)
+        if len(hdr) != 1 or hdr['magic'][0] != CB_MAGIC:
+            raise ValueError("Not an AWMF codebook file: %s" % fSpec)
+        if hdr['version'][0] > CB_VERSION:
+            raise ValueError("Unsupported codebook file version %d" % hdr['version'][0])
+        hdr = hdr[0]
+        nBeams, nChips, nRegs = int(hdr['nBeams']), int(hdr['nChips']), int(hdr['nRegs'])
+        self.regs = tuple(int(r) for r in hdr['regs'][:nRegs])
+        self.key = hdr['key'].decode() or None
+        self.angles = np.memmap(fSpec, dtype='<f8', mode=mode, offset=int(hdr['anglesOffset']),
+                                shape=(nBeams, 2))
+        self.packetMap = np.memmap(fSpec, dtype='<u8', mode=mode, offset=int(hdr['packetsOffset']),
+                                   shape=(nBeams, nChips, nRegs))
+
+    def __len__(self):
+        return self.packetMap.shape[0]
+
+    @property
+    def nChips(self):
+        return self.packetMap.shape[1]
+
+    def packets(self, index):
+        """
+        :return: (nChips, nRegs) uint64 array of the packets of beam index
+                 (read from the file; a slice gives (n, nChips, nRegs))
+        """
+        return np.array(self.packetMap[index], dtype=np.uint64)
+
+    def nearest(self, az, el=0.0):
+        """
+        :return: index of the beam closest (in direction cosines) to az/el (deg)
+        """
+        return _nearest(self.angles, az, el)
+
+    def flush(self):
+        self.angles.flush()
+        self.packetMap.flush()
+
+
+def create_codebook_file(fSpec, nBeams, nChips, regs=CODEBOOK_REGS, key=None):
+    """
+    Creates a zero filled codebook file and returns it opened 'r+', so that
+    large tables can be written beam block by beam block
+    """
+    nRegs = len(regs)
+    if not 0 < nRegs <= 8:
+        raise ValueError("1 to 8 registers per chip")
+    hdr = np.zeros(1, dtype=CB_HEADER)
+    hdr['magic'] = CB_MAGIC
+    hdr['version'] = CB_VERSION
+    hdr['nBeams'] = nBeams
+    hdr['nChips'] = nChips
+    hdr['nRegs'] = nRegs
+    hdr['anglesOffset'] = CB_HEADER.itemsize
+    hdr['packetsOffset'] = CB_HEADER.itemsize + 16 * nBeams
+    hdr['regs'][0, :nRegs] = regs
+    hdr['key'] = (key or '').encode()
+    with open(fSpec, 'wb') as f:
+        hdr.tofile(f)
+        f.truncate(int(hdr['packetsOffset'][0]) + 8 * nBeams * nChips * nRegs)
+    return MappedCodebook(fSpec, mode='r+')
+
+
+def write_codebook_file(fSpec, codebook, chunk=4096):
+    """
+    Stores a Codebook in the on-disk format, chunk beams at a time
+    :return: the file opened read only (MappedCodebook)
+    """
+    nBeams = len(codebook)
+    mcb = create_codebook_file(fSpec, nBeams, codebook.nChips, codebook.regs, codebook.key)
+    mcb.angles[:] = codebook.angles
+    for start in range(0, nBeams, chunk):
+        stop = min(start + chunk, nBeams)
+        mcb.packetMap[start:stop] = codebook.packets(slice(start, stop))
+    mcb.flush()
+    del mcb
+    return MappedCodebook(fSpec)
+
+
+def open_codebook(fSpec):
+    """
+    Opens a codebook file read only (memory-mapped)
+    """
+    return MappedCodebook(fSpec)
+
+
+def _nearest(angles, az, el):
+    u = _directions(np.asarray([az, el], dtype=np.float64))
+    return int(np.argmax(_directions(np.asarray(angles)) @ u))
+
+
+def _directions(angles):
+    """
+    (..., 2) az/el degrees -> (..., 3) unit vectors (broadside = +z)
+    """
+    az = np.radians(angles[..., 0])
+    el = np.radians(angles[..., 1])
+    return np.stack((np.cos(el) * np.sin(az), np.sin(el), np.cos(el) * np.cos(az)), axis=-1)
+
+
+def steering_phases(positions, freq, angles):
+    """
+    Quantized steering phase codes
+    :param positions: (nChips, 8, 3) element positions in m
+    :param freq: carrier frequency in Hz
+    :param angles: (nBeams, 2) az/el in degrees
+    :return: (nBeams, nChips, 8) uint8 phase codes 0-63
+    """
+    k = 2 * np.pi * freq / SPEED_OF_LIGHT
+    pathPhase = np.degrees(-k * np.einsum('cei,bi->bce', positions, _directions(angles)))
+    return (np.rint(pathPhase / PHASE_STEP).astype(np.int64) % 64).astype(np.uint8)
+
+
+def taper_codes(taper):
+    """
+    Quantized attenuation codes of an amplitude taper (linear, any scale)
+    :return: uint8 codes 0-15 of the same shape (0 = strongest element)
+    """
+    taper = np.abs(np.asarray(taper, dtype=np.float64))
+    with np.errstate(divide='ignore'):
+        attDb = -20 * np.log10(taper / taper.max())
+    return np.clip(np.rint(attDb / ATTEN_STEP), 0, 15).astype(np.uint8)
+
+
+def _positions(positions):
+    positions = np.asarray(positions, dtype=np.float64)
+    if positions.shape[-1] != 3 or positions.size % 24:
+        raise ValueError("Expected element positions of shape (nChips, 8, 3)")
+    return positions.reshape(-1, 8, 3)
+
+
+def _grid(az, el):
+    az, el = np.meshgrid(np.atleast_1d(np.asarray(az, dtype=np.float64)),
+                         np.atleast_1d(np.asarray(el, dtype=np.float64)), indexing='ij')
+    return np.stack((az.ravel(), el.ravel()), axis=-1)
+
+
+def codebook_key(positions, freq, angles, taper=None, enables=None, comm_att=COMM_ATT_0dB):
+    """
+    :return: hex digest identifying geometry, frequency, grid and settings
+    """
+    h = hashlib.sha1()
+    for arr in (positions, np.float64(freq), angles,
+                np.float64(0) if taper is None else taper,
+                np.int64(1) if enables is None else enables, np.int64(comm_att)):
+        arr = np.ascontiguousarray(arr, dtype=np.float64)
+        h.update(str(arr.shape).encode())
+        h.update(arr.tobytes())
+    return h.hexdigest()
+
+
+def build_codebook(positions, freq, az, el=0.0, taper=None, enables=None, comm_att=COMM_ATT_0dB):
+    """
+    Computes the codebook of the az x el grid (degrees) at freq (Hz)
+    :param positions: (nChips, 8, 3) element positions in m
+    :param taper: None or linear amplitude weights, shape (nChips, 8)
+    :param enables: None (all ON) or (nChips, 8) of 0/1
+    :return: Codebook, beams in az-major order
+    """
+    positions = _positions(positions)
+    angles = _grid(az, el)
+    nChips = positions.shape[0]
+    key = codebook_key(positions, freq, angles, taper, enables, comm_att)
+
+    phases = steering_phases(positions, freq, angles)
+    atten = np.zeros((nChips, 8), dtype=np.uint8) if taper is None else \
+        taper_codes(np.asarray(taper).reshape(nChips, 8))
+    if enables is None:
+        enables = np.ones((nChips, 8), dtype=np.uint8)
+    enables = np.asarray(enables).reshape(nChips, 8)
+
+    # BW0 does not depend on the angle: one value per chip
+    bw0 = AwmfCommander.beam_bw0(atten, enables, comm_att)
+    bw1 = AwmfCommander.beam_bw1(phases)
+    nBeams = len(angles)
+    return Codebook(angles, phases, np.broadcast_to(atten, (nBeams, nChips, 8)),
+                    np.broadcast_to(np.asarray(bw0, dtype=np.uint64), (nBeams, nChips)), bw1, key)
+
+
+def _fill_packets(table, positions, freq, fIdx, angles, start, stop, bw0Packets):
+    """
+    Packets of beams start:stop at freq into table[fIdx] (nFreqs, nBeams, nChips, 2)
+    """
+    bw1 = AwmfCommander.beam_bw1(steering_phases(positions, freq, angles[start:stop]))
+    table[fIdx, start:stop, :, 0] = (np.uint64(REG_BW1) << np.uint64(REG_ADDR_SHIFT)) | bw1
+    table[fIdx, start:stop, :, 1] = bw0Packets
+
+
+def _packet_worker(target, shape, positions, freq, fIdx, angles, start, stop, bw0Packets):
+    """
+    Process pool task: packets of beams start:stop at freq into the table
+    :param target: ('shm', shared memory name) or ('file', path, byte offset) of
+                   the table (C order uint64)
+    """
+    if target[0] == 'file':
+        table = np.memmap(target[1], dtype='<u8', mode='r+', offset=target[2], shape=shape)
+        _fill_packets(table, positions, freq, fIdx, angles, start, stop, bw0Packets)
+        table.flush()
+        del table
+        return stop - start
+
+    shm = shared_memory.SharedMemory(name=target[1])
+    try:
+        table = np.ndarray(shape, dtype=np.uint64, buffer=shm.buf)
+        _fill_packets(table, positions, freq, fIdx, angles, start, stop, bw0Packets)
+        del table
+    finally:
+        shm.close()
+    return stop - start
+
+
+def build_packets(positions, freqs, az, el=0.0, taper=None, enables=None, comm_att=COMM_ATT_0dB,
+                  workers=None, chunk=1024, out=None):
+    """
+    Computes the BW1/BW0 packets (60 bit, as sent by Anokiewave_write) of every
+    frequency x beam x chip with a process pool writing into shared memory
+    :param freqs: frequency (Hz) or sequence of frequencies
+    :param workers: pool size (None: os.cpu_count(), 1: no pool)
+    :param chunk: beams per pool task
+    :param out: optional array of the result shape the packets are written to.
+                A file backed np.memmap (e.g. MappedCodebook.packetMap opened
+                'r+') is written by the pool workers directly, without a
+                table sized copy in memory
+    :return: (nFreqs, nBeams, nChips, 2) uint64 packets, BW1 then BW0
+             ((nBeams, nChips, 2) for a scalar freqs); beams in az-major order
+             (out if given)
+    """
+    positions = _positions(positions)
+    angles = _grid(az, el)
+    scalar = np.ndim(freqs) == 0
+    freqs = np.atleast_1d(np.asarray(freqs, dtype=np.float64))
+    nChips = positions.shape[0]
+    nBeams = len(angles)
+    shape = (len(freqs), nBeams, nChips, 2)
+
+    if out is not None:
+        if out.shape != (shape[1:] if scalar else shape) or out.dtype != np.uint64:
+            raise ValueError("out must be a uint64 array of shape %s" % (shape[1:] if scalar else shape,))
+        table = out.reshape(shape)
+    else:
+        table = None
+
+    atten = np.zeros((nChips, 8), dtype=np.uint8) if taper is None else \
+        taper_codes(np.asarray(taper).reshape(nChips, 8))
+    if enables is None:
+        enables = np.ones((nChips, 8), dtype=np.uint8)
+    enables = np.asarray(enables).reshape(nChips, 8)
+    bw0Packets = (np.uint64(REG_BW0) << np.uint64(REG_ADDR_SHIFT)) | \
+        np.asarray(AwmfCommander.beam_bw0(atten, enables, comm_att), dtype=np.uint64)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    tasks = [(fIdx, start, min(start + chunk, nBeams))
+             for fIdx in range(len(freqs)) for start in range(0, nBeams, chunk)]
+
+    if workers <= 1 or len(tasks) <= 1:
+        if table is None:
+            table = np.empty(shape, dtype=np.uint64)
+        for fIdx, start, stop in tasks:
+            _fill_packets(table, positions, freqs[fIdx], fIdx, angles, start, stop, bw0Packets)
+        if out is not None:
+            return out
+        return table[0] if scalar else table
+
+    def run(target):
+        with ProcessPoolExecutor(min(workers, len(tasks))) as pool:
+            futures = [pool.submit(_packet_worker, target, shape, positions, freqs[fIdx], fIdx,
+                                   angles, start, stop, bw0Packets) for fIdx, start, stop in tasks]
+            for f in futures:
+                f.result()
+
+    if isinstance(out, np.memmap) and isinstance(out.base, mmap.mmap) and out.filename \
+            and out.flags.c_contiguous:
+        # The workers map the file themselves and write their beam blocks in place
+        out.flush()
+        run(('file', out.filename, out.offset))
+        return out
+
+    shm = shared_memory.SharedMemory(create=True, size=max(8, 8 * int(np.prod(shape))))
+    try:
+        run(('shm', shm.name))
+        shared = np.ndarray(shape, dtype=np.uint64, buffer=shm.buf)
+        if table is None:
+            table = shared.copy()
+        else:
+            table[...] = shared
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+    if out is not None:
+        return out
+    return table[0] if scalar else table
+
+
+def build_codebook_file(fSpec, positions, freq, az, el=0.0, taper=None, enables=None,
+                        comm_att=COMM_ATT_0dB, workers=None, chunk=1024):
+    """
+    build_packets() of one frequency written straight into the on-disk
+    codebook format (no table sized copy in memory)
+    :return: the file opened read only (MappedCodebook)
+    """
+    positions = _positions(positions)
+    angles = _grid(az, el)
+    key = codebook_key(positions, freq, angles, taper, enables, comm_att)
+
+    mcb = create_codebook_file(fSpec, len(angles), positions.shape[0], CODEBOOK_REGS, key)
+    mcb.angles[:] = angles
+    build_packets(positions, freq, az, el, taper, enables, comm_att, workers, chunk, out=mcb.packetMap)
+    mcb.flush()
+    del mcb
+    return MappedCodebook(fSpec)
+
+
+def get_codebook(positions, freq, az, el=0.0, taper=None, enables=None, comm_att=COMM_ATT_0dB,
+                 cacheDir=None):
+    """
+    build_codebook() through the in-memory LRU and, if cacheDir is given,
+    a persistent .npz cache keyed by codebook_key()
+    """
+    positions = _positions(positions)
+    key = codebook_key(positions, freq, _grid(az, el), taper, enables, comm_att)
+
+    cb = _cache.get(key)
+    if cb is not None:
+        _cache.move_to_end(key)
+        return cb
+
+    fSpec = None
+    if cacheDir is not None:
+        fSpec = os.path.join(cacheDir, 'awmf_cb_%s.npz' % key)
+        if os.path.exists(fSpec):
+            cb = Codebook.load(fSpec)
+    if cb is None:
+        cb = build_codebook(positions, freq, az, el, taper, enables, comm_att)
+        if fSpec is not None:
+            os.makedirs(cacheDir, exist_ok=True)
+            cb.save(fSpec)
+
+    _cache[key] = cb
+    if len(_cache) > cacheSize:
+        _cache.popitem(last=False)
+    return cb
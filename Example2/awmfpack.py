@@ -0,0 +1,86 @@
+#-------------------------------------------------------------------------------
+# Name:        AWMF frame packing
+# Purpose:     Vectorized (NumPy) packing of register frames into SPI words
+#              for the AWMF-0132/0133 K/Ka-Band Rx/Tx Quad ASICs
+#
+# Authors:      astreet and  Daskalakispiros
+#
+# Created:     25/04/2020
+# Copyright:   (c) astreet 2020
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+import numpy as np
+
+
+def packValues(vals, in_width=8, packed_size=10, big_endian=True):
+    """
+    Vectorized AwmfCommander.__packValues: the last axis of vals holds the
+    values (in_width bits each) of one bit stream, which is packed LSB first
+    into packed_size bit words (reversed if big_endian). Leading axes
+    (e.g. beams x chips) are packed independently in one call.
+
+    :param vals: array_like of unsigned ints, shape (..., nVals)
+    :param in_width: bits per value (<= 64)
+    :param packed_size: bits per packed word (<= 64)
+    :return: uint64 array, shape (..., ceil(nVals*in_width/packed_size))
+    """
+    vals = np.asarray(vals, dtype=np.uint64)
+    if vals.ndim == 0:
+        vals = vals.reshape(1)
+    lead = vals.shape[:-1]
+    nBits = vals.shape[-1] * in_width
+    nWords = -(-nBits // packed_size)
+
+    if nBits == 0:
+        return np.zeros(lead + (0,), dtype=np.uint64)
+
+    if in_width % packed_size == 0:
+        # Each value splits into whole words: shift/mask only
+        shifts = np.arange(0, in_width, packed_size, dtype=np.uint64)
+        mask = np.uint64((1 << packed_size) - 1)
+        words = ((vals[..., None] >> shifts) & mask).reshape(lead + (nWords,))
+    else:
+        bits = (vals[..., None] >> np.arange(in_width, dtype=np.uint64)) & np.uint64(1)
+        bits = bits.reshape(lead + (nBits,))
+        pad = nWords * packed_size - nBits
+        if pad:
+            bits = np.concatenate((bits, np.zeros(lead + (pad,), dtype=np.uint64)), axis=-1)
+        bits = bits.reshape(lead + (nWords, packed_size))
+        words = (bits << np.arange(packed_size, dtype=np.uint64)).sum(axis=-1, dtype=np.uint64)
+
+    if big_endian:
+        words = words[..., ::-1]
+    return np.ascontiguousarray(words)
+
+
+def unpackValues(words, in_width=8, packed_size=10, nVals=None, big_endian=True):
+    """
+    Inverse of packValues: splits packed words (e.g. SPI read back) into
+    in_width bit values. Leading axes are unpacked independently.
+
+    :param words: array_like of unsigned ints, shape (..., nWords)
+    :param nVals: number of values per stream (default: all whole values)
+    :return: uint64 array, shape (..., nVals)
+    """
+    words = np.asarray(words, dtype=np.uint64)
+    lead = words.shape[:-1]
+    nBits = words.shape[-1] * packed_size
+    if nVals is None:
+        nVals = nBits // in_width
+    if nVals * in_width > nBits:
+        raise ValueError("Not enough packed words for %d values" % nVals)
+
+    if big_endian:
+        words = words[..., ::-1]
+
+    if in_width % packed_size == 0:
+        nPer = in_width // packed_size
+        words = words[..., :nVals * nPer].reshape(lead + (nVals, nPer))
+        shifts = np.arange(0, in_width, packed_size, dtype=np.uint64)
+        mask = np.uint64((1 << packed_size) - 1)
+        return np.bitwise_or.reduce((words & mask) << shifts, axis=-1)
+
+    bits = (words[..., None] >> np.arange(packed_size, dtype=np.uint64)) & np.uint64(1)
+    bits = bits.reshape(lead + (nBits,))[..., :nVals * in_width]
+    bits = bits.reshape(lead + (nVals, in_width))
+    return (bits << np.arange(in_width, dtype=np.uint64)).sum(axis=-1, dtype=np.uint64)
@@ -0,0 +1,201 @@
+#-------------------------------------------------------------------------------
+# Name:        AWMF register map
+# Purpose:     Declarative register/field layout of the AWMF-0132/0133 Quad
+#              ASICs, compiled to shift/mask tables for encode/decode
+#
+# Authors:      astreet and  Daskalakispiros
+#
+# Created:     25/04/2020
+# Copyright:   (c) astreet 2020
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+
+
+#-------------------------------------------------------------------------------
+# Register map
+#
+# REGISTER_MAP: name -> (address, fields); a field is
+#   (name, lsb, width)                    single field
+#   (name, lsb, width, count, stride)     count fields, element i at lsb + i*stride
+# Array fields are indexed by ELEMENT_* (0-7). Address None = read-only frame
+# layout (telemetry shifted out on MISO).
+#
+#   BW0.encode(atten=[0]*8, comm_att=0, disable=[0]*8)   -> int
+#   BW0.encode(atten=codes, comm_att=0, disable=d)       -> uint64 array (batch)
+#   BW0.decode(data)['atten']                            -> list of 8 codes
+#   BW1.update(data, 'phase', 12, ELEMENT_2_a)           -> new data
+#   BW0.position('atten', ELEMENT_1_b)                   -> (shift, mask)
+#-------------------------------------------------------------------------------
+from collections import OrderedDict
+
+import numpy as np
+
+REGISTER_MAP = OrderedDict((
+    ('MODE', (0x00, (
+        ('rf_en',    23, 1),
+        ('reset',    24, 1),
+    ))),
+    ('BW0', (0x01, (
+        ('atten',    0,  4, 8, 4),          # 0.5 dB per code
+        ('comm_att', 32, 2),                # COMM_ATT_*
+        ('disable',  34, 1, 8, 1),          # 1 = element OFF
+    ))),
+    ('BW1', (0x02, (
+        ('phase',    0,  6, 8, 6),          # 5.625 deg per code
+    ))),
+    ('TELEMETRY', (None, (
+        ('temp',     0,  6),
+        ('power_1a', 11, 5),
+        ('power_1b', 6,  5),
+        ('power_2a', 21, 5),
+        ('power_2b', 16, 5),
+        ('power_3a', 31, 5),
+        ('power_3b', 26, 5),
+        ('power_4a', 41, 5),
+        ('power_4b', 36, 5),
+    ))),
+))
+
+
+class Field(object):
+    '''Compiled field: shifts of its element(s) and the width mask
+
+    shifts:     tuple of int shifts (one per element)
+    shiftArr:   the same as a uint64 array (batch path)
+    mask:       (1 << width) - 1
+    masks:      tuple of the in place masks of the elements
+    inPlace:    mask of all its bits in the register
+    '''
+
+    def __init__(self, name, lsb, width, count=None, stride=None):
+        self.name = name
+        self.lsb = lsb
+        self.width = width
+        self.count = count
+        self.mask = (1 << width) - 1
+        n = 1 if count is None else count
+        self.shifts = tuple(lsb + i * (stride or width) for i in range(n))
+        self.shiftArr = np.asarray(self.shifts, dtype=np.uint64)
+        self.masks = tuple(self.mask << shift for shift in self.shifts)
+        self.inPlace = 0
+        for mask in self.masks:
+            self.inPlace |= mask
+
+    @property
+    def isArray(self):
+        return self.count is not None
+
+
+class Register(object):
+    '''Compiled register: encode/decode/update of its fields'''
+
+    def __init__(self, name, address, fields):
+        self.name = name
+        self.address = address
+        self.fields = OrderedDict((f[0], Field(*f)) for f in fields)
+
+    def position(self, field, index=None):
+        '''Returns (shift, in place mask) of field, or of element index of an array field'''
+        f = self.fields[field]
+        if index is None:
+            return f.lsb, f.inPlace
+        if not 0 <= index < len(f.shifts):
+            raise ValueError("Incorrect %s.%s index %r" % (self.name, field, index))
+        return f.shifts[index], f.masks[index]
+
+    def _checkRange(self, f, value):
+        if np.any(np.asarray(value) < 0) or np.any(np.asarray(value) > f.mask):
+            raise ValueError("Incorrect %s.%s value" % (self.name, f.name))
+
+    def encode(self, check=True, **values):
+        '''Packs field values into register data; missing fields are 0.
+        Array fields take count values; a value with extra leading axes
+        (NumPy batch) makes the result a uint64 array of those axes'''
+        batch = False
+        for name, value in values.items():
+            f = self.fields[name]
+            if np.ndim(value) > (1 if f.isArray else 0):
+                batch = True
+                break
+
+        if not batch:
+            data = 0
+            for name, value in values.items():
+                f = self.fields[name]
+                if check:
+                    self._checkRange(f, value)
+                if f.isArray:
+                    if len(value) != f.count:
+                        raise ValueError("Expected %d %s.%s values" % (f.count, self.name, name))
+                    for v, shift in zip(value, f.shifts):
+                        data |= (int(v) & f.mask) << shift
+                else:
+                    data |= (int(value) & f.mask) << f.lsb
+            return data
+
+        data = None
+        for name, value in values.items():
+            f = self.fields[name]
+            value = np.asarray(value)
+            if check:
+                self._checkRange(f, value)
+            value = value.astype(np.uint64) & np.uint64(f.mask)
+            if f.isArray:
+                if value.shape[-1:] != (f.count,):
+                    raise ValueError("Expected %d %s.%s values" % (f.count, self.name, name))
+                part = (value << f.shiftArr).sum(axis=-1, dtype=np.uint64)
+            else:
+                part = value << np.uint64(f.lsb)
+            data = part if data is None else data | part
+        return data
+
+    def decode(self, data):
+        '''Returns {field: value}; array fields give a list (int data) or an
+        array with a last axis of count (uint64 array data)'''
+        out = OrderedDict()
+        if isinstance(data, np.ndarray):
+            data = data.astype(np.uint64)
+            for name, f in self.fields.items():
+                if f.isArray:
+                    out[name] = (data[..., None] >> f.shiftArr) & np.uint64(f.mask)
+                else:
+                    out[name] = (data >> np.uint64(f.lsb)) & np.uint64(f.mask)
+            return out
+        data = int(data)
+        for name, f in self.fields.items():
+            if f.isArray:
+                out[name] = [(data >> shift) & f.mask for shift in f.shifts]
+            else:
+                out[name] = (data >> f.lsb) & f.mask
+        return out
+
+    def get(self, data, field, index=None):
+        '''Returns one field (element index of an array field) of int data'''
+        shift, mask = self.position(field, index)
+        if index is None and self.fields[field].isArray:
+            return self.decode(data)[field]
+        return (int(data) & mask) >> shift
+
+    def update(self, data, field, value, index=None):
+        '''Returns int data with field (element index) set to value; an
+        array field without index takes count values'''
+        f = self.fields[field]
+        self._checkRange(f, value)
+        if index is None and f.isArray:
+            return (int(data) & ~f.inPlace) | self.encode(check=False, **{field: value})
+        shift, mask = self.position(field, index)
+        return (int(data) & ~mask) | ((int(value) & f.mask) << shift)
+
+
+def compile_map(registerMap=REGISTER_MAP):
+    '''Returns {name: Register} of a register map'''
+    return OrderedDict((name, Register(name, address, fields))
+                       for name, (address, fields) in registerMap.items())
+
+
+REGISTERS = compile_map()
+MODE = REGISTERS['MODE']
+BW0 = REGISTERS['BW0']
+BW1 = REGISTERS['BW1']
+TELEMETRY = REGISTERS['TELEMETRY']
@@ -0,0 +1,222 @@
+#-------------------------------------------------------------------------------
+# Name:        AWMF telemetry poller
+# Purpose:     Continuous temperature / power monitoring of AWMF-0132/0133
+#              chips into a fixed size ring buffer
+#
+# Authors:      astreet and  Daskalakispiros
+#
+# Created:     25/04/2020
+# Copyright:   (c) astreet 2020
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+
+
+#-------------------------------------------------------------------------------
+# Usage
+#
+#   poller = TelemetryPoller(AwmfCommander, chips=(0, 1, 2, 3), rate=20.0)
+#   poller.start()
+#   for rec in poller.records():           # blocking generator
+#       ...
+#   async for rec in poller:               # asyncio
+#       ...
+#   poller.snapshot(decimate=10, chip=2)   # last samples, every 10th
+#   poller.stop()
+#
+# Every poll reads all chips in one SPI script run (AwmfCommander.read_telemetry)
+# and appends one record per chip: t (time.time()), chip, temp, power_1a..4b.
+# The ring holds the last `capacity` records; older ones are overwritten.
+# Pass worker= (ni8452aio.DeviceWorker) to serialize the polls with the other
+# calls of the device; without it the commander must not be used concurrently.
+#-------------------------------------------------------------------------------
+import asyncio
+import logging
+import threading
+import time
+
+import numpy as np
+
+from Example2.fake_spiwrite import AwmfCommander, TELEMETRY_FIELDS
+
+log = logging.getLogger(__name__)
+
+RING_DTYPE = np.dtype([('t', np.float64), ('chip', np.uint16)] +
+                      [(name, np.uint8) for name, lsb, width in TELEMETRY_FIELDS])
+
+
+class TelemetryRing(object):
+    '''Fixed size ring buffer of telemetry records (RING_DTYPE)
+
+    count:  records pushed since creation (sequence number of the next one)
+    '''
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=RING_DTYPE)
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def push(self, t, chips, telemetry):
+        '''Appends one record per chip; telemetry: TELEMETRY_DTYPE records in chips order'''
+        n = len(chips)
+        idx = np.arange(self.count, self.count + n) % self.capacity
+        rec = self.data
+        rec['t'][idx] = t
+        rec['chip'][idx] = chips
+        for name, lsb, width in TELEMETRY_FIELDS:
+            rec[name][idx] = telemetry[name]
+        self.count += n
+
+    def since(self, seq):
+        '''Returns (records with sequence number >= seq, next seq); records
+        already overwritten are skipped'''
+        start = max(seq, self.count - self.capacity)
+        idx = np.arange(start, self.count) % self.capacity
+        return self.data[idx], self.count
+
+    def snapshot(self, last=None, decimate=1, chip=None, mean=False):
+        '''Returns a copy of the buffered records, oldest first
+        last:      only the last n records (before filtering)
+        decimate:  keep every decimate-th record (per the filtered series)
+        chip:      only records of this chip
+        mean:      average each block of decimate records instead of picking one'''
+        n = len(self)
+        if last is not None:
+            n = min(n, last)
+        rec = self.since(self.count - n)[0]
+        if chip is not None:
+            rec = rec[rec['chip'] == chip]
+        if decimate <= 1:
+            return rec
+        if not mean:
+            return rec[::decimate]
+
+        nBlocks = len(rec) // decimate
+        out = np.zeros(nBlocks, dtype=[(name, np.float64) for name in RING_DTYPE.names])
+        for name in RING_DTYPE.names:
+            out[name] = rec[name][:nBlocks * decimate].reshape(nBlocks, decimate).mean(axis=1)
+        return out
+
+
+class TelemetryPoller(object):
+    '''Background thread reading the telemetry of chips at rate (Hz) into a TelemetryRing
+
+    commander:  AwmfCommander class of the device
+    worker:     optional ni8452aio.DeviceWorker the reads are submitted to
+    mode:       None (polls never touch the RX_EN/TX_EN lines) or the mode
+                passed to read_telemetry
+    '''
+
+    def __init__(self, commander=AwmfCommander, chips=(0,), rate=10.0, capacity=4096,
+                 worker=None, mode=None):
+        self.commander = commander
+        self.chips = tuple(chips)
+        self.period = 1.0 / rate
+        self.worker = worker
+        self.mode = mode
+        self.ring = TelemetryRing(capacity)
+        self.error = None
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, excType, excVal, tb):
+        self.stop()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        '''Starts the polling thread'''
+        if self.running:
+            return
+        self._stop.clear()
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name='awmf-telemetry', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        '''Stops the polling thread after the current poll'''
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def poll_once(self):
+        '''Reads all chips once and appends the records; returns them'''
+        if self.worker is not None:
+            telemetry = self.worker.submit(self.commander.read_telemetry, self.chips, self.mode).result()
+        else:
+            telemetry = self.commander.read_telemetry(self.chips, self.mode)
+        with self._cond:
+            self.ring.push(time.time(), self.chips, telemetry)
+            self._cond.notify_all()
+        return telemetry
+
+    def _run(self):
+        tNext = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                log.error('Telemetry poll failed: %s', e)
+                self.error = e
+                self._stop.set()
+                break
+            # Fixed rate: skip missed periods instead of bursting
+            tNext += self.period
+            now = time.perf_counter()
+            if tNext < now:
+                tNext = now
+            self._stop.wait(tNext - now)
+        with self._cond:
+            self._cond.notify_all()
+
+    def snapshot(self, last=None, decimate=1, chip=None, mean=False):
+        '''Copy of the buffered records, see TelemetryRing.snapshot()'''
+        with self._cond:
+            return self.ring.snapshot(last, decimate, chip, mean)
+
+    def wait(self, seq, timeout=None):
+        '''Blocks until records newer than seq exist (or the poller stopped);
+        returns (records, next seq)'''
+        with self._cond:
+            self._cond.wait_for(lambda: self.ring.count > seq or self._stop.is_set() or not self.running, timeout)
+            return self.ring.since(seq)
+
+    def records(self, timeout=None):
+        '''Generator of the new records (one per chip and poll) as they arrive;
+        ends when the poller stops or nothing arrives within timeout'''
+        seq = self.ring.count
+        while True:
+            recs, seq = self.wait(seq, timeout)
+            if not len(recs):
+                return
+            for rec in recs:
+                yield rec
+
+    async def arecords(self, timeout=None):
+        '''Async generator version of records()'''
+        loop = asyncio.get_running_loop()
+        seq = self.ring.count
+        while True:
+            recs, seq = await loop.run_in_executor(None, self.wait, seq, timeout)
+            if not len(recs):
+                return
+            for rec in recs:
+                yield rec
+
+    def __iter__(self):
+        return self.records()
+
+    def __aiter__(self):
+        return self.arecords()
@@ -11,10 +11,21 @@
 #-------------------------------------------------------------------------------
 
 
+import logging
+import os
+
+import numpy as np
+
+from Example2 import awmfregs
+from Example2.awmfpack import packValues
 from Example2.ni8452io import SPI
 
 # dll name is Ni845x.dll
 
+# Quiet by default: enable with logging.basicConfig(level=logging.DEBUG)
+# (DEBUG: every packet/word sent, INFO: session open/close, telemetry)
+log = logging.getLogger(__name__)
+
 # enumerate TXMODE, RXMODE, RX_11, SB
 TX_MODE = 1
 RX_MODE = 2
@@ -29,9 +40,85 @@ ELEMENT_3_b = 0b101
 ELEMENT_4_a = 0b110
 ELEMENT_4_b = 0b111
 
+ELEMENTS = range(ELEMENT_1_a, ELEMENT_4_b + 1)
+
 COMM_ATT_0dB = 0b00
 COMM_ATT_8dB = 0b01
 
+# Register addresses (awmfregs.REGISTER_MAP): packet bits 48-55, register data in bits 0-47
+REG_MODE = awmfregs.MODE.address
+REG_BW0 = awmfregs.BW0.address
+REG_BW1 = awmfregs.BW1.address
+REG_ADDR_SHIFT = 48
+REG_DATA_MASK = (1 << 48) - 1
+# Read request: packet (REG_READ << 48) | address, the register data is
+# shifted out during the NEXT frame
+REG_READ = 0x3D
+# Registers mirrored in AwmfCommander.shadow
+SHADOW_REGS = (REG_MODE, REG_BW0, REG_BW1)
+
+# Telemetry frame fields: (name, lsb, width), in decode_telemetry() return order
+TELEMETRY_FIELDS = tuple((f.name, f.lsb, f.width) for f in awmfregs.TELEMETRY.fields.values())
+TELEMETRY_DTYPE = np.dtype([(name, np.uint8) for name, lsb, width in TELEMETRY_FIELDS])
+TELEMETRY_CAL_DTYPE = np.dtype([(name, np.float64) for name, lsb, width in TELEMETRY_FIELDS])
+# AwmfCommander.verify() mismatch records
+VERIFY_DTYPE = np.dtype([('chip', np.int64), ('address', np.uint8),
+                         ('expected', np.uint64), ('actual', np.uint64)])
+# IC temperature code y=ax+b  =>  x=(b-y)/a
+TEMP_CAL_A = 0.31
+TEMP_CAL_B = 47.37
+
+# RX
+AWMF_0132_INIT = (
+    0x_0_00_00_00_01_02_04_00,
+    0x_0_00_00_00_00_02_04_00,
+    0x_0_01_00_00_00_00_00_00,
+    0x_0_02_00_00_00_00_00_00,
+    0x_0_03_00_00_00_00_00_00,
+    0x_0_04_00_00_00_00_00_00,
+    0x_0_05_00_29_4a_52_94_a5,
+    0x_0_06_00_00_00_00_01_e7,
+    0x_0_07_00_00_00_00_00_00,
+    0x_0_08_00_03_9b_ce_01_fe,
+    0x_0_09_00_00_06_01_b6_f6,
+    0x_0_0a_00_00_6d_b6_db_41,
+    0x_0_0b_00_00_01_20_01_0a,
+    0x_0_0c_00_00_00_09_00_01,
+    0x_0_0d_00_00_00_00_08_00,
+    0x_0_0e_00_00_00_00_00_00,
+    0x_0_0f_00_00_00_00_00_00,
+    0x_0_10_00_00_00_00_00_00,
+    0x_0_11_00_00_00_00_00_00,
+)
+
+# TX
+AWMF_0133_INIT = (
+    0x_0_00_00_00_01_02_04_00,
+    0x_0_00_00_00_00_02_04_00,
+    0x_0_01_00_00_00_00_00_00,
+    0x_0_02_00_00_00_00_00_00,
+    0x_0_03_00_00_00_00_00_00,
+    0x_0_04_00_00_00_00_00_00,
+    0x_0_05_04_31_8c_63_18_c6,
+    0x_0_06_00_00_00_00_01_60,
+    0x_0_07_00_00_00_00_00_00,
+    0x_0_08_00_03_bb_ff_ff_fe,
+    0x_0_09_00_00_06_01_b6_f6,
+    0x_0_0a_00_00_6d_b6_db_44,
+    0x_0_0b_00_00_00_00_00_02,
+    0x_0_0c_00_00_03_69_14_01,
+    0x_0_0d_00_00_00_00_08_00,
+    0x_0_0e_00_00_00_00_00_00,
+    0x_0_0f_00_00_00_00_00_00,
+    0x_0_10_00_00_00_00_00_00,
+    0x_0_11_00_00_00_00_00_00,
+)
+
+INIT_TABLES = {RX_MODE: AWMF_0132_INIT, TX_MODE: AWMF_0133_INIT}
+
+# Resource name of the adapter last opened by AwmfCommander.warm_start()
+RESOURCE_CACHE = os.path.join(os.path.expanduser('~'), '.awmf_resource')
+
 
 class SpiInitException(Exception):
     """Error from initializing SPI bus"""
@@ -53,22 +140,60 @@ class AwmfCommander:
     # SPi interface handle placeholder
     testSPI = 0
 
+    # Shadow register file {chip: {address: data}} of the last MODE/BW0/BW1
+    # values written to each chip
+    shadow = {}
+
+    # Chip select line of each chip {chip: CS line}; unmapped chips use CS=chip
+    csMap = {}
+
+    # Beam codebook (awmfcodebook.Codebook) and the chip of each codebook column
+    codebook = None
+    codebookChips = ()
+
+    @classmethod
+    def chip_cs(cls, chip):
+        """
+        Returns the SPI chip select line (0-7) of chip
+        """
+        return cls.csMap.get(chip, chip)
+
     @classmethod
-    def initSpi(cls):
+    def bind(cls, spi=0, name=None):
+        """
+        Returns an AwmfCommander subclass with its own SPI session, shadow
+        registers and CS map, e.g. one per NI-845x adapter:
+
+        Panel1 = AwmfCommander.bind()
+        Panel1.initSpi(resource=b'USB0::0x3923::0x7514::01A2B3C4::RAW')
+        """
+        if name is None:
+            name = cls.__name__ + "_bound"
+        return type(name, (cls,), {"testSPI": spi, "shadow": {}, "csMap": dict(cls.csMap),
+                                   "codebook": cls.codebook, "codebookChips": cls.codebookChips})
+
+    @classmethod
+    def initSpi(cls, resource=None, backend=None, spiClk=1000):
         """
         opens the connection to the SPI bus and sets the clock
+        resource: VISA resource name of the adapter (default: first found)
+        backend:  Ni845x library, see ni845xlib.loadLibrary()
+        spiClk:   SPI clock (kHz), e.g. ni8452tune.tuned_clock(setup, 10)
         """
         # open spi
-        print("Searching for SPI Interface")
+        log.info("Searching for SPI Interface")
 
-        cls.testSPI = SPI()
-        fRet = cls.testSPI.ioOpen()
+        cls.testSPI = SPI(backend)
+        if resource is None:
+            fRet = cls.testSPI.ioOpen()
+        else:
+            fRet = cls.testSPI.ioOpenByName(resource)
         # print('ioOpen():  \t{0}'.format(fRet))
         if fRet != 0:
             cls.testSPI.ioClose()
             raise SpiInitException(fRet, "ioOpen()")
         # set clock rate
-        fRet = cls.testSPI.ioSetConfig(spiClk=1000)
+        fRet = cls.testSPI.ioSetConfig(spiClk=spiClk)
         # print('ioSetConfig():\t{0}'.format(fRet))
         if fRet != 0:
             cls.testSPI.ioClose()
@@ -80,7 +205,7 @@ class AwmfCommander:
             cls.testSPI.ioClose()
             raise SpiInitException(fRet, "ioInit()")
 
-        print("SPI initialized successfully")
+        log.info("SPI initialized successfully")
 
     @classmethod
     def closeSPI(cls):
@@ -90,41 +215,38 @@ class AwmfCommander:
         r = cls.testSPI.ioSafe()
         r1 = cls.testSPI.ioClose()
         if (r == 0 and r1 == 0):
-            print("SPI closed successfully")
+            log.info("SPI closed successfully")
         else:
             raise SpiInitException(r1, "ioClose()")
 
     @classmethod
     def RF_EN(cls, mode ):
         if mode == RX_MODE:
-            print("Writing in RX_EN")
+            log.debug("Writing in RX_EN")
             fRet = cls.testSPI.ioWriteDIO(1)  # Set DIO RX_EN pin
         elif mode == TX_MODE:
-            print("Writing in TX_EN")
+            log.debug("Writing in TX_EN")
             fRet = cls.testSPI.ioWriteDIO(2)  # Set DIO TX_EN pin
-        print("Writing in RF_EN")
+        log.debug("Writing in RF_EN")
 
     @classmethod
-    def Anokiewave_write(cls, mode, input):
+    def __setMode(cls, mode):
         """
-         Writes  init register  signals on to the the spi bus.
+         Sets the RX_EN/TX_EN DIO lines for mode (INIT_MODE clears both,
+         None leaves them as they are).
         """
-
-        # determine message and pack it
-        unpackedData = []
         fRet = 0
+        if mode is None:
+            return
         if mode == INIT_MODE:
-            print("Writing in INIT_MODE")
+            log.debug("Writing in INIT_MODE")
             fRet = cls.testSPI.ioWriteDIO(0)  # Set DIO RX_EN pin
-            unpackedData = input
         elif mode == RX_MODE:
-            print("Writing in RX_MODE")
+            log.debug("Writing in RX_MODE")
             fRet = cls.testSPI.ioWriteDIO(1)  # Set DIO RX_EN pin
-            unpackedData = input
         elif mode == TX_MODE:
-            print("Writing in TX_MODE")
+            log.debug("Writing in TX_MODE")
             fRet = cls.testSPI.ioWriteDIO(2)
-            unpackedData = input
 
         if fRet != 0:
             try:
@@ -133,15 +255,25 @@ class AwmfCommander:
                 pass
             raise SpiInitException(fRet, "ioWriteDIO()")
 
+    @classmethod
+    def Anokiewave_write(cls, mode, input, chip=0):
+        """
+         Writes  init register  signals on to the the spi bus.
+         A single packet updates the shadow registers of chip.
+        """
+
+        # determine message and pack it
+        cls.__setMode(mode)
+        unpackedData = input
+
         wArr = cls.__packValues(unpackedData, in_width=60, packed_size=10)
 
-        counter = 0
-        for i in wArr:
-            counter = counter + 1
-            print('Packet N:', counter, 'Packed data:', bin(i))
+        if log.isEnabledFor(logging.DEBUG):
+            for counter, i in enumerate(wArr, 1):
+                log.debug('Packet N: %d Packed data: %s', counter, bin(i))
 
         # ioWriteSPI hits LDB pin automatically
-        rData, fRet = cls.testSPI.ioWriteSPI4(wArr, 10)  # send bits 8
+        rData, fRet = cls.testSPI.ioWriteSPI4(wArr, 10, cls.chip_cs(chip))  # send bits 8
 
         if fRet != 0:
             try:
@@ -150,8 +282,159 @@ class AwmfCommander:
                 pass
             raise SpiInitException(fRet, "ioWriteSPI4")
 
+        if len(input) == 1:
+            cls.__shadowStore(chip, input)
+
         return rData  # return data from device
 
+    @classmethod
+    def Anokiewave_write_batch(cls, mode, packets, chip=0):
+        """
+         Writes a list of 60 bit register packets in ONE SPI script run (one
+         CS frame per packet). Returns the read back words of each packet.
+        """
+        cls.__setMode(mode)
+
+        frames = cls.pack_frames(packets).tolist()
+
+        rFrames, fRet = cls.testSPI.ioWriteFrames(frames, 10, cs=cls.chip_cs(chip))
+
+        if fRet != 0:
+            try:
+                cls.closeSPI()
+            except:
+                pass
+            raise SpiInitException(fRet, "ioWriteFrames")
+
+        cls.__shadowStore(chip, packets)
+
+        return rFrames  # return data from device, per packet
+
+    @classmethod
+    def Anokiewave_write_fanout(cls, mode, chipPackets):
+        """
+         Writes packets to ICs on different chip select lines in ONE SPI script run.
+         :param chipPackets: list of (chip, packet); chip may be a tuple of chips to
+                             broadcast the same packet to all their CS lines at once
+         :return: {chip: [read back words of each packet sent to it]}
+        """
+        cls.__setMode(mode)
+
+        chips = [chip if isinstance(chip, tuple) else (chip,) for chip, packet in chipPackets]
+        frames = cls.pack_frames([packet for chip, packet in chipPackets]).tolist()
+        cs = [tuple(cls.chip_cs(chip) for chip in group) for group in chips]
+
+        rFrames, fRet = cls.testSPI.ioWriteFrames(frames, 10, cs=cs)
+
+        if fRet != 0:
+            try:
+                cls.closeSPI()
+            except:
+                pass
+            raise SpiInitException(fRet, "ioWriteFrames")
+
+        rData = {}
+        for group, (chip, packet), wordArr in zip(chips, chipPackets, rFrames):
+            for chip in group:
+                cls.__shadowStore(chip, [packet])
+                rData.setdefault(chip, []).append(wordArr)
+        return rData
+
+    @classmethod
+    def Anokiewave_write_chain(cls, mode, packets, chips=None, cs=0):
+        """
+         Writes one 60 bit packet to each IC of a daisy chain on line cs as a single
+         N x 60 bit shift sequence (one CS frame, one latch).
+         packets[i] goes to the i-th IC counted from MOSI (the last packet is
+         shifted out first and travels to the far end of the chain).
+         :param chips: shadow chip id of each packet (default: chain position 0..N-1)
+         :return: list of the 6 read back words of each IC, in packets order
+        """
+        cls.__setMode(mode)
+
+        nChips = len(packets)
+        wArr = cls.__packValues(packets, in_width=60, packed_size=10)
+
+        rData, fRet = cls.testSPI.ioWriteSPI4(wArr, 10, cs)
+
+        if fRet != 0:
+            try:
+                cls.closeSPI()
+            except:
+                pass
+            raise SpiInitException(fRet, "ioWriteSPI4")
+
+        if chips is None:
+            chips = range(nChips)
+        for chip, packet in zip(chips, packets):
+            cls.__shadowStore(chip, [packet])
+
+        # Words of the last packet are clocked first: split per IC
+        return [rData[6 * (nChips - 1 - i):6 * (nChips - i)] for i in range(nChips)]
+
+    @classmethod
+    def __shadowStore(cls, chip, packets):
+        """
+         Records written packets of the mirrored registers in the shadow of chip.
+        """
+        regs = cls.shadow.setdefault(chip, {})
+        for packet in packets:
+            address = (int(packet) >> REG_ADDR_SHIFT) & 0xff
+            if address in SHADOW_REGS:
+                regs[address] = int(packet) & REG_DATA_MASK
+
+    @classmethod
+    def shadow_invalidate(cls, chip=None, addresses=SHADOW_REGS):
+        """
+         Forgets shadow values (all chips if chip is None), forcing the next write.
+        """
+        chips = list(cls.shadow) if chip is None else [chip]
+        for ch in chips:
+            for address in addresses:
+                cls.shadow.get(ch, {}).pop(address, None)
+
+    @classmethod
+    def write_register(cls, address, data, chip=0, mode=RX_MODE, force=False):
+        """
+         Writes 48 bit data to register address of chip unless the shadow
+         already holds that value (force=True always writes).
+         :return: telemetry, None if the SPI transaction was skipped
+        """
+        data &= REG_DATA_MASK
+        if not force and cls.shadow.get(chip, {}).get(address) == data:
+            return None
+        packet = (address << REG_ADDR_SHIFT) | data
+        log.debug('Packet send: %s', hex(packet))
+        return cls.Anokiewave_write(mode, [packet], chip)
+
+    @classmethod
+    def update_register(cls, address, mask, value, chip=0, mode=RX_MODE, force=False):
+        """
+         Merges value into the mask bits of the shadow of register address
+         (unknown shadow = 0) and writes the result if it changed.
+         :return: telemetry, None if the SPI transaction was skipped
+        """
+        data = (cls.shadow.get(chip, {}).get(address, 0) & ~mask) | (value & mask)
+        return cls.write_register(address, data, chip, mode, force)
+
+    @classmethod
+    def update_field(cls, register, field, value, index=None, chip=0, mode=RX_MODE, force=False):
+        """
+         Sets one field of a register through the compiled shift/mask tables
+         of awmfregs: element index (ELEMENT_*) of an array field, or all its
+         elements when index is None (value: list of codes)
+         :param register: awmfregs.Register (awmfregs.BW0, ...)
+         :return: telemetry, None if the register already held this value
+        """
+        f = register.fields[field]
+        if index is None:
+            mask = f.inPlace
+            value = register.encode(False, **{field: value}) if f.isArray else value << f.lsb
+        else:
+            mask = f.masks[index]
+            value <<= f.shifts[index]
+        return cls.update_register(register.address, mask, value, chip, mode, force)
+
     @staticmethod
     def decode_telemetry(message):
 
@@ -164,117 +447,107 @@ class AwmfCommander:
         out = 0
         for bit in message:
             out = (out << 10) | bit
-        print(bin(out))
-        message=out
-
-        mask_tempe_ic = 0b_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0011_1111
-        mask_power_1b = 0b_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0111_1100_0000
-        mask_power_1a = 0b_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_1111_1000_0000_0000
-        mask_power_2b = 0b_0000_0000_0000_0000_0000_0000_0000_0000_0000_0001_1111_0000_0000_0000_0000
-        mask_power_2a = 0b_0000_0000_0000_0000_0000_0000_0000_0000_0011_1110_0000_0000_0000_0000_0000
-        mask_power_3b = 0b_0000_0000_0000_0000_0000_0000_0000_0111_1100_0000_0000_0000_0000_0000_0000
-        mask_power_3a = 0b_0000_0000_0000_0000_0000_0000_1111_1000_0000_0000_0000_0000_0000_0000_0000
-        mask_power_4b = 0b_0000_0000_0000_0000_0001_1111_0000_0000_0000_0000_0000_0000_0000_0000_0000
-        mask_power_4a = 0b_0000_0000_0000_0011_1110_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000
-
-        # message=int(message)
-        #message = int.from_bytes(message, "big")
-        tempe_ic = (message & mask_tempe_ic)
-        power_1b = (message & mask_power_1b) >> 6
-        power_1a = (message & mask_power_1a) >> (6 + 5)
-        power_2b = (message & mask_power_2b) >> (6 + 5 + 5)
-        power_2a = (message & mask_power_2a) >> (6 + 5 + 5 + 5)
-        power_3b = (message & mask_power_3b) >> (6 + 5 + 5 + 5 + 5)
-        power_3a = (message & mask_power_3a) >> (6 + 5 + 5 + 5 + 5 + 5)
-        power_4b = (message & mask_power_4b) >> (6 + 5 + 5 + 5 + 5 + 5 + 5)
-        power_4a = (message & mask_power_4a) >> (6 + 5 + 5 + 5 + 5 + 5 + 5 + 5)
+        log.debug('Telemetry: %s', bin(out))
+
+        fields = awmfregs.TELEMETRY.decode(out)
         # y=ax+b =>>>> x=(b-y)/a
         # a=0.31 b=47.37
         #tempe_ic = (47.37 - tempe_ic) / 0.31
-        print('TX Telemetry Data:')
-        print('Temp IC:', tempe_ic)
-        print('Power 1A:', power_1a)
-        print('Power 1B:', power_1b)
-        print('Power 2A:', power_2a)
-        print('Power 2B:', power_2b)
-        print('Power 3A:', power_3a)
-        print('Power 3B:', power_3b)
-        print('Power 4A:', power_4a)
-        print('Power 4B:', power_4b)
-        return tempe_ic, power_1a, power_1b, power_2a, power_2b, power_3a, power_3b, power_4a, power_4b
+        log.info('TX Telemetry Data: Temp IC: %d Power 1A: %d 1B: %d 2A: %d 2B: %d 3A: %d 3B: %d 4A: %d 4B: %d',
+                 *fields.values())
+        return tuple(fields.values())
 
     @staticmethod
-    def set_channel_on_off(RE1a_en=0, RE1b_en=0, RE2a_en=0, RE2b_en=0, RE3a_en=0, RE3b_en=0, RE4a_en=0,
-                           RE4b_en=0):
+    def decode_telemetry_batch(messages, calibrated=False, power_cal=None):
+        """
+                Decodes many telemetry read backs at once (no printing)
+                :param messages: (N, words) array_like of 10 bit read back words,
+                                 MSB word first (as decode_telemetry), words <= 6
+                :param calibrated: convert temp to deg C ((TEMP_CAL_B - code) / TEMP_CAL_A)
+                                   and return float fields
+                :param power_cal: optional (gain, offset) applied to the power codes
+                                  (code * gain + offset) when calibrated
+                :return: structured array of N records (TELEMETRY_DTYPE or TELEMETRY_CAL_DTYPE)
+        """
+        words = np.atleast_2d(np.asarray(messages, dtype=np.uint64))
+        out = np.zeros(words.shape[0], dtype=np.uint64)
+        for col in range(words.shape[1]):
+            out = (out << np.uint64(10)) | words[:, col]
+
+        if calibrated:
+            result = np.empty(words.shape[0], dtype=TELEMETRY_CAL_DTYPE)
+        else:
+            result = np.empty(words.shape[0], dtype=TELEMETRY_DTYPE)
+        for name, value in awmfregs.TELEMETRY.decode(out).items():
+            result[name] = value
+
+        if calibrated:
+            result['temp'] = (TEMP_CAL_B - result['temp']) / TEMP_CAL_A
+            if power_cal is not None:
+                gain, offset = power_cal
+                for name, lsb, width in TELEMETRY_FIELDS[1:]:
+                    result[name] = result[name] * gain + offset
+        return result
+
+    @classmethod
+    def read_telemetry(cls, chips=(0,), mode=None):
+        """
+                Reads the telemetry of several chips in ONE SPI script run: each chip
+                gets its shadowed BW0 value written back (no state change) and the
+                words clocked out of it are decoded
+                :param chips: chip ids, their BW0 must have been written before
+                :param mode: RX_MODE/TX_MODE to set the RX_EN/TX_EN lines first;
+                             None keeps the current DIO state (e.g. during TX)
+                :return: structured array (TELEMETRY_DTYPE), one record per chip
+        """
+        chipPackets = []
+        for chip in chips:
+            data = cls.shadow.get(chip, {}).get(REG_BW0)
+            if data is None:
+                raise ValueError("BW0 of chip %s unknown: write it before reading telemetry" % chip)
+            chipPackets.append((chip, (REG_BW0 << REG_ADDR_SHIFT) | data))
+
+        rData = cls.Anokiewave_write_fanout(mode, chipPackets)
+        return cls.decode_telemetry_batch([rData[chip][0] for chip in chips])
+
+    @classmethod
+    def set_channel_on_off(cls, RE1a_en=0, RE1b_en=0, RE2a_en=0, RE2b_en=0, RE3a_en=0, RE3b_en=0, RE4a_en=0,
+                           RE4b_en=0, chip=0):
         """
                         Set the channels of the beam former OFF or ON
                          Write at register BW0 (0b_0000_0000_0000_0001) at positions 34-41 (8 bits)
                         :param channel: Select any of the defined common channel values (ELEMENT_*)
                         :param on_off_ind: 0 for OFF, 1 for ON
+                        :return: telemetry, None if BW0 already held this value
         """
-        # Register BW0
-        BW0b = 0b_0000_0000_0001_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000
-        # Activation Mask
-        on_off_bin = 0b11111111
-        # amp_number: 0 to 1
-        on_off_bin = on_off_bin ^ RE1a_en
-        on_off_bin = on_off_bin ^ RE1b_en << 1
-        on_off_bin = on_off_bin ^ RE2a_en << 2  # RE1 is connected with RF_2A
-        on_off_bin = on_off_bin ^ RE2b_en << 3
-        on_off_bin = on_off_bin ^ RE3a_en << 4  # RE1 is connected with RF_2A
-        on_off_bin = on_off_bin ^ RE3b_en << 5
-        on_off_bin = on_off_bin ^ RE4a_en << 6
-        on_off_bin = on_off_bin ^ RE4b_en << 7
-
-        # Shift the Mask 34 bits
-        packet = BW0b | on_off_bin << 34
-        print('**************************')
-        print('BB Activate Elements')
-        print('Bin Packet send:', bin(packet))
-        print('Hex Packet send:', hex(packet))
-        telemetry = AwmfCommander.Anokiewave_write(RX_MODE, [packet])
-        print('Return:', telemetry)
-        print('**************************')
+        # Disable bits are the inverted enables (RE1 is connected with RF_2A)
+        enables = (RE1a_en, RE1b_en, RE2a_en, RE2b_en, RE3a_en, RE3b_en, RE4a_en, RE4b_en)
+        if any(en not in (0, 1) for en in enables):
+            raise ValueError("Incorrect enable value")
+        log.debug('BB Activate Elements')
+        telemetry = cls.update_field(awmfregs.BW0, 'disable', [1 - en for en in enables], chip=chip)
+        log.debug('Return: %s', telemetry)
         return telemetry
 
-    @staticmethod
-    def set_channel_attenuation(channel, amp_number):
+    @classmethod
+    def set_channel_attenuation(cls, channel, amp_number, chip=0):
         """
                         Set Arm Attenuation attenuation  of the BF = 0.5dB * rf_gain
                         :param amp_number: int from 0 to 15
                          Write at register BW0 (0b_0000_0000_0000_0001) at positions 0-31 (4 bits)
                         :param channel: Select any of the defined common channel values (ELEMENT_*)
+                        :return: telemetry, None if BW0 already held this value
         """
-        # Register BW0
-        BW0b = 0b_0000_0000_0001_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000
         # amp_number: 0 to 15
-        if 15 >= amp_number >= 0:
-            if channel == ELEMENT_1_a:
-                packet = amp_number | BW0b
-            elif channel == ELEMENT_1_b:
-                packet = (amp_number << 4) | BW0b
-            elif channel == ELEMENT_2_a:
-                packet = (amp_number << 8) | BW0b
-            elif channel == ELEMENT_2_b:
-                packet = (amp_number << 12) | BW0b
-            elif channel == ELEMENT_3_a:
-                packet = (amp_number << 16) | BW0b
-            elif channel == ELEMENT_3_b:
-                packet = (amp_number << 20) | BW0b
-            elif channel == ELEMENT_4_a:
-                packet = (amp_number << 24) | BW0b
-            elif channel == ELEMENT_4_b:
-                packet = (amp_number << 28) | BW0b
-            print('**************************')
-            print('Set Channel Attenuation')
-            print('Bin Packet send:', bin(packet))
-            print('Hex Packet send:', hex(packet))
-            telemetry = AwmfCommander.Anokiewave_write(RX_MODE, [packet])
-            print('Return:', telemetry)
-            print('**************************')
-            return telemetry
-        else:
+        if not 15 >= amp_number >= 0:
             raise ValueError("Incorrect Amp Number value")
+        if channel not in ELEMENTS:
+            raise ValueError("Incorrect channel value")
+        log.debug('Set Channel Attenuation')
+        f = awmfregs.BW0.fields['atten']
+        telemetry = cls.update_register(REG_BW0, f.masks[channel], amp_number << f.shifts[channel], chip)
+        log.debug('Return: %s', telemetry)
+        return telemetry
 
     @staticmethod
     def __packValues(vals, in_width=8, packed_size=10, big_endian=True):
@@ -284,36 +557,21 @@ class AwmfCommander:
         packed_size bits long
 
         assumes each element in vals is *in_width* bits wide
+        (list front end of awmfpack.packValues)
         """
-        byteArray = []
-        cB = 0
-        cBi = 0
-
-        for val in vals:
-            # for each meaningful bit in the current value
-            for i in range(in_width):
-                # set the next bit in the current working byte
-                # whether or not the next bit in val is set
-                #      |                   index of cB to set
-                cB |= ((val & (1 << i)) >> i) << cBi
-                cBi += 1
-
-                if (cBi >= packed_size):
-                    byteArray.append(cB)
-                    cBi = 0
-                    cB = 0
-
-        # append the remaining bits if there are any
-        if (cBi != 0):
-            byteArray.append(cB)
-
-        if big_endian:
-            byteArray.reverse()
-
-        return byteArray
+        return packValues(vals, in_width, packed_size, big_endian).tolist()
 
     @staticmethod
-    def set_comm_attenuation(att_value):
+    def pack_frames(packets):
+        """
+        Packs an array of 60 bit register packets of any shape (e.g. beams x chips)
+        into 10 bit SPI words in one call.
+        :return: uint64 array of shape packets.shape + (6,), words in send order
+        """
+        return packValues(np.asarray(packets, dtype=np.uint64)[..., None], in_width=60, packed_size=10)
+
+    @classmethod
+    def set_comm_attenuation(cls, att_value, chip=0):
         """
                         Set Common Arm Attenuation attenuation  of the BF = 8dB * com_att
                         00 = 0dB
@@ -321,149 +579,184 @@ class AwmfCommander:
                         Write at register BW0 (0b_0000_0000_0000_0001) at positions 32-33 (2 bits)
                         :param bb_id: Select any of the defined common beamformer ID values (BEAMFORMER_*)
                         :param att_value: Select any of the defined common att values (COMM_ATT_*)
+                        :return: telemetry, None if BW0 already held this value
         """
 
         if not (att_value == 0b00 or att_value == 0b01):
             raise ValueError("Incorrect common attenuation value")
-        BW0b = 0b_0000_0000_0000_0001_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000
         # Register Name: BW0
-        packet = BW0b | att_value << 32
-        print('**************************')
-        print('Sett Common Attenuation')
-        print('Bin Packet send:', bin(packet))
-        print('Hex Packet send:', hex(packet))
-        telemetry = AwmfCommander.Anokiewave_write(RX_MODE, [packet])
-        print('Return:', telemetry)
-        print('**************************')
+        log.debug('Set Common Attenuation')
+        telemetry = cls.update_field(awmfregs.BW0, 'comm_att', att_value, chip=chip)
+        log.debug('Return: %s', telemetry)
         return telemetry
 
-    @staticmethod
-    def set_channel_phase(channel, phase_number):
+    @classmethod
+    def set_channel_phase(cls, channel, phase_number, chip=0):
         """
                 Set Arm Phase of the PH = 5.625 deg * phase
                 :param phase_number: int from 0 to 63
                 Write at register BW1 (0b_0000_0000_0000_0010) at positions 0-47 (6 bits)
                 :param channel: Select any of the defined common channel values (ELEMENT_*)
+                :return: telemetry, None if BW1 already held this value
         """
-        # Register BW1
-        BW1b = 0b_0000_0000_0000_0010_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000
-        # amp_number: 0 to 15
-        if 63 >= phase_number >= 0:
-            if channel == ELEMENT_1_a:
-                packet = phase_number | BW1b
-            elif channel == ELEMENT_1_b:
-                packet = (phase_number << 6) | BW1b
-            elif channel == ELEMENT_2_a:
-                packet = (phase_number << 12) | BW1b
-            elif channel == ELEMENT_2_b:
-                packet = (phase_number << 18) | BW1b
-            elif channel == ELEMENT_3_a:
-                packet = (phase_number << 24) | BW1b
-            elif channel == ELEMENT_3_b:
-                packet = (phase_number << 30) | BW1b
-            elif channel == ELEMENT_4_a:
-                packet = (phase_number << 36) | BW1b
-            elif channel == ELEMENT_4_b:
-                packet = (phase_number << 42) | BW1b
-            print('**************************')
-            print('Set Channel Phase')
-            print('Bin Packet send:', bin(packet))
-            print('Hex Packet send:', hex(packet))
-            telemetry = AwmfCommander.Anokiewave_write(RX_MODE, [packet])
-            print('Return:', telemetry)
-            print('**************************')
-            return telemetry
+        # phase_number: 0 to 63
+        if not 63 >= phase_number >= 0:
+            raise ValueError("Incorrect Phase Number value")
+        if channel not in ELEMENTS:
+            raise ValueError("Incorrect channel value")
+        log.debug('Set Channel Phase')
+        f = awmfregs.BW1.fields['phase']
+        telemetry = cls.update_register(REG_BW1, f.masks[channel], phase_number << f.shifts[channel], chip)
+        log.debug('Return: %s', telemetry)
+        return telemetry
 
-    @staticmethod
-    def init_BF(MODE):
-        print('**************************')
-        print('Set Channel Phase')
-        print('**************************')
+    @classmethod
+    def init_BF(cls, MODE, chip=0):
+        """
+                Writes the AWMF-0132 (RX_MODE) or AWMF-0133 (TX_MODE) init register
+                table in a single SPI transaction
+        """
+        log.debug('Init Beamformer')
         if MODE == RX_MODE:
-            AWMF_0132_INIT0 = 0x_0_00_00_00_01_02_04_00
-            AWMF_0132_INIT1 = 0x_0_00_00_00_00_02_04_00
-            AWMF_0132_INIT2 = 0x_0_01_00_00_00_00_00_00
-            AWMF_0132_INIT3 = 0x_0_02_00_00_00_00_00_00
-            AWMF_0132_INIT4 = 0x_0_03_00_00_00_00_00_00
-            AWMF_0132_INIT5 = 0x_0_04_00_00_00_00_00_00
-            AWMF_0132_INIT6 = 0x_0_05_00_29_4a_52_94_a5
-            AWMF_0132_INIT7 = 0x_0_06_00_00_00_00_01_e7
-            AWMF_0132_INIT8 = 0x_0_07_00_00_00_00_00_00
-            AWMF_0132_INIT9 = 0x_0_08_00_03_9b_ce_01_fe
-            AWMF_0132_INIT10 = 0x_0_09_00_00_06_01_b6_f6
-            AWMF_0132_INIT11 = 0x_0_0a_00_00_6d_b6_db_41
-            AWMF_0132_INIT12 = 0x_0_0b_00_00_01_20_01_0a
-            AWMF_0132_INIT13 = 0x_0_0c_00_00_00_09_00_01
-            AWMF_0132_INIT14 = 0x_0_0d_00_00_00_00_08_00
-            AWMF_0132_INIT15 = 0x_0_0e_00_00_00_00_00_00
-            AWMF_0132_INIT16 = 0x_0_0f_00_00_00_00_00_00
-            AWMF_0132_INIT17 = 0x_0_10_00_00_00_00_00_00
-            AWMF_0132_INIT18 = 0x_0_11_00_00_00_00_00_00
-
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT0])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT1])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT2])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT3])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT4])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT5])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT6])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT7])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT8])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT9])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT10])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT11])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT12])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT13])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT14])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT15])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT16])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT17])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0132_INIT18])
-
+            return cls.Anokiewave_write_batch(INIT_MODE, AWMF_0132_INIT, chip)
         if MODE == TX_MODE:
-            # TX
-            AWMF_0133_INIT0 = 0x_0_00_00_00_01_02_04_00
-            AWMF_0133_INIT1 = 0x_0_00_00_00_00_02_04_00
-            AWMF_0133_INIT2 = 0x_0_01_00_00_00_00_00_00
-            AWMF_0133_INIT3 = 0x_0_02_00_00_00_00_00_00
-            AWMF_0133_INIT4 = 0x_0_03_00_00_00_00_00_00
-            AWMF_0133_INIT5 = 0x_0_04_00_00_00_00_00_00
-            AWMF_0133_INIT6 = 0x_0_05_04_31_8c_63_18_c6
-            AWMF_0133_INIT7 = 0x_0_06_00_00_00_00_01_60
-            AWMF_0133_INIT8 = 0x_0_07_00_00_00_00_00_00
-            AWMF_0133_INIT9 = 0x_0_08_00_03_bb_ff_ff_fe
-            AWMF_0133_INIT10 = 0x_0_09_00_00_06_01_b6_f6
-            AWMF_0133_INIT11 = 0x_0_0a_00_00_6d_b6_db_44
-            AWMF_0133_INIT12 = 0x_0_0b_00_00_00_00_00_02
-            AWMF_0133_INIT13 = 0x_0_0c_00_00_03_69_14_01
-            AWMF_0133_INIT14 = 0x_0_0d_00_00_00_00_08_00
-            AWMF_0133_INIT15 = 0x_0_0e_00_00_00_00_00_00
-            AWMF_0133_INIT16 = 0x_0_0f_00_00_00_00_00_00
-            AWMF_0133_INIT17 = 0x_0_10_00_00_00_00_00_00
-            AWMF_0133_INIT18 = 0x_0_11_00_00_00_00_00_00
-
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT0])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT1])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT2])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT3])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT4])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT5])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT6])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT7])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT8])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT9])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT10])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT11])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT12])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT13])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT14])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT15])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT16])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT17])
-            AwmfCommander.Anokiewave_write(INIT_MODE, [AWMF_0133_INIT18])
+            return cls.Anokiewave_write_batch(INIT_MODE, AWMF_0133_INIT, chip)
 
     @staticmethod
-    def version_test():
+    def init_state(MODE):
+        """
+                Register state left by init_BF(MODE): {address: data}, in table order
+        """
+        state = {}
+        for packet in INIT_TABLES[MODE]:
+            state[(packet >> REG_ADDR_SHIFT) & 0xff] = packet & REG_DATA_MASK
+        return state
+
+    @classmethod
+    def read_registers(cls, addresses, chip=0, mode=None):
+        """
+                Reads registers of chip in ONE SPI script run (see read_registers_bulk)
+                :param mode: DIO mode to set first (None: leave RX_EN/TX_EN as they are)
+                :return: {address: 48 bit data}
+        """
+        addresses = list(addresses)
+        values = cls.read_registers_bulk(addresses, [chip], mode)
+        return dict(zip(addresses, values[0].tolist()))
+
+    @classmethod
+    def read_registers_bulk(cls, addresses, chips=(0,), mode=None):
+        """
+                Reads the same registers of several chips in ONE SPI script run: one
+                read request frame per chip and address, each reply is shifted out
+                by the chip's following frame (its last request is sent twice to
+                clock out the last reply). Chips must be on separate CS lines.
+                :param mode: DIO mode to set first (None: leave RX_EN/TX_EN as they are)
+                :return: (nChips, nAddresses) uint64 array of register data
+        """
+        addresses = list(addresses)
+        chips = list(chips)
+        values = np.zeros((len(chips), len(addresses)), dtype=np.uint64)
+        if not addresses or not chips:
+            return values
+
+        requests = [(REG_READ << REG_ADDR_SHIFT) | address for address in addresses]
+        requests.append(requests[-1])
+        rData = cls.Anokiewave_write_fanout(mode, [(chip, packet) for chip in chips for packet in requests])
+
+        for row, chip in enumerate(chips):
+            words = np.asarray(rData[chip][1:], dtype=np.uint64)
+            data = np.zeros(len(addresses), dtype=np.uint64)
+            for col in range(words.shape[1]):
+                data = (data << np.uint64(10)) | words[:, col]
+            values[row] = data & np.uint64(REG_DATA_MASK)
+            cls.__shadowStore(chip, [(address << REG_ADDR_SHIFT) | data
+                                     for address, data in zip(addresses, values[row].tolist())])
+        return values
+
+    @classmethod
+    def verify(cls, chips=(0,), expected=None, mode=None):
+        """
+                Reads back the registers of chips in one SPI script run and compares
+                them with the intended state
+                :param expected: None: each chip's shadow registers
+                                 {address: data}: the same state for every chip
+                                 {chip: {address: data}}: per chip state
+                :return: structured array (VERIFY_DTYPE) of the mismatching registers,
+                         empty if every register matches
+        """
+        chips = list(chips)
+        if expected is None:
+            states = [dict(cls.shadow.get(chip, {})) for chip in chips]
+        elif all(chip in expected and isinstance(expected[chip], dict) for chip in chips):
+            states = [expected[chip] for chip in chips]
+        else:
+            states = [expected] * len(chips)
+
+        addresses = sorted(set(address for state in states for address in state))
+        want = np.zeros((len(chips), len(addresses)), dtype=np.uint64)
+        known = np.zeros(want.shape, dtype=bool)
+        for row, state in enumerate(states):
+            for col, address in enumerate(addresses):
+                if address in state:
+                    want[row, col] = state[address] & REG_DATA_MASK
+                    known[row, col] = True
+
+        actual = cls.read_registers_bulk(addresses, chips, mode)
+
+        rows, cols = np.nonzero(known & (actual != want))
+        diff = np.empty(len(rows), dtype=VERIFY_DTYPE)
+        diff['chip'] = np.asarray(chips, dtype=np.int64)[rows]
+        diff['address'] = np.asarray(addresses, dtype=np.uint8)[cols]
+        diff['expected'] = want[rows, cols]
+        diff['actual'] = actual[rows, cols]
+        if len(diff):
+            log.info('Verify: %d register(s) differ', len(diff))
+        return diff
+
+    @classmethod
+    def warm_start(cls, MODE, chip=0, resource=None, backend=None, cacheFile=RESOURCE_CACHE):
+        """
+                initSpi() + init_BF() for a process restarting against a configured chip:
+                opens the cached adapter resource (falls back to discovery), reads
+                the init registers back and writes only those that differ.
+                A MODE register mismatch runs the full init_BF() (with reset).
+                :param resource: adapter resource name (default: the one in cacheFile)
+                :return: list of the register addresses written ([] = already initialised)
+        """
+        if resource is None and cacheFile and os.path.exists(cacheFile):
+            with open(cacheFile, 'rb') as f:
+                resource = f.read().strip() or None
+        try:
+            cls.initSpi(resource, backend)
+        except SpiInitException:
+            if resource is None:
+                raise
+            log.info("Cached resource %s not available, searching", resource)
+            cls.initSpi(None, backend)
+
+        if cacheFile:
+            try:
+                visaAddr = cls.testSPI.visaAddr
+                with open(cacheFile, 'wb') as f:
+                    f.write(visaAddr if isinstance(visaAddr, bytes) else visaAddr.encode())
+            except OSError as e:
+                log.warning("Can not write %s: %s", cacheFile, e)
+
+        expected = cls.init_state(MODE)
+        current = cls.read_registers(expected, chip)
+        if current.get(REG_MODE) != expected[REG_MODE]:
+            cls.init_BF(MODE, chip)
+            return sorted(expected)
+
+        packets = [(address << REG_ADDR_SHIFT) | data for address, data in expected.items()
+                   if current.get(address) != data]
+        if packets:
+            cls.Anokiewave_write_batch(INIT_MODE, packets, chip)
+        log.info("Warm start: %d of %d registers rewritten", len(packets), len(expected))
+        return [packet >> REG_ADDR_SHIFT for packet in packets]
+
+    @classmethod
+    def version_test(cls, chip=0):
         """
                         Set the two channels of the beam former OFF or ON
                         :param RE2_on_off: Radiated Element 1 1=ON, 0=OFF
@@ -472,82 +765,181 @@ class AwmfCommander:
 
         # change the mode to read the version of the IC
         packet = 0x_0_00_00_00_00_03_c4_00
-        telemetry = AwmfCommander.Anokiewave_write(RX_MODE, [packet])
+        telemetry = cls.Anokiewave_write(RX_MODE, [packet], chip)
 
         packet = 0x_0_3D_00_00_00_00_00_3E
-        print('**************************')
-        print('Bin Packet send:', bin(packet))
-        print('Hex Packet send:', hex(packet))
-        version = AwmfCommander.Anokiewave_write(RX_MODE, [packet])
-        version = AwmfCommander.Anokiewave_write(RX_MODE, [packet])
-        print('Return:', version)
+        log.debug('Packet send: %s', hex(packet))
+        version = cls.Anokiewave_write(RX_MODE, [packet], chip)
+        version = cls.Anokiewave_write(RX_MODE, [packet], chip)
+        log.debug('Return: %s', version)
         return version
 
     @staticmethod
-    def set_channel_all_on():
+    def beam_bw1(phases):
         """
-                        Set all the channels of the beamformer OFF
-                        Write at register BW0 (0b_0000_0000_0000_0001) at position 34-41 (8 bits)
+                Packs 8 phase codes (0-63, ELEMENT_* order) into BW1 data bits 0-47
+                :param phases: array_like (..., 8); leading axes give an array of values
+                :return: int, or uint64 array for batched input
         """
-        # Register BW0
-        BW0b = 0b_0000_0000_0000_0001_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000
-        on_off_bin = 0b00000000
-        packet = BW0b | on_off_bin << 34
-        print('Activate All Elements')
-        print('Bin Packet send:', bin(packet))
-        print('Hex Packet send:', hex(packet))
-        telemetry = AwmfCommander.Anokiewave_write(RX_MODE, [packet])
-        print('Return:', telemetry)
-        return telemetry
+        phases = np.asarray(phases)
+        if phases.shape[-1:] != (8,):
+            raise ValueError("Expected 8 phase values")
+        if np.any((phases < 0) | (phases > 63)):
+            raise ValueError("Incorrect Phase Number value")
+        return awmfregs.BW1.encode(False, phase=phases)
 
     @staticmethod
-    def reset_beamformer():
-        # Register BW0
-        MODEb = 0b_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000
-        reset_bin = 0b1
-        packet = MODEb | reset_bin << 24
-        print('Reset_Beamformer')
-        print('Bin Packet send:', bin(packet))
-        print('Hex Packet send:', hex(packet))
-        AwmfCommander.Anokiewave_write(RX_MODE, [packet])
-        reset_bin = 0b0
-        packet = MODEb | reset_bin << 24
-        telemetry = AwmfCommander.Anokiewave_write(RX_MODE, [packet])
+    def beam_bw0(atten, enables, comm_att=COMM_ATT_0dB):
+        """
+                Packs 8 attenuation codes (0-15, bits 0-31), the common attenuation
+                (bits 32-33) and 8 enables (1=ON, stored inverted in bits 34-41)
+                into BW0 data
+                :param atten: array_like (..., 8)
+                :param enables: array_like (..., 8) of 0/1
+                :return: int, or uint64 array for batched input
+        """
+        atten = np.asarray(atten)
+        enables = np.asarray(enables)
+        if atten.shape[-1:] != (8,) or enables.shape[-1:] != (8,):
+            raise ValueError("Expected 8 attenuation and 8 enable values")
+        if np.any((atten < 0) | (atten > 15)):
+            raise ValueError("Incorrect Amp Number value")
+        if np.any((enables != 0) & (enables != 1)):
+            raise ValueError("Incorrect enable value")
+        comm_att = np.asarray(comm_att)
+        if np.any((comm_att != COMM_ATT_0dB) & (comm_att != COMM_ATT_8dB)):
+            raise ValueError("Incorrect common attenuation value")
+        return awmfregs.BW0.encode(False, atten=atten, comm_att=comm_att, disable=1 - enables)
 
+    @classmethod
+    def set_beam(cls, phases=None, atten=None, enables=None, comm_att=None, chip=0, mode=RX_MODE):
+        """
+                Sets all 8 element phases (BW1) and attenuations/enables/common
+                attenuation (BW0) of chip in at most one SPI transaction of two frames.
+                Arguments left as None keep their shadow value; registers whose
+                value does not change are not sent.
+                :param phases: 8 phase codes 0-63 (list or NumPy array, ELEMENT_* order)
+                :param atten: 8 attenuation codes 0-15
+                :param enables: 8 enables, 1=ON 0=OFF
+                :param comm_att: COMM_ATT_0dB or COMM_ATT_8dB
+                :return: list of read back words per frame sent ([] if nothing changed)
+        """
+        regs = cls.shadow.get(chip, {})
+        packets = []
+
+        if phases is not None:
+            bw1 = cls.beam_bw1(phases)
+            if regs.get(REG_BW1) != bw1:
+                packets.append((REG_BW1 << REG_ADDR_SHIFT) | bw1)
+
+        if atten is not None or enables is not None or comm_att is not None:
+            old = awmfregs.BW0.decode(regs.get(REG_BW0, 0))
+            if atten is None:
+                atten = old['atten']
+            if enables is None:
+                enables = [1 - d for d in old['disable']]
+            if comm_att is None:
+                comm_att = old['comm_att']
+            bw0 = cls.beam_bw0(atten, enables, comm_att)
+            if regs.get(REG_BW0) != bw0:
+                packets.append((REG_BW0 << REG_ADDR_SHIFT) | bw0)
+
+        if not packets:
+            return []
+        if len(packets) == 1:
+            return [cls.Anokiewave_write(mode, packets, chip)]
+        return cls.Anokiewave_write_batch(mode, packets, chip)
 
-    @staticmethod
-    def rf_en_beamformer():
-        # Register BW0
-        MODEb = 0b_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000
-        rf_en_bin = 0b1
-        packet = MODEb | rf_en_bin << 23
-        print('**************************')
-        print('RF enable_Beamformer')
-        print('Bin Packet send:', bin(packet))
-        print('Hex Packet send:', hex(packet))
-        telemetry = AwmfCommander.Anokiewave_write(RX_MODE, [packet])
+    @classmethod
+    def load_codebook(cls, codebook, chips=None):
+        """
+                Selects the beam codebook used by set_beam_index()
+                :param codebook: awmfcodebook.Codebook / MappedCodebook, or the path
+                                 of a codebook file (memory-mapped, read lazily)
+                :param chips: chip id of each codebook column (default 0..nChips-1)
+        """
+        if isinstance(codebook, str):
+            from Example2.awmfcodebook import open_codebook
+            codebook = open_codebook(codebook)
+        nChips = codebook.nChips
+        if chips is None:
+            chips = range(nChips)
+        chips = tuple(chips)
+        if len(chips) != nChips:
+            raise ValueError("Expected %d chip ids" % nChips)
+        cls.codebook = codebook
+        cls.codebookChips = chips
 
-    @staticmethod
-    def set_channel_all_off():
+    @classmethod
+    def set_beam_index(cls, index, mode=RX_MODE):
+        """
+                Switches every chip of the loaded codebook to beam index: the BW1/BW0
+                registers that differ from the shadow are sent to all chips in ONE
+                SPI script run (see Anokiewave_write_fanout)
+                :return: {chip: [read back words of each frame sent]} ({} if nothing changed)
+        """
+        cb = cls.codebook
+        if cb is None:
+            raise ValueError("No codebook loaded")
+
+        chipPackets = []
+        for chip, packets in zip(cls.codebookChips, cb.packets(index).tolist()):
+            regs = cls.shadow.get(chip, {})
+            for packet in packets:
+                if regs.get((packet >> REG_ADDR_SHIFT) & 0xff) != packet & REG_DATA_MASK:
+                    chipPackets.append((chip, packet))
+
+        if not chipPackets:
+            return {}
+        return cls.Anokiewave_write_fanout(mode, chipPackets)
+
+    @classmethod
+    def set_channel_all_on(cls, chip=0):
+        """
+                        Set all the channels of the beamformer ON
+                        Write at register BW0 (0b_0000_0000_0000_0001) at position 34-41 (8 bits)
+        """
+        log.debug('Activate All Elements')
+        telemetry = cls.update_field(awmfregs.BW0, 'disable', [0] * 8, chip=chip)
+        log.debug('Return: %s', telemetry)
+        return telemetry
+
+    @classmethod
+    def reset_beamformer(cls, chip=0):
+        """
+                        Pulse the MODE reset bit (24). The BW0/BW1 shadows of chip
+                        are dropped since the IC returns to its defaults.
+        """
+        log.debug('Reset_Beamformer')
+        cls.update_field(awmfregs.MODE, 'reset', 0b1, chip=chip, force=True)
+        telemetry = cls.update_field(awmfregs.MODE, 'reset', 0b0, chip=chip, force=True)
+        cls.shadow_invalidate(chip, (REG_BW0, REG_BW1))
+        return telemetry
+
+    @classmethod
+    def rf_en_beamformer(cls, chip=0):
+        """
+                        Set the MODE RF enable bit (23)
+        """
+        log.debug('RF enable_Beamformer')
+        telemetry = cls.update_field(awmfregs.MODE, 'rf_en', 0b1, chip=chip)
+        return telemetry
+
+    @classmethod
+    def set_channel_all_off(cls, chip=0):
         """
                         Set all the channels of the beamformer OFF
                         Write at register BW0 (0b_0000_0000_0000_0001) at positions 34-41 (8 bits)
         """
-        # Register BW0
-        BW0b = 0b_0000_0000_0000_0001_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000_0000
-        on_off_bin = 0b11111111
-        packet = BW0b | on_off_bin << 34
-        print('**************************')
-        print('Deactivate All Elements')
-        print('Bin Packet send:', bin(packet))
-        print('Hex Packet send:', hex(packet))
-        telemetry = AwmfCommander.Anokiewave_write(RX_MODE, [packet])
-        print('Return:', telemetry)
+        log.debug('Deactivate All Elements')
+        telemetry = cls.update_field(awmfregs.BW0, 'disable', [1] * 8, chip=chip)
+        log.debug('Return: %s', telemetry)
         return telemetry
 
 
 def main():
 
+        logging.basicConfig(level=logging.DEBUG, format='%(message)s')
         print("**Interactive setBeam test. Get out an o'scope")
         AwmfCommander.initSpi()
         print("Init BW")
@@ -0,0 +1,160 @@
+#-------------------------------------------------------------------------------
+# Name:        ni8452 asyncio front-end
+# Purpose:     Non-blocking (asyncio) access to SPI and AwmfCommander through
+#              one dedicated I/O thread per device
+#
+# Authors:      astreet and  Daskalakispiros
+#
+# Created:     25/04/2020
+# Copyright:   (c) astreet 2020
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+
+
+#-------------------------------------------------------------------------------
+# Usage
+#
+#   dev = AsyncDevice(spi)                     # spi opened/initialised SPI()
+#   await dev.spi.write_frames(frames, 10)
+#   await dev.commander.set_beam(phases, atten, enables, COMM_ATT_0dB)
+#   dev.close()
+#
+# All calls of one device run in order on its DeviceWorker thread, so the
+# control loop, telemetry poller and UI can share the device without blocking
+# the event loop. The command queue is bounded (maxQueue): when it is full
+# the awaiting coroutine waits for space instead of growing the backlog.
+#-------------------------------------------------------------------------------
+import asyncio
+import concurrent.futures
+import queue
+import threading
+
+from Example2.fake_spiwrite import AwmfCommander
+
+
+class DeviceWorker(object):
+    '''I/O thread of one device: runs submitted calls one at a time, in order'''
+
+    def __init__(self, name='ni8452-io', maxQueue=64):
+        self._queue = queue.Queue(maxQueue)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            fn, args, kwargs, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def submit(self, fn, *args, **kwargs):
+        '''Queues fn(*args, **kwargs); blocks while the queue is full.
+        Returns a concurrent.futures.Future'''
+        future = concurrent.futures.Future()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def submit_nowait(self, fn, *args, **kwargs):
+        '''As submit() but raises queue.Full instead of blocking'''
+        future = concurrent.futures.Future()
+        self._queue.put_nowait((fn, args, kwargs, future))
+        return future
+
+    async def call(self, fn, *args, **kwargs):
+        '''Awaitable fn(*args, **kwargs) on the I/O thread'''
+        try:
+            future = self.submit_nowait(fn, *args, **kwargs)
+        except queue.Full:
+            # Wait for queue space off the event loop
+            loop = asyncio.get_running_loop()
+            future = await loop.run_in_executor(None, lambda: self.submit(fn, *args, **kwargs))
+        return await asyncio.wrap_future(future)
+
+    def stop(self, wait=True):
+        '''Stops the thread after the queued calls have run'''
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+
+class AsyncSPI(object):
+    '''asyncio wrapper of an SPI session; every method is a coroutine'''
+
+    def __init__(self, spi, worker):
+        self.sync = spi
+        self.worker = worker
+
+    async def write_frames(self, frames, wordSize=10, ldbCS=None, cs=0):
+        '''SPI.ioWriteFrames(): returns (per-frame read back, fRet)'''
+        return await self.worker.call(self.sync.ioWriteFrames, frames, wordSize, ldbCS, cs)
+
+    async def write_fanout(self, csFrames, wordSize=10):
+        '''SPI.ioWriteFanout(): returns ({cs: read backs}, fRet)'''
+        return await self.worker.call(self.sync.ioWriteFanout, csFrames, wordSize)
+
+    async def write_spi4(self, wData, wordSize=10, cs=0):
+        '''SPI.ioWriteSPI4(): returns (read back, fRet)'''
+        return await self.worker.call(self.sync.ioWriteSPI4, wData, wordSize, cs)
+
+    async def write_spi2(self, wData, wordSize=8):
+        '''SPI.ioWriteSPI2(): returns (read back, fRet)'''
+        return await self.worker.call(self.sync.ioWriteSPI2, wData, wordSize)
+
+    async def read_spi2(self, nWords=18, wordSize=12):
+        '''SPI.ioReadSPI2(): returns list of register values'''
+        return await self.worker.call(self.sync.ioReadSPI2, nWords, wordSize)
+
+    async def write_dio(self, dioData=0):
+        '''SPI.ioWriteDIO(): returns 0/err code'''
+        return await self.worker.call(self.sync.ioWriteDIO, dioData)
+
+    async def read_dio(self):
+        '''SPI.ioReadDIO(): returns DIO port value'''
+        return await self.worker.call(self.sync.ioReadDIO)
+
+
+class AsyncAwmfCommander(object):
+    '''asyncio wrapper of an AwmfCommander class: any commander method is
+    available as a coroutine, e.g. await cmd.set_beam(...), await cmd.init_BF(RX_MODE)'''
+
+    def __init__(self, commander, worker):
+        self.sync = commander
+        self.worker = worker
+
+    def __getattr__(self, name):
+        fn = getattr(self.sync, name)
+        if not callable(fn):
+            return fn
+
+        async def call(*args, **kwargs):
+            return await self.worker.call(fn, *args, **kwargs)
+        call.__name__ = name
+        call.__doc__ = fn.__doc__
+        return call
+
+
+class AsyncDevice(object):
+    '''One device = one I/O thread shared by its .spi and .commander front-ends
+
+    spi:        opened SPI session (default: commander.testSPI)
+    commander:  AwmfCommander class driving this device
+    maxQueue:   bound of the command queue
+    '''
+
+    def __init__(self, spi=None, commander=AwmfCommander, maxQueue=64):
+        if spi is None:
+            spi = commander.testSPI
+        self.worker = DeviceWorker('ni8452-io-{0}'.format(getattr(spi, 'visaAddr', '')), maxQueue)
+        self.spi = AsyncSPI(spi, self.worker)
+        self.commander = AsyncAwmfCommander(commander, self.worker)
+
+    def close(self, wait=True):
+        '''Stops the I/O thread (queued calls complete first)'''
+        self.worker.stop(wait)
@@ -0,0 +1,184 @@
+#-------------------------------------------------------------------------------
+# Name:        ni8452 loopback benchmark
+# Purpose:     Throughput, latency and integrity of the SPI transfer paths,
+#              as JSON, on hardware (MISO jumpered to MOSI) or the emulator
+#
+# Authors:      astreet and  Daskalakispiros
+#
+# Created:     25/04/2020
+# Copyright:   (c) astreet 2020
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+
+
+#-------------------------------------------------------------------------------
+# Usage
+#
+#   python -m Example2.ni8452bench --backend emu --ops spi4,writeread \
+#          --word-sizes 8,10 --lengths 6,64 --iterations 500 --json bench.json
+#
+#   report = run_suite(spi, ops=('spi2', 'spi4'), wordSizes=(10,), lengths=(6,))
+#
+# Ops (SPI methods):
+#   spi         ioWriteSPI      bytes (word size 8 only)
+#   spi2        ioWriteSPI2     CS0 frame + LDB
+#   spi4        ioWriteSPI4     CS pulse framing on line cs
+#   read2       ioReadSPI2      clocks 0's, expects 0's back
+#   writeread   ioWriteRead     ni845xSpiWriteRead, no script
+#
+# Each case runs `iterations` transactions (new random payload each time
+# unless --fixed) and reports transactions/s, payload bits/s, p50/p99/max
+# latency (s), integrity failures (read back != expected) and error status
+# counts. On the emulator modelledSeconds is the modelled bus time.
+#-------------------------------------------------------------------------------
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+from Example2.ni8452io import SPI
+
+OPS = ('spi', 'spi2', 'spi4', 'read2', 'writeread')
+
+
+def _percentile(sortedSamples, q):
+    if not sortedSamples:
+        return None
+    idx = min(len(sortedSamples) - 1, int(round(q / 100.0 * (len(sortedSamples) - 1))))
+    return sortedSamples[idx]
+
+
+def _transaction(spi, op, wData, wordSize, cs):
+    '''Runs one transaction; returns (read back, expected read back, fRet)'''
+    if op == 'spi':
+        rData = spi.ioWriteSPI(wData)
+        return rData, wData, spi.status
+    if op == 'spi2':
+        rData, fRet = spi.ioWriteSPI2(wData, wordSize)
+        return rData, wData, fRet
+    if op == 'spi4':
+        rData, fRet = spi.ioWriteSPI4(wData, wordSize, cs)
+        return rData, wData, fRet
+    if op == 'read2':
+        return spi.ioReadSPI2(len(wData), wordSize), [0] * len(wData), 0
+    if op == 'writeread':
+        rData, fRet = spi.ioWriteRead(wData, wordSize, cs)
+        return rData, wData, fRet
+    raise ValueError("Unknown op %s" % op)
+
+
+def supported(op, wordSize):
+    '''True if op can run wordSize words'''
+    if op == 'spi':
+        return wordSize == 8
+    return 4 <= wordSize <= 16
+
+
+def run_case(spi, op, wordSize=8, nWords=8, iterations=200, cs=0, fixed=False, seed=0):
+    '''Benchmarks one op/word size/payload length; returns a result dict'''
+    rng = random.Random(seed)
+    payload = [rng.getrandbits(wordSize) for i in range(nWords)]
+    lib = spi._lspi
+    modelled = getattr(lib, 'elapsed', None)
+    clock = time.perf_counter
+
+    latency = []
+    failures = errors = 0
+    tStart = clock()
+    for i in range(iterations):
+        if not fixed:
+            payload = [rng.getrandbits(wordSize) for n in range(nWords)]
+        t0 = clock()
+        rData, expected, fRet = _transaction(spi, op, payload, wordSize, cs)
+        latency.append(clock() - t0)
+        if fRet != 0:
+            errors += 1
+        if list(rData) != list(expected):
+            failures += 1
+    seconds = clock() - tStart
+
+    latency.sort()
+    bits = iterations * nWords * wordSize
+    result = {'op': op, 'wordSize': wordSize, 'nWords': nWords, 'iterations': iterations,
+              'cs': cs, 'fixedPayload': fixed, 'seconds': seconds,
+              'transactionsPerSec': iterations / seconds if seconds > 0 else None,
+              'bitsPerSec': bits / seconds if seconds > 0 else None,
+              'latency': {'p50': _percentile(latency, 50), 'p99': _percentile(latency, 99),
+                          'max': latency[-1] if latency else None,
+                          'mean': sum(latency) / len(latency) if latency else None},
+              'integrityFailures': failures, 'errors': errors}
+    if modelled is not None:
+        result['modelledSeconds'] = lib.elapsed - modelled
+    return result
+
+
+def run_suite(spi, ops=OPS, wordSizes=(8, 10, 12, 16), lengths=(1, 6, 18, 64),
+              iterations=200, cs=0, fixed=False):
+    '''Runs run_case() for every supported op x word size x length.
+    Returns the report dict (meta + results)'''
+    results = []
+    for op in ops:
+        for wordSize in wordSizes:
+            if not supported(op, wordSize):
+                continue
+            for nWords in lengths:
+                results.append(run_case(spi, op, wordSize, nWords, iterations, cs, fixed))
+    return {'meta': {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                     'backend': type(spi._lspi).__name__,
+                     'visaAddr': spi.visaAddr.decode() if isinstance(spi.visaAddr, bytes) else spi.visaAddr,
+                     'spiClk': spi.spiClk, 'python': platform.python_version(),
+                     'platform': platform.platform()},
+            'results': results}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description='NI-845x SPI loopback benchmark (JSON report)')
+    p.add_argument('--backend', default=None, help="'dll', 'emu' or a DLL path (default: NI845X_BACKEND)")
+    p.add_argument('--resource', default=None, help='adapter resource name (default: first found)')
+    p.add_argument('--ops', default=','.join(OPS))
+    p.add_argument('--word-sizes', default='8,10,12,16')
+    p.add_argument('--lengths', default='1,6,18,64')
+    p.add_argument('--iterations', type=int, default=200)
+    p.add_argument('--cs', type=int, default=0)
+    p.add_argument('--spi-clk', type=int, default=1000, help='kHz')
+    p.add_argument('--fixed', action='store_true', help='same payload every transaction')
+    p.add_argument('--json', default=None, help='write the report here (default: stdout)')
+    args = p.parse_args(argv)
+
+    ops = [op for op in args.ops.split(',') if op]
+    for op in ops:
+        if op not in OPS:
+            p.error('unknown op %s' % op)
+
+    spi = SPI(args.backend)
+    fRet = spi.ioOpen() if args.resource is None else spi.ioOpenByName(args.resource)
+    if fRet == 0:
+        fRet = spi.ioSetConfig(spiClk=args.spi_clk)
+    if fRet == 0:
+        fRet = spi.ioInit()
+    if fRet != 0:
+        sys.stderr.write('SPI initialisation failed: %s\n' % fRet)
+        return 1
+
+    try:
+        report = run_suite(spi, ops, [int(w) for w in args.word_sizes.split(',')],
+                           [int(n) for n in args.lengths.split(',')], args.iterations,
+                           args.cs, args.fixed)
+    finally:
+        spi.ioSafe()
+        spi.ioClose(0)
+
+    text = json.dumps(report, indent=2)
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 1 if any(r['integrityFailures'] or r['errors'] for r in report['results']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+#-------------------------------------------------------------------------------
+# Name:        ni8452 transaction capture
+# Purpose:     Append-only recording of the SPI/DIO transactions of a session
+#              and replay of a capture against a session or the emulator
+#
+# Authors:      astreet and  Daskalakispiros
+#
+# Created:     25/04/2020
+# Copyright:   (c) astreet 2020
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+
+
+#-------------------------------------------------------------------------------
+# Usage
+#
+#   spi.ioStartCapture('field.cap')     # transactions are appended as they run
+#   ...
+#   spi.ioStopCapture()
+#
+#   emu = SPI('emu'); emu.ioOpen(); emu.ioSetConfig(); emu.ioInit()
+#   stats = Replayer(emu).run('field.cap', speed=1.0)   # None = max speed
+#
+# File format (little endian): CAPTURE_MAGIC + version (u16) + 6 reserved
+# bytes, then one record per transaction:
+#   RECORD_HEADER   t (f8, time.time()), op (u1), cs (u1), wordSize (u1),
+#                   reserved (u1), fRet (i4), nWrite (u4), nRead (u4)
+#   payload         nWrite u16 words
+#   read back       nRead u16 words
+# (versions 1 and 2: RECORD_HEADER_V2, u2 counts; read only)
+# Per op:  OP_SPI4   cs line, words written / read back (ioWriteSPI4)
+#          OP_PLAIN  as OP_SPI4 (ioWritePlain)
+#          OP_SPI2   cs=0, as OP_SPI4 (ioWriteSPI2)
+#          OP_READ2  cs=0, payload [nWords], words read back (ioReadSPI2)
+#          OP_WRITEREAD  as OP_SPI4 (ioWriteRead)
+#          OP_SPI    cs=0, wordSize=8, bytes written / read back (ioWriteSPI,
+#                    ioWriteRSPI)
+#          OP_DIO    cs=0, payload [dioData]
+#          OP_PULSE  cs=dioLine, payload [nPulses, pWidth]
+#          OP_FRAMES cs=ldbCS (NO_LDB: none), payload per frame [CS line mask,
+#                    nWords, words...], read back of all frames in order
+#                    (ioWriteFanout is recorded as the ioWriteFrames it runs)
+# Not captured: ioWriteSPI3 (ODIN A0 workaround) and ioWriteFBSmerc.
+# A file may be appended by several sessions of the same version; a truncated
+# last record (crash while writing) is ignored by read_capture().
+#-------------------------------------------------------------------------------
+import os
+import struct
+import time
+from collections import namedtuple
+
+CAPTURE_MAGIC = b'NI8452CP'
+CAPTURE_VERSION = 3
+FILE_HEADER = struct.Struct('<8sH6x')
+RECORD_HEADER = struct.Struct('<dBBBxiII')
+RECORD_HEADER_V2 = struct.Struct('<dBBBxiHH')
+
+OP_SPI4 = 1
+OP_DIO = 2
+OP_PULSE = 3
+OP_FRAMES = 4
+OP_PLAIN = 5
+OP_SPI2 = 6
+OP_READ2 = 7
+OP_WRITEREAD = 8
+OP_SPI = 9
+OP_NAMES = {OP_SPI4: 'spi4', OP_DIO: 'dio', OP_PULSE: 'pulse', OP_FRAMES: 'frames', OP_PLAIN: 'plain',
+            OP_SPI2: 'spi2', OP_READ2: 'read2', OP_WRITEREAD: 'writeread', OP_SPI: 'spi'}
+# Ops whose read back is compared on replay
+READ_OPS = (OP_SPI4, OP_PLAIN, OP_FRAMES, OP_SPI2, OP_READ2, OP_WRITEREAD, OP_SPI)
+
+# cs of an OP_FRAMES record without LDB strobe
+NO_LDB = 0xFF
+
+CaptureRecord = namedtuple('CaptureRecord', 't op cs wordSize fRet wData rData')
+
+
+class CaptureRecorder(object):
+    '''Appends transactions to a capture file (buffered; flush()/close()
+    write the buffer out)'''
+
+    def __init__(self, fSpec, bufferSize=1 << 16):
+        self.fSpec = fSpec
+        self.count = 0
+        new = not os.path.exists(fSpec) or os.path.getsize(fSpec) == 0
+        if not new:
+            with open(fSpec, 'rb') as f:
+                head = f.read(FILE_HEADER.size)
+            if len(head) < FILE_HEADER.size or FILE_HEADER.unpack(head) != (CAPTURE_MAGIC, CAPTURE_VERSION):
+                raise ValueError("Can not append to %s: not a version %d capture file" % (fSpec, CAPTURE_VERSION))
+        self._f = open(fSpec, 'ab', buffering=bufferSize)
+        if new:
+            self._f.write(FILE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION))
+
+    def record(self, op, cs, wordSize, wData, rData=(), fRet=0):
+        '''Appends one transaction'''
+        nWrite = len(wData)
+        nRead = len(rData)
+        self._f.write(RECORD_HEADER.pack(time.time(), op, cs, wordSize, fRet, nWrite, nRead) +
+                      struct.pack('<%dH%dH' % (nWrite, nRead), *wData, *rData))
+        self.count += 1
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excVal, tb):
+        self.close()
+
+
+def encode_frames(frames, csFrames):
+    '''Returns the OP_FRAMES payload of frames (lists of words) sent on
+    csFrames (a tuple of CS lines per frame)'''
+    payload = []
+    for wData, csF in zip(frames, csFrames):
+        mask = 0
+        for line in csF:
+            mask |= 1 << line
+        payload.append(mask)
+        payload.append(len(wData))
+        payload.extend(wData)
+    return payload
+
+
+def decode_frames(payload):
+    '''Returns (frames, csFrames) of an OP_FRAMES payload'''
+    frames = []
+    csFrames = []
+    pos = 0
+    while pos < len(payload):
+        mask, nWords = payload[pos], payload[pos + 1]
+        csFrames.append(tuple(line for line in range(8) if mask & (1 << line)))
+        frames.append(payload[pos + 2:pos + 2 + nWords])
+        pos += 2 + nWords
+    return frames, csFrames
+
+
+def read_capture(fSpec):
+    '''Generator of the CaptureRecords of a capture file, in order'''
+    with open(fSpec, 'rb') as f:
+        head = f.read(FILE_HEADER.size)
+        if len(head) < FILE_HEADER.size:
+            raise ValueError("Not an NI8452 capture file: %s" % fSpec)
+        magic, version = FILE_HEADER.unpack(head)
+        if magic != CAPTURE_MAGIC:
+            raise ValueError("Not an NI8452 capture file: %s" % fSpec)
+        if version > CAPTURE_VERSION:
+            raise ValueError("Unsupported capture file version %d" % version)
+        header = RECORD_HEADER if version >= 3 else RECORD_HEADER_V2
+
+        while True:
+            head = f.read(header.size)
+            if len(head) < header.size:
+                return
+            t, op, cs, wordSize, fRet, nWrite, nRead = header.unpack(head)
+            body = f.read(2 * (nWrite + nRead))
+            if len(body) < 2 * (nWrite + nRead):
+                return
+            words = struct.unpack('<%dH' % (nWrite + nRead), body)
+            yield CaptureRecord(t, op, cs, wordSize, fRet, list(words[:nWrite]), list(words[nWrite:]))
+
+
+class Replayer(object):
+    '''Re-issues captured transactions on an opened/initialised SPI session
+    (real adapter or SPI('emu'))'''
+
+    def __init__(self, spi):
+        self.spi = spi
+
+    def issue(self, rec):
+        '''Runs one CaptureRecord; returns (read back, fRet)'''
+        spi = self.spi
+        if rec.op == OP_SPI4:
+            return spi.ioWriteSPI4(rec.wData, rec.wordSize, rec.cs)
+        if rec.op == OP_PLAIN:
+            return spi.ioWritePlain(rec.wData, rec.wordSize, rec.cs)
+        if rec.op == OP_SPI2:
+            return spi.ioWriteSPI2(rec.wData, rec.wordSize)
+        if rec.op == OP_READ2:
+            rData = spi.ioReadSPI2(rec.wData[0], rec.wordSize)
+            return rData, spi.status
+        if rec.op == OP_WRITEREAD:
+            return spi.ioWriteRead(rec.wData, rec.wordSize, rec.cs)
+        if rec.op == OP_SPI:
+            rData = spi.ioWriteSPI(rec.wData)
+            return rData, spi.status
+        if rec.op == OP_DIO:
+            return [], spi.ioWriteDIO(rec.wData[0])
+        if rec.op == OP_PULSE:
+            return [], spi.ioWritePulse(rec.wData[0], rec.wData[1], rec.cs)
+        if rec.op == OP_FRAMES:
+            frames, csFrames = decode_frames(rec.wData)
+            ldbCS = None if rec.cs == NO_LDB else rec.cs
+            rFrames, fRet = spi.ioWriteFrames(frames, rec.wordSize, ldbCS, csFrames)
+            return [word for wordArr in rFrames for word in wordArr], fRet
+        raise ValueError("Unknown capture op %d" % rec.op)
+
+    def run(self, records, speed=None, compare=True):
+        '''Replays records (a capture file name or CaptureRecords).
+        speed:    None = back to back, 1.0 = recorded timing, 2.0 = twice as fast
+        compare:  count read back / status differences to the capture
+        Returns a dict: transactions, per op counts, readMismatches,
+        statusMismatches, errors, elapsed (s)'''
+        if isinstance(records, str):
+            records = read_capture(records)
+
+        stats = {'transactions': 0, 'readMismatches': 0, 'statusMismatches': 0, 'errors': 0}
+        stats.update(dict.fromkeys(OP_NAMES.values(), 0))
+        clock = time.perf_counter
+        tStart = clock()
+        tFirst = None
+        for rec in records:
+            if speed is not None:
+                if tFirst is None:
+                    tFirst = rec.t
+                delay = tStart + (rec.t - tFirst) / speed - clock()
+                if delay > 0:
+                    time.sleep(delay)
+
+            rData, fRet = self.issue(rec)
+
+            stats['transactions'] += 1
+            stats[OP_NAMES[rec.op]] += 1
+            if fRet != 0:
+                stats['errors'] += 1
+            if compare:
+                if rec.op in READ_OPS and list(rData) != rec.rData:
+                    stats['readMismatches'] += 1
+                if fRet != rec.fRet:
+                    stats['statusMismatches'] += 1
+        stats['elapsed'] = clock() - tStart
+        return stats
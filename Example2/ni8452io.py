@@ -17,10 +17,57 @@
 #
 #-------------------------------------------------------------------------------
 import ctypes as c
-import sys
+import struct
+from collections import OrderedDict
+
+from Example2.ni845xlib import NiHandle, loadLibrary
+from Example2.ni8452capture import (CaptureRecorder, NO_LDB, OP_DIO, OP_FRAMES, OP_PLAIN, OP_PULSE,
+                                    OP_READ2, OP_SPI, OP_SPI2, OP_SPI4, OP_WRITEREAD, encode_frames)
+from Example2.ni8452metrics import Metrics
+
+
+class BufferArena(object):
+    '''Reusable transfer buffers of one SPI session.
+
+    wBuf/rBuf hold the write/read bytes of up to .capacity samples (1 or 2
+    bytes each); wSlots[n]/rSlots[n] are ctypes c_uint8*n views of sample i
+    inside them, made once so that building a script and extracting its
+    read back allocate nothing per word; views(n) are c_uint8*n views of
+    their first n bytes (whole transfers). Grows on demand, never shrinks'''
+
+    def __init__(self, capacity=64):
+        self.capacity = 0
+        self.rLen     = 0            # bytes of valid read back in rBuf
+        self.cIdx     = c.c_uint32() # read pointer returned by WriteRead
+        self.grow(capacity)
+
+    def grow(self, nSamples):
+        '''Makes room for nSamples samples of up to 2 bytes'''
+        if nSamples <= self.capacity:
+            return
+        cap = max(nSamples, 2 * self.capacity)
+        self.wBuf = bytearray(2 * cap)
+        self.rBuf = bytearray(2 * cap)
+        self.wSlots = {n: [(c.c_uint8 * n).from_buffer(self.wBuf, n * i) for i in range(cap)] for n in (1, 2)}
+        self.rSlots = {n: [(c.c_uint8 * n).from_buffer(self.rBuf, n * i) for i in range(cap)] for n in (1, 2)}
+        self._views = {}
+        self.capacity = cap
+        self.rLen = 0
+
+    def views(self, nBytes):
+        '''Returns (write, read) c_uint8*nBytes views of wBuf/rBuf, made once per size'''
+        views = self._views.get(nBytes)
+        if views is None:
+            views = ((c.c_uint8 * nBytes).from_buffer(self.wBuf),
+                     (c.c_uint8 * nBytes).from_buffer(self.rBuf))
+            self._views[nBytes] = views
+        return views
+
 
 class SPI(object):
-    def __init__(self):
+    def __init__(self, backend=None):
+        '''backend: Ni845x library to use, see ni845xlib.loadLibrary()
+        (None=NI845X_BACKEND env or the DLL, 'emu'=emulator, or an object)'''
 
         # Version info
         self.__version = '2.00.01'
@@ -29,15 +76,9 @@ class SPI(object):
 
         # cType parameters
 
-        #For whatever reason, when using python3, it uses 64 bit pointers
-        # but for python2, these functions use 32 bit pointers. (on my comp at least)
-        # adjust accordingly
-        if sys.version_info[0] == 3:
-            self._cHdl      = c.c_ulonglong()
-            self._cHdlScr   = c.c_ulonglong()
-        else:
-            self._cHdl      = c.c_ulong()
-            self._cHdlScr   = c.c_ulong()
+        # Handles: 64 bit on python3, 32 bit on python2 (see ni845xlib.NiHandle)
+        self._cHdl      = NiHandle()
+        self._cHdlScr   = NiHandle()
         self._cDevStr   = c.create_string_buffer(255)
         self._cNdev     = c.c_uint32(0)
         self._cIOdataIn = c.c_uint8()
@@ -49,6 +90,23 @@ class SPI(object):
         self.delayCS2LDB = 2         # Delay between CS HIGH and LDB
         self._gpioDir    = 31        # GPIO configuration
 
+        # Transaction counters/latency histograms (see ni8452metrics)
+        self.metrics = Metrics()
+
+        # Transaction capture (see ni8452capture), None = off
+        self.recorder = None
+
+        # Reusable write/read buffers (see BufferArena)
+        self._arena = BufferArena()
+
+        # Prepared script cache: key -> [script handle, payload, read pointers]
+        self.scriptCacheSize = 8     # max. prepared script handles
+        self._scriptCache = OrderedDict()
+        self._scriptBuilt = False    # last __preparedScript() rebuilt its script
+
+        # SPI configuration handles of ioWriteRead(): (cs, wordSize, spiClk) -> handle
+        self._cfgCache = {}
+
         # Status
         self.status   = 0
         self.errMsg   = ''
@@ -61,11 +119,10 @@ class SPI(object):
         # CONSTANTS
         self.__IOPORT = c.c_uint8(0)    # Port# for GPIO on 8452
 
-        # Load Ni8452x.dll
+        # Load Ni8452x.dll (or the selected backend)
         self._lspi = None
         try:
-            fSpec = 'c:/windows/system32/Ni845x.dll'
-            self._lspi = c.windll.LoadLibrary(fSpec)
+            self._lspi = loadLibrary(backend)
         except:
             self.status = -1
             self.errMsg = 'Unable to load Ni845x.dll'
@@ -89,7 +146,7 @@ class SPI(object):
         .status=errCode and .errMsg= NI8452 error string'''
         if self._lspi is None:
             return self.errMsg
-        self._lspi.ni845xStatusToString(statusCode, c.c_uint32(1024), c.byref(self.cErrMsg))
+        self._lspi.ni845xStatusToString(statusCode, 1024, c.byref(self.cErrMsg))
         self.errMsg = self.cErrMsg.value
         self.status = statusCode
         return self.errMsg
@@ -138,6 +195,30 @@ class SPI(object):
 
         return fRet
 
+    # --------------------------- ioFindDevices() -----------------------------
+    def ioFindDevices(self):
+        '''Enumerates all connected NI-845x devices (ni845xFindDevice +
+        ni845xFindDeviceNext). Does not open them, see ioOpenByName().
+        Returns (list of resource names (bytes), 0/err code)'''
+        if self._lspi is None:
+            return [], -1
+        cFind = NiHandle()
+        cNdev = c.c_uint32(0)
+        devStr = c.create_string_buffer(255)
+        fRet = self._lspi.ni845xFindDevice(c.byref(devStr), c.byref(cFind), c.byref(cNdev))
+        if fRet != 0 or cNdev.value < 1:
+            # No devices is not an error for enumeration
+            return [], (fRet if cNdev.value > 0 else 0)
+
+        names = [devStr.value]
+        for i in range(1, cNdev.value):
+            fRet = self._lspi.ni845xFindDeviceNext(cFind, c.byref(devStr))
+            if fRet != 0:
+                break
+            names.append(devStr.value)
+        fRet2 = self._lspi.ni845xCloseFindDeviceHandle(cFind)
+        return names, (fRet or fRet2)
+
     # --------------------------- ioOpenByName() -------------------------------------
     def ioOpenByName(self, ResourceName):
         '''Opens a session to NI-SPI with a specific VISA resource
@@ -146,6 +227,8 @@ class SPI(object):
 
         if self._lspi is None:
             return -1
+        if isinstance(ResourceName, str):
+            ResourceName = ResourceName.encode()
         cResourceName = c.create_string_buffer(ResourceName)
 
         fRet = self._lspi.ni845xOpen(cResourceName, c.byref(self._cHdl))
@@ -169,13 +252,25 @@ class SPI(object):
     def ioSetConfig(self, Vio=12, spiClk=1000, gpioDir=31):
         '''Configures SPI parameters Vio*10 voltage level (for SPI and DIO), SPI Clk
         rate (kHz) and GPIO direction (0-all inputs, 255=all outputs).  Sets internal
-        variables used by other functions, does not communicate directly with hardware'''
+        variables used by other functions, does not communicate directly with hardware.
+        Changing spiClk invalidates the prepared scripts'''
+        if spiClk != self.spiClk:
+            self.ioInvalidateScripts()
         self.spiClk = spiClk
         self.Vio = Vio
         self._gpioDir = gpioDir
         return 0
 
 
+    # --------------------------- ioSetClock() ---------------------------------
+    def ioSetClock(self, spiClk):
+        '''Sets only the SPI clock rate (kHz), see ioSetConfig(). Returns 0'''
+        if spiClk != self.spiClk:
+            self.ioInvalidateScripts()
+        self.spiClk = spiClk
+        return 0
+
+
     # --------------------------- ioInit() -------------------------------------
     def ioInit(self):
         '''Initialize IO: Set Vio levels, initialize DIO
@@ -197,7 +292,7 @@ class SPI(object):
         #  0   0   0   1   1   1   1   1 = 31
 
         fRet = self._lspi.ni845xDioSetPortLineDirectionMap(self._cHdl,
-                                        self.__IOPORT, c.c_uint8(self._gpioDir))
+                                        self.__IOPORT, self._gpioDir)
         if fRet !=0:
             pass
             #print(self.__errStatus(fRet))
@@ -212,7 +307,7 @@ class SPI(object):
         if self._lspi is None:
             return -1
         # Set GPIO to 0V
-        fRet = self._lspi.ni845xDioWritePort(self._cHdl, self.__IOPORT, c.c_uint8(0))
+        fRet = self._lspi.ni845xDioWritePort(self._cHdl, self.__IOPORT, 0)
         if fRet!=0:
             #print(self.__errStatus(fRet))
             return fRet
@@ -245,7 +340,15 @@ class SPI(object):
             if fRet !=0:
                 return fRet
 
-        # Close handles cHdlScr & cHdl
+        # Close handles of prepared scripts, configurations, cHdlScr & cHdl
+        fRet = self.ioInvalidateScripts()
+        if fRet !=0:
+            return fRet
+        for hdlCfg in self._cfgCache.values():
+            fRet += self._lspi.ni845xSpiConfigurationClose(hdlCfg)
+        self._cfgCache.clear()
+        if fRet !=0:
+            return fRet
         fRet = self._lspi.ni845xSpiScriptClose(self._cHdlScr)
         if fRet !=0:
             #print(self.__errStatus(fRet))
@@ -255,9 +358,28 @@ class SPI(object):
             pass
             #print(self.__errStatus(fRet))
 
+        self.ioStopCapture()
         return fRet
 
 
+    # --------------------------- ioStartCapture() -----------------------------
+    def ioStartCapture(self, fSpec):
+        '''Appends every following transaction to capture file fSpec (see
+        ni8452capture; ioWriteSPI3 and ioWriteFBSmerc are not captured)'''
+        self.ioStopCapture()
+        self.recorder = CaptureRecorder(fSpec)
+
+    # --------------------------- ioStopCapture() ------------------------------
+    def ioStopCapture(self):
+        '''Stops capturing and closes the capture file.
+        Returns the number of transactions recorded'''
+        recorder, self.recorder = self.recorder, None
+        if recorder is None:
+            return 0
+        recorder.close()
+        return recorder.count
+
+
     # --------------------------------------------------------------------------
     # IO READ/WRITE FUNCTIONS
     # --------------------------------------------------------------------------
@@ -269,10 +391,12 @@ class SPI(object):
         if self._lspi is None:
             return -1
 
-        fRet = self._lspi.ni845xDioWritePort(self._cHdl, self.__IOPORT, c.c_uint8(dioData))
+        fRet = self._lspi.ni845xDioWritePort(self._cHdl, self.__IOPORT, dioData)
         if fRet != 0:
             pass
             #print(self.__errStatus(fRet))
+        if self.recorder is not None:
+            self.recorder.record(OP_DIO, 0, 8, (dioData,), (), fRet)
         return fRet
 
 
@@ -293,16 +417,14 @@ class SPI(object):
     # --------------------------- ioWriteSPI() ---------------------------------
     def ioWriteSPI(self, wData):
         '''Write wData array of bytes over SPI using SPIscript
-           Returns data read back over spi'''
+           Returns data read back over spi, .status holds the 0/err code'''
         if self._lspi is None:
             return 0
         fRet = 0
-        # Num of bytes to be transmitted
-        Nbytes=len(wData)
-        # USB-SPI has max 8bytes/64clks per write buffer
-        # Hence group writes into Nmain blocks of 8 and one last
-        # transaction of Ntail bytes
-        [Nmain, Ntail] = divmod(Nbytes, 8)
+
+        metrics = self.metrics
+        if metrics.enabled:
+            t0 = metrics.clock()
 
         # Reset script
         fRet += self._lspi.ni845xSpiScriptReset(self._cHdlScr)
@@ -314,65 +436,61 @@ class SPI(object):
         # Configure clock rate
         fRet += self._lspi.ni845xSpiScriptClockRate(self._cHdlScr, self.spiClk)
         # Set CS0 HIGH
-        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(0))
+        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, 0)
 
         # Set LDB HIGH (DIO-0): portNum, lineNum, dir(1=op)
-        fRet += self._lspi.ni845xSpiScriptDioConfigureLine(self._cHdlScr, self.__IOPORT, c.c_uint8(0), c.c_int32(1))
+        fRet += self._lspi.ni845xSpiScriptDioConfigureLine(self._cHdlScr, self.__IOPORT, 0, 1)
 
-        fRet += self._lspi.ni845xSpiScriptDioWriteLine(self._cHdlScr, self.__IOPORT, c.c_uint8(0), c.c_int32(1) )
+        fRet += self._lspi.ni845xSpiScriptDioWriteLine(self._cHdlScr, self.__IOPORT, 0, 1 )
 
         # SET CS0 LOW
-        fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, c.c_uint32(0))
-
-        # *** START WRITE LOOP ***
-        idxRead= []                 # Array for read pointers
-
-        c_IdxRead = c.c_uint32()    # ctype for read pointer
-        cWdata = (c.c_uint8*8)()    # ctype for write data array
-
-        if Nmain>0:
-            # Set numSamples=64 clks (8 bytes)
-            fRet = self._lspi.ni845xSpiScriptNumBitsPerSample(self._cHdlScr, c.c_uint16(64))
-
-            for idx in range(Nmain):
-                cWdata[0:8] = wData[idx*8:idx*8+8]
-                fRet += self._lspi.ni845xSpiScriptWriteRead(self._cHdlScr, c.c_uint32(8), c.byref(cWdata), c.byref(c_IdxRead))
-                idxRead.append(c_IdxRead.value)
-
-        if Ntail>0:
-            fRet += self._lspi.ni845xSpiScriptNumBitsPerSample(self._cHdlScr, c.c_uint16(Ntail*8))
-            cWdata = (c.c_uint8*Ntail)()
-            cWdata[0:Ntail] = wData[8*Nmain:8*Nmain+1+Ntail]
-            fRet += self._lspi.ni845xSpiScriptWriteRead(self._cHdlScr, c.c_uint32(Ntail), c.byref(cWdata), c.byref(c_IdxRead))
-            idxRead.append(c_IdxRead.value)
+        fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, 0)
+
+        # *** WRITE ***
+        # Whole payload in ONE WriteRead of 8 bit samples from the transfer
+        # buffers (see BufferArena), CS0 stays LOW across the samples
+        nBytes = len(wData)
+        arena = self._arena
+        arena.grow(nBytes)
+        arena.wBuf[0:nBytes] = bytes(int(byte) & 0xFF for byte in wData)
+        idxRead = []
+        if nBytes > 0:
+            cWdata, cRdata = arena.views(nBytes)
+            fRet += self._lspi.ni845xSpiScriptNumBitsPerSample(self._cHdlScr, 8)
+            fRet += self._lspi.ni845xSpiScriptWriteRead(self._cHdlScr, nBytes, cWdata, c.byref(arena.cIdx))
+            idxRead.append(arena.cIdx.value)
 
         # Set CS0 HIGH
-        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(0))
+        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, 0)
 
         # Set delay: 2us
-        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(2))
+        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, 2)
 
         # Set DIO LOW
-        fRet += self._lspi.ni845xSpiScriptDioWriteLine(self._cHdlScr,self.__IOPORT, c.c_uint8(0), c.c_int32(0) )
+        fRet += self._lspi.ni845xSpiScriptDioWriteLine(self._cHdlScr,self.__IOPORT, 0, 0 )
         # Delay LDB us
-        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(self.delayLDB))
+        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, self.delayLDB)
         # Set DIO-0 HIGH
-        fRet += self._lspi.ni845xSpiScriptDioWriteLine(self._cHdlScr,self.__IOPORT, c.c_uint8(0), c.c_int32(1) )
+        fRet += self._lspi.ni845xSpiScriptDioWriteLine(self._cHdlScr,self.__IOPORT, 0, 1 )
 
+        if metrics.enabled:
+            t1 = metrics.clock()
         fRet += self._lspi.ni845xSpiScriptRun(self._cHdlScr, self._cHdl, 0)
+        if metrics.enabled:
+            t2 = metrics.clock()
 
-        nRead = c.c_uint32()
-
-        rData = []
+        # Extract the read back into the read buffer in one call
         for pIdx in idxRead:
-            #print( pIdx)
-            fRet = self._lspi.ni845xSpiScriptExtractReadDataSize(self._cHdlScr, c.c_uint32(pIdx), c.byref(nRead))
-
-            cRdata = (c.c_uint8 * nRead.value)()
-            fRet = self._lspi.ni845xSpiScriptExtractReadData(self._cHdlScr,c.c_uint32(pIdx), c.byref(cRdata))
-
-            rData += cRdata[0:nRead.value]
-
+            fRet += self._lspi.ni845xSpiScriptExtractReadData(self._cHdlScr, pIdx, cRdata)
+        arena.rLen = nBytes
+        rData = list(arena.rBuf[0:nBytes])
+
+        if metrics.enabled:
+            metrics.transaction('spi', nBytes, 8, t1 - t0, t2 - t1, metrics.clock() - t2,
+                                fRet, cs=0)
+        self.status = fRet
+        if self.recorder is not None:
+            self.recorder.record(OP_SPI, 0, 8, wData, rData, fRet)
         return rData
 
 
@@ -386,7 +504,7 @@ class SPI(object):
         # faster 'standard SPI call' in this space
         rData = self.ioWriteSPI(byteList)
         Nclks = len(rData) * 8
-        return 0, rData, Nclks
+        return self.status, rData, Nclks
 
 
     # --------------------------- ioWriteSPI2() --------------------------------
@@ -395,10 +513,7 @@ class SPI(object):
            Returns data read back over spi'''
         if self._lspi is None:
             return [], 0
-        fRet = 0
 
-        # Num of words to be transmitted
-        Nwords=len(wData)
         # Set wFlag: if wordSize=4-8 bits then no need to manage word conversion
         if wordSize<4 or wordSize>16:
             return -1
@@ -407,191 +522,447 @@ class SPI(object):
         else:
             wFlag=1
 
-        # Reset script
-        fRet += self._lspi.ni845xSpiScriptReset(self._cHdlScr)
-        # Enable SPI
-        fRet += self._lspi.ni845xSpiScriptEnableSPI(self._cHdlScr)
+        # Prepared (cached) script: CS0 frame + LDB (CS1) strobe
+        rData, fRet = self.__runPrepared('spi2', wData, wordSize, wFlag)
+        if self.recorder is not None:
+            self.recorder.record(OP_SPI2, 0, wordSize, wData, rData, fRet)
+        return rData, fRet
 
-        # Configure polarity and phase
-        fRet += self._lspi.ni845xSpiScriptClockPolarityPhase(self._cHdlScr, 0, 0)
-        # Configure clock rate
-        fRet += self._lspi.ni845xSpiScriptClockRate(self._cHdlScr, self.spiClk)
-        # Set CS0 HIGH
-        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(0))
-        # Set CS1 HIGH
-        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(1))
+    # --------------------------- ioWriteSPI4() --------------------------------
+    def ioWriteSPI4(self, wData, wordSize=10, cs=0):
+            '''Write wData array over SPI in wordSize chunks using SPIscript
+               on chip select line cs (0-7)
+               Returns data read back over spi'''
+            if self._lspi is None:
+                return [], 0
 
-        # SET CS0 LOW
-        fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, c.c_uint32(0))
+            # Set wFlag: if wordSize=4-8 bits then no need to manage word conversion
+            if wordSize < 4 or wordSize > 16:
+                return -1
+            elif wordSize < 9:
+                wFlag = 0
+            else:
+                wFlag = 1
 
-        # *** START WRITE LOOP ***
-        idxRead= []                 # Array for read pointers
-        c_IdxRead = c.c_uint32()    # ctype for read pointer
+            # Prepared (cached) script: CS LOW/HIGH/LOW framing, no LDB
+            rData, fRet = self.__runPrepared('spi4', wData, wordSize, wFlag, cs)
+            if self.recorder is not None:
+                self.recorder.record(OP_SPI4, cs, wordSize, wData, rData, fRet)
+            return rData, fRet
 
-        fRet += self._lspi.ni845xSpiScriptNumBitsPerSample(self._cHdlScr, c.c_uint16(wordSize))
 
-        if wFlag==1:
-            # Transmit data as WORDS (2 bytes per write)
-            cWdata = (c.c_uint8*2)()   # ctype for write data array
-            cNumBytes = c.c_uint32(2)  # 2 bytes
-            for idx in range(Nwords):
-                cWdata[0:2] = self.__word2bytes(wData[idx])
-                fRet += self._lspi.ni845xSpiScriptWriteRead(self._cHdlScr, cNumBytes, c.byref(cWdata), c.byref(c_IdxRead))
-                idxRead.append(c_IdxRead.value)
+    # --------------------------- ioWritePlain() -------------------------------
+    def ioWritePlain(self, wData, wordSize=10, cs=0):
+        '''Write wData array over SPI in wordSize chunks using SPIscript in a
+           single CS frame on line cs (CS LOW, words, CS HIGH): no CS pulse
+           before the data and no LDB strobe, the same frame as ioWriteRead
+           Returns (data read back over spi, fRet)'''
+        if self._lspi is None:
+            return [], 0
 
+        # Set wFlag: if wordSize=4-8 bits then no need to manage word conversion
+        if wordSize < 4 or wordSize > 16:
+            return [], -1
+        elif wordSize < 9:
+            wFlag = 0
         else:
-            cNumBytes=c.c_uint32(1)
-            for idx in range(Nwords):
-                cWdata = c.c_uint8(wData[idx])
-                fRet += self._lspi.ni845xSpiScriptWriteRead(self._cHdlScr, cNumBytes, c.byref(cWdata), c.byref(c_IdxRead))
-                idxRead.append(c_IdxRead.value)
+            wFlag = 1
+
+        # Prepared (cached) script: plain CS framing
+        rData, fRet = self.__runPrepared('plain', wData, wordSize, wFlag, cs)
+        if self.recorder is not None:
+            self.recorder.record(OP_PLAIN, cs, wordSize, wData, rData, fRet)
+        return rData, fRet
+
+
+    # --------------------------- ioWriteRead() --------------------------------
+    def ioWriteRead(self, wData, wordSize=8, cs=0):
+        '''Write wData array over SPI in wordSize chunks with ni845xSpiWriteRead
+           (configuration handle, no script): a single CS frame on line cs,
+           no CS pulse before the data and no LDB strobe. One USB round trip
+           and nothing to build, the cheapest path for plain transfers.
+           Returns (data read back over spi, fRet)'''
+        if self._lspi is None:
+            return [], 0
 
+        if wordSize < 4 or wordSize > 16:
+            return [], -1
+        nBytes = 2 if wordSize > 8 else 1
+        nWords = len(wData)
+        if nWords == 0:
+            return [], 0
 
-        # Set CS0 HIGH
-        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(0))
+        metrics = self.metrics
+        if metrics.enabled:
+            clock = metrics.clock
+            t0 = clock()
 
-        # Set delay: 2us
-        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(self.delayCS2LDB))
+        # Configuration handle of this CS/word size/clock, made once
+        key = (cs, wordSize, self.spiClk)
+        hdlCfg = self._cfgCache.get(key)
+        built = hdlCfg is None
+        fRet = 0
+        if built:
+            hdlCfg = NiHandle()
+            fRet = self._lspi.ni845xSpiConfigurationOpen(c.byref(hdlCfg))
+            if fRet != 0:
+                return [], fRet
+            fRet += self._lspi.ni845xSpiConfigurationSetPort(hdlCfg, 0)
+            fRet += self._lspi.ni845xSpiConfigurationSetChipSelect(hdlCfg, cs)
+            fRet += self._lspi.ni845xSpiConfigurationSetClockRate(hdlCfg, self.spiClk)
+            fRet += self._lspi.ni845xSpiConfigurationSetClockPolarity(hdlCfg, 0)
+            fRet += self._lspi.ni845xSpiConfigurationSetClockPhase(hdlCfg, 0)
+            fRet += self._lspi.ni845xSpiConfigurationSetNumBitsPerSample(hdlCfg, wordSize)
+            if fRet != 0:
+                self._lspi.ni845xSpiConfigurationClose(hdlCfg)
+                return [], fRet
+            self._cfgCache[key] = hdlCfg
+
+        arena = self._arena
+        arena.grow(nWords)
+        if nBytes == 2:
+            struct.pack_into('>%dH' % nWords, arena.wBuf, 0, *[int(word) & 0xFFFF for word in wData])
+        else:
+            arena.wBuf[0:nWords] = bytes(int(word) & 0xFF for word in wData)
+        size = nBytes * nWords
+        cWdata, cRdata = arena.views(size)
+        cRead = arena.cIdx
+        cRead.value = 0
+        if metrics.enabled:
+            t1 = clock()
+
+        fRet += self._lspi.ni845xSpiWriteRead(self._cHdl, hdlCfg, size, cWdata, c.byref(cRead), cRdata)
+        if metrics.enabled:
+            t2 = clock()
+
+        arena.rLen = min(cRead.value, size)
+        if nBytes == 2:
+            wordArr = list(struct.unpack_from('>%dH' % (arena.rLen // 2), arena.rBuf, 0))
+        else:
+            wordArr = list(arena.rBuf[0:arena.rLen])
+        if metrics.enabled:
+            metrics.transaction('writeread', nWords, wordSize, t1 - t0, t2 - t1, clock() - t2,
+                                fRet, built=built, cs=cs)
+        if self.recorder is not None:
+            self.recorder.record(OP_WRITEREAD, cs, wordSize, wData, wordArr, fRet)
+        return wordArr, fRet
 
-        # Set CS1 LOW
-        fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, c.c_uint32(1))
-        # Delay LDB us
-        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(self.delayLDB))
-        # Set CS1 HIGH
-        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(1))
 
-        # Run script
-        fRet += self._lspi.ni845xSpiScriptRun(self._cHdlScr, self._cHdl, 0)
+    # --------------------------------------------------------------------------
+    # PREPARED SCRIPT CACHE
+    # --------------------------------------------------------------------------
+    # Scripts of ioWriteSPI2/ioWriteSPI4/ioWritePlain/ioReadSPI2 are kept in their own script
+    # handle per transaction shape (wordSize, word count, spiClk, framing).
+    # The NI-845x script engine copies write data when a command is added, so
+    # a prepared script can not be patched: identical payloads re-run the
+    # prepared handle without rebuilding it, a new payload rebuilds in place.
+
+    # --------------------------- ioInvalidateScripts() ------------------------
+    def ioInvalidateScripts(self):
+        '''Closes all prepared script handles (e.g. after a config change).
+        Returns 0/err code'''
+        fRet = 0
+        if self._lspi is not None:
+            for hdlScr, payload, idxRead in self._scriptCache.values():
+                fRet += self._lspi.ni845xSpiScriptClose(hdlScr)
+        self._scriptCache.clear()
+        return fRet
 
-        nRead = c.c_uint32()
 
-        rData = []
-        for pIdx in idxRead:
+    def __runPrepared(self, variant, wData, wordSize, wFlag, cs=0):
+        '''Runs the prepared script of variant with wData on cs, timing the
+        build/run/extract phases into .metrics. Returns (read back words, fRet)'''
+        metrics = self.metrics
+        if metrics.enabled:
+            clock = metrics.clock
+            t0 = clock()
+        fRet, hdlScr, idxRead = self.__preparedScript(variant, wData, wordSize, wFlag, cs)
+        if fRet != 0:
+            # No valid script: the handle was closed or never opened
+            return [], fRet
+        built = self._scriptBuilt
+        if metrics.enabled:
+            t1 = clock()
 
-            fRet += self._lspi.ni845xSpiScriptExtractReadDataSize(self._cHdlScr, c.c_uint32(pIdx), c.byref(nRead))
+        # Run script
+        fRet += self._lspi.ni845xSpiScriptRun(hdlScr, self._cHdl, 0)
+        if metrics.enabled:
+            t2 = clock()
+
+        wordArr, f = self.__readWords(hdlScr, idxRead, wFlag)
+        fRet += f
+        if metrics.enabled:
+            metrics.transaction(variant, len(idxRead), wordSize, t1 - t0, t2 - t1, clock() - t2,
+                                fRet, built=built, cs=cs)
+        return wordArr, fRet
 
-            cRdata = (c.c_uint8 * nRead.value)()
-            fRet = self._lspi.ni845xSpiScriptExtractReadData(self._cHdlScr,c.c_uint32(pIdx), c.byref(cRdata))
 
-            rData += cRdata[0:nRead.value]
+    def __preparedScript(self, variant, wData, wordSize, wFlag, cs=0):
+        '''Returns (fRet, script handle, read pointers) of a script ready to run
+        for this transaction, building it only if shape or payload changed
+        (._scriptBuilt tells which)'''
+        key = (variant, cs, wordSize, len(wData), self.spiClk, self.delayCS2LDB, self.delayLDB)
+        payload = tuple(wData)
+        entry = self._scriptCache.get(key)
+        if entry is not None:
+            self._scriptCache.move_to_end(key)
+            if entry[1] == payload:
+                self._scriptBuilt = False
+                return 0, entry[0], entry[2]
+            hdlScr = entry[0]
+        else:
+            fRet = 0
+            if len(self._scriptCache) >= self.scriptCacheSize:
+                # Reuse the handle of the least recently used shape
+                oldKey, oldEntry = self._scriptCache.popitem(last=False)
+                hdlScr = oldEntry[0]
+            else:
+                hdlScr = NiHandle()
+                fRet = self._lspi.ni845xSpiScriptOpen(c.byref(hdlScr))
+                if fRet != 0:
+                    return fRet, hdlScr, []
 
-        # Handle word translation if wFlag True
-        if wFlag==1:
-            wordArr = []
-            for idx in range(Nwords):
-                wordArr.append(self.__bytes2word(rData[2*idx:2*idx+2]))
+        self._scriptBuilt = True
+        fRet, idxRead = self.__buildScript(hdlScr, variant, wData, wordSize, wFlag, cs)
+        if fRet != 0:
+            self._scriptCache.pop(key, None)
+            self._lspi.ni845xSpiScriptClose(hdlScr)
         else:
-            wordArr=rData
+            self._scriptCache[key] = [hdlScr, payload, idxRead]
+        return fRet, hdlScr, idxRead
 
-        return wordArr, fRet
 
-    # --------------------------- ioWriteSPI4() --------------------------------
-    def ioWriteSPI4(self, wData, wordSize=10):
-            '''Write wData array over SPI in wordSize chunks using SPIscript
-               Returns data read back over spi'''
-            if self._lspi is None:
-                return [], 0
-            fRet = 0
+    def __buildScript(self, hdlScr, variant, wData, wordSize, wFlag, cs=0):
+        '''Emits the complete script of variant ('spi2', 'spi4', 'plain', 'read2')
+        with data on chip select cs into hdlScr. Returns (fRet, read pointers)'''
+        fRet = 0
 
-            # Num of words to be transmitted
-            Nwords = len(wData)
-            # Set wFlag: if wordSize=4-8 bits then no need to manage word conversion
-            if wordSize < 4 or wordSize > 16:
-                return -1
-            elif wordSize < 9:
-                wFlag = 0
-            else:
-                wFlag = 1
+        # Reset script
+        fRet += self._lspi.ni845xSpiScriptReset(hdlScr)
+        # Enable SPI
+        fRet += self._lspi.ni845xSpiScriptEnableSPI(hdlScr)
 
-            # Reset script
-            fRet += self._lspi.ni845xSpiScriptReset(self._cHdlScr)
-            # Enable SPI
-            fRet += self._lspi.ni845xSpiScriptEnableSPI(self._cHdlScr)
+        # Configure polarity and phase
+        fRet += self._lspi.ni845xSpiScriptClockPolarityPhase(hdlScr, 0, 0)
+        # Configure clock rate
+        fRet += self._lspi.ni845xSpiScriptClockRate(hdlScr, self.spiClk)
+        # Set CSx HIGH
+        fRet += self._lspi.ni845xSpiScriptCSHigh(hdlScr, cs)
+
+        if variant == 'spi4':
+            # SET CSx LOW
+            fRet += self._lspi.ni845xSpiScriptCSLow(hdlScr, cs)
+            # Set delay: 1us
+            fRet += self._lspi.ni845xSpiScriptUsDelay(hdlScr, 1)
+            # SET CSx HIGH
+            fRet += self._lspi.ni845xSpiScriptCSHigh(hdlScr, cs)
+            # Set delay: 1us
+            fRet += self._lspi.ni845xSpiScriptUsDelay(hdlScr, 1)
+        elif variant != 'plain':
+            # Set CS1 HIGH
+            fRet += self._lspi.ni845xSpiScriptCSHigh(hdlScr, 1)
 
-            # Configure polarity and phase
-            fRet += self._lspi.ni845xSpiScriptClockPolarityPhase(self._cHdlScr, 0, 0)
-            # Configure clock rate
-            fRet += self._lspi.ni845xSpiScriptClockRate(self._cHdlScr, self.spiClk)
-            # Set CS0 HIGH
-            fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(0))
-
-
-            # SET CS0 LOW
-            fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, c.c_uint32(0))
-            # Set delay: 10us
-            fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(1))
-            # SET CS0 HIGH
-            fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(0))
-            # Set delay: 10us
-            fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(1))
-            # SET CS0 LOW
-            fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, c.c_uint32(0))
-
-            # *** START WRITE LOOP ***
-            idxRead = []  # Array for read pointers
-            c_IdxRead = c.c_uint32()  # ctype for read pointer
-
-            fRet += self._lspi.ni845xSpiScriptNumBitsPerSample(self._cHdlScr, c.c_uint16(wordSize))
-
-            if wFlag == 1:
-                # Transmit data as WORDS (2 bytes per write)
-                cWdata = (c.c_uint8 * 2)()  # ctype for write data array
-                cNumBytes = c.c_uint32(2)  # 2 bytes
-                for idx in range(Nwords):
-                    cWdata[0:2] = self.__word2bytes(wData[idx])
-                    fRet += self._lspi.ni845xSpiScriptWriteRead(self._cHdlScr, cNumBytes, c.byref(cWdata),
-                                                                c.byref(c_IdxRead))
-                    idxRead.append(c_IdxRead.value)
+        # SET CSx LOW
+        fRet += self._lspi.ni845xSpiScriptCSLow(hdlScr, cs)
 
-            else:
-                cNumBytes = c.c_uint32(1)
-                for idx in range(Nwords):
-                    cWdata = c.c_uint8(wData[idx])
-                    fRet += self._lspi.ni845xSpiScriptWriteRead(self._cHdlScr, cNumBytes, c.byref(cWdata),
-                                                                c.byref(c_IdxRead))
-                    idxRead.append(c_IdxRead.value)
+        # *** START WRITE LOOP ***
+        fRet += self._lspi.ni845xSpiScriptNumBitsPerSample(hdlScr, wordSize)
+        f, idxRead = self.__scriptWords(hdlScr, wData, wFlag)
+        fRet += f
 
-            # Set CS0 HIGH
-            fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(0))
+        # Set CSx HIGH
+        fRet += self._lspi.ni845xSpiScriptCSHigh(hdlScr, cs)
 
+        if variant in ('spi2', 'spi4'):
             # Set delay: 2us
-            fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(self.delayCS2LDB))
-
-            # # Set CS1 LOW
-            # fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, c.c_uint32(1))
-            # # Delay LDB us
-            # fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(self.delayLDB))
-            # # Set CS1 HIGH
-            # fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(1))
+            fRet += self._lspi.ni845xSpiScriptUsDelay(hdlScr, self.delayCS2LDB)
 
-            # Run script
-            fRet += self._lspi.ni845xSpiScriptRun(self._cHdlScr, self._cHdl, 0)
+        if variant == 'spi2':
+            # Set CS1 LOW
+            fRet += self._lspi.ni845xSpiScriptCSLow(hdlScr, 1)
+            # Delay LDB us
+            fRet += self._lspi.ni845xSpiScriptUsDelay(hdlScr, self.delayLDB)
+            # Set CS1 HIGH
+            fRet += self._lspi.ni845xSpiScriptCSHigh(hdlScr, 1)
 
-            nRead = c.c_uint32()
+        return fRet, idxRead
 
-            rData = []
 
-            for pIdx in idxRead:
-                fRet += self._lspi.ni845xSpiScriptExtractReadDataSize(self._cHdlScr, c.c_uint32(pIdx), c.byref(nRead))
+    # --------------------------- ioWriteFrames() ------------------------------
+    def ioWriteFrames(self, frames, wordSize=10, ldbCS=None, cs=0):
+        '''Write a list of frames (each a list of wordSize words) in ONE SPIscript
+           run. Every frame gets the ioWriteSPI4 CS framing; if ldbCS is given
+           that CS line is also strobed (LDB) low for delayLDB us after each frame.
+           cs: CS line (0-7) of every frame, a tuple of lines to broadcast on, or
+           a list with one such entry per frame
+           Returns (list of per-frame read back word lists, fRet)'''
+        if self._lspi is None:
+            return [], 0
+        fRet = 0
 
-                cRdata = (c.c_uint8 * nRead.value)()
-                fRet = self._lspi.ni845xSpiScriptExtractReadData(self._cHdlScr, c.c_uint32(pIdx), c.byref(cRdata))
+        # Set wFlag: if wordSize=4-8 bits then no need to manage word conversion
+        if wordSize < 4 or wordSize > 16:
+            return [], -1
+        elif wordSize < 9:
+            wFlag = 0
+        else:
+            wFlag = 1
 
-                rData += cRdata[0:nRead.value]
+        # CS lines of each frame
+        if not isinstance(cs, list):
+            cs = [cs] * len(frames)
+        csFrames = [(csF,) if isinstance(csF, int) else tuple(csF) for csF in cs]
+        csUsed = sorted(set(line for csF in csFrames for line in csF))
 
+        metrics = self.metrics
+        if metrics.enabled:
+            t0 = metrics.clock()
 
-            # Handle word translation if wFlag True
-            if wFlag == 1:
-                wordArr = []
-                for idx in range(Nwords):
-                    wordArr.append(self.__bytes2word(rData[2 * idx:2 * idx + 2]))
-            else:
-                wordArr = rData
+        # Reset script
+        fRet += self._lspi.ni845xSpiScriptReset(self._cHdlScr)
+        # Enable SPI
+        fRet += self._lspi.ni845xSpiScriptEnableSPI(self._cHdlScr)
 
-            return wordArr, fRet
+        # Configure polarity and phase
+        fRet += self._lspi.ni845xSpiScriptClockPolarityPhase(self._cHdlScr, 0, 0)
+        # Configure clock rate
+        fRet += self._lspi.ni845xSpiScriptClockRate(self._cHdlScr, self.spiClk)
+        # Set CSx HIGH
+        for line in csUsed:
+            fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, line)
+        # Set LDB HIGH
+        if ldbCS is not None:
+            fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, ldbCS)
+
+        fRet += self._lspi.ni845xSpiScriptNumBitsPerSample(self._cHdlScr, wordSize)
+
+        # *** START FRAME LOOP ***
+        idxFrames = []  # Read pointers of each frame
+        for wData, csF in zip(frames, csFrames):
+            # SET CSx LOW / HIGH / LOW (as ioWriteSPI4)
+            for line in csF:
+                fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, line)
+            fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, 1)
+            for line in csF:
+                fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, line)
+            fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, 1)
+            for line in csF:
+                fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, line)
+
+            f, idxRead = self.__scriptWords(self._cHdlScr, wData, wFlag)
+            fRet += f
+            idxFrames.append(idxRead)
+
+            # Set CSx HIGH
+            for line in csF:
+                fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, line)
+            # Set delay: CS to LDB
+            fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, self.delayCS2LDB)
+
+            if ldbCS is not None:
+                # Strobe LDB LOW for delayLDB us
+                fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, ldbCS)
+                fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, self.delayLDB)
+                fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, ldbCS)
 
+        # Run script
+        if metrics.enabled:
+            t1 = metrics.clock()
+        fRet += self._lspi.ni845xSpiScriptRun(self._cHdlScr, self._cHdl, 0)
+        if metrics.enabled:
+            t2 = metrics.clock()
+
+        # Extract all frames into the read buffer at once, then split
+        wordArr, f = self.__readWords(self._cHdlScr, [pIdx for idxRead in idxFrames for pIdx in idxRead], wFlag)
+        fRet += f
+        rFrames = []
+        pos = 0
+        for idxRead in idxFrames:
+            rFrames.append(wordArr[pos:pos + len(idxRead)])
+            pos += len(idxRead)
+
+        if metrics.enabled:
+            metrics.transaction('frames', pos, wordSize, t1 - t0, t2 - t1, metrics.clock() - t2,
+                                fRet, frames=len(idxFrames), cs=csUsed)
+        if self.recorder is not None:
+            self.recorder.record(OP_FRAMES, NO_LDB if ldbCS is None else ldbCS, wordSize,
+                                 encode_frames(frames, csFrames), wordArr, fRet)
+        return rFrames, fRet
+
+
+    # --------------------------- ioWriteFanout() ------------------------------
+    def ioWriteFanout(self, csFrames, wordSize=10):
+        '''Sequence frames to ICs on CS0-CS7 in ONE SPIscript run.
+           csFrames: list of (cs, words) where cs is a CS line or a tuple of
+           lines that receive the same frame (broadcast). Captured (ioStartCapture)
+           as the ioWriteFrames transaction it runs
+           Returns ({cs line: [read back words of each frame sent to it]}, fRet)'''
+        frames = [wData for csF, wData in csFrames]
+        cs = [csF for csF, wData in csFrames]
+        rFrames, fRet = self.ioWriteFrames(frames, wordSize, cs=cs)
+
+        rData = {}
+        for csF, wordArr in zip(cs, rFrames):
+            for line in ((csF,) if isinstance(csF, int) else csF):
+                rData.setdefault(line, []).append(wordArr)
+        return rData, fRet
+
+
+    def __scriptWords(self, hdlScr, wData, wFlag):
+        '''Adds one ni845xSpiScriptWriteRead per word of wData to script hdlScr.
+        Returns (fRet, list of read pointers)'''
+        fRet = 0
+        nWords = len(wData)
+        arena = self._arena
+        arena.grow(nWords)
+        idxRead = []                # Array for read pointers
+        c_IdxRead = arena.cIdx      # ctype for read pointer
+        if wFlag == 1:
+            # Transmit data as WORDS (2 bytes per write), encoded in one go
+            struct.pack_into('>%dH' % nWords, arena.wBuf, 0, *[int(word) & 0xFFFF for word in wData])
+            nBytes = 2
+        else:
+            arena.wBuf[0:nWords] = bytes(int(word) & 0xFF for word in wData)
+            nBytes = 1
+        wSlots = arena.wSlots[nBytes]
+        WriteRead = self._lspi.ni845xSpiScriptWriteRead
+        for idx in range(nWords):
+            # The script copies the write data, so the slots are free again on return
+            fRet += WriteRead(hdlScr, nBytes, wSlots[idx], c.byref(c_IdxRead))
+            idxRead.append(c_IdxRead.value)
+        return fRet, idxRead
 
 
+    def __readWords(self, hdlScr, idxRead, wFlag):
+        '''Extracts the read back data of idxRead pointers from a run script
+        into the read buffer (see ioReadBuffer()). The sample size is known
+        (1 or 2 bytes) so ExtractReadDataSize is not called.
+        Returns (list of words, fRet)'''
+        fRet = 0
+        nWords = len(idxRead)
+        arena = self._arena
+        arena.grow(nWords)
+        nBytes = 2 if wFlag == 1 else 1
+        rSlots = arena.rSlots[nBytes]
+        ExtractReadData = self._lspi.ni845xSpiScriptExtractReadData
+        for idx, pIdx in enumerate(idxRead):
+            fRet += ExtractReadData(hdlScr, pIdx, rSlots[idx])
+        arena.rLen = nBytes * nWords
+
+        # Handle word translation if wFlag True (bulk big-endian unpack)
+        if wFlag == 1:
+            return list(struct.unpack_from('>%dH' % nWords, arena.rBuf, 0)), fRet
+        return list(arena.rBuf[0:nWords]), fRet
+
+
+    # --------------------------- ioReadBuffer() -------------------------------
+    def ioReadBuffer(self):
+        '''Returns a memoryview of the raw bytes read back by the last
+        ioWriteSPI/ioWriteSPI2/ioWriteSPI3/ioWriteSPI4/ioWriteFrames/ioWriteRead/ioReadSPI2 call
+        (big-endian 2-byte samples for wordSize>8, else 1 byte per word),
+        e.g. numpy.frombuffer(spi.ioReadBuffer(), '>u2').
+        Valid until the next transfer; copy it to keep it'''
+        return memoryview(self._arena.rBuf)[0:self._arena.rLen]
 
 
     # --------------------------- ioWriteSPI3() --------------------------------
@@ -619,8 +990,6 @@ class SPI(object):
         #                             |--|
 
 
-        # Num of words to be transmitted
-        Nwords=len(wData)
         # Set wFlag: if wordSize=4-8 bits then no need to manage word conversion
         if wordSize<4 or wordSize>16:
             return -1
@@ -629,6 +998,10 @@ class SPI(object):
         else:
             wFlag=1
 
+        metrics = self.metrics
+        if metrics.enabled:
+            t0 = metrics.clock()
+
         # Reset script
         fRet += self._lspi.ni845xSpiScriptReset(self._cHdlScr)
         # Enable SPI
@@ -639,87 +1012,60 @@ class SPI(object):
         # Configure clock rate
         fRet += self._lspi.ni845xSpiScriptClockRate(self._cHdlScr, self.spiClk)
         # Set CSB/CS0 HIGH
-        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(iCSB))
+        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, iCSB)
         # Set LDB/CS1 HIGH
-        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(iLDB))
+        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, iLDB)
         # Set TRG/CS7 HIGH
-        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(iTRG))
+        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, iTRG)
 
         # SET LDB/CS1 LOW
-        fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, c.c_uint32(iLDB))
-        fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, c.c_uint32(iTRG))
+        fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, iLDB)
+        fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, iTRG)
         # Wait one click
-        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(1))
+        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, 1)
         # SET CSB/CS0 LOW
-        fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, c.c_uint32(iCSB))
+        fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, iCSB)
 
 
         # *** START WRITE LOOP ***
-        idxRead= []                 # Array for read pointers
-        c_IdxRead = c.c_uint32()    # ctype for read pointer
-
-        fRet += self._lspi.ni845xSpiScriptNumBitsPerSample(self._cHdlScr, c.c_uint16(wordSize))
-
-        if wFlag==1:
-            # Transmit data as WORDS (2 bytes per write)
-            cWdata = (c.c_uint8*2)()   # ctype for write data array
-            cNumBytes = c.c_uint32(2)  # 2 bytes
-            for idx in range(Nwords):
-                cWdata[0:2] = self.__word2bytes(wData[idx])
-                fRet += self._lspi.ni845xSpiScriptWriteRead(self._cHdlScr, cNumBytes, c.byref(cWdata), c.byref(c_IdxRead))
-                idxRead.append(c_IdxRead.value)
-
-        else:
-            cNumBytes=c.c_uint32(1)
-            for idx in range(Nwords):
-                cWdata = c.c_uint8(wData[idx])
-                fRet += self._lspi.ni845xSpiScriptWriteRead(self._cHdlScr, cNumBytes, c.byref(cWdata), c.byref(c_IdxRead))
-                idxRead.append(c_IdxRead.value)
+        fRet += self._lspi.ni845xSpiScriptNumBitsPerSample(self._cHdlScr, wordSize)
+        f, idxRead = self.__scriptWords(self._cHdlScr, wData, wFlag)
+        fRet += f
 
 
         # Set CSB/CS0 HIGH
-        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(iCSB))
+        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, iCSB)
         # Wait 1us
-        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(1))
+        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, 1)
         # Set LDB/CS1 HIGH
-        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(iLDB))
+        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, iLDB)
         # Wait 1us
-        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(1))
+        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, 1)
         # Set CSB/CS0 LOW
-        fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, c.c_uint32(iCSB))
+        fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, iCSB)
         # Wait 1us
-        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(1))
+        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, 1)
         # Set CSB/CS0 & TRG HIGH
-        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(iCSB))
-        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(iTRG))
+        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, iCSB)
+        fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, iTRG)
         # Wait 1us
-        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(1))
+        fRet += self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, 1)
 ##        # Set TRG/CS7 LOW
-##        fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, c.c_uint32(iTRG))
+##        fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, iTRG)
 
         # --- Run script ---
+        if metrics.enabled:
+            t1 = metrics.clock()
         fRet += self._lspi.ni845xSpiScriptRun(self._cHdlScr, self._cHdl, 0)
+        if metrics.enabled:
+            t2 = metrics.clock()
 
-        nRead = c.c_uint32()
-
-        rData = []
-        for pIdx in idxRead:
-
-            fRet += self._lspi.ni845xSpiScriptExtractReadDataSize(self._cHdlScr, c.c_uint32(pIdx), c.byref(nRead))
-
-            cRdata = (c.c_uint8 * nRead.value)()
-            fRet = self._lspi.ni845xSpiScriptExtractReadData(self._cHdlScr,c.c_uint32(pIdx), c.byref(cRdata))
-
-            rData += cRdata[0:nRead.value]
-
-        # Handle word translation if wFlag True
-        if wFlag==1:
-            wordArr = []
-            for idx in range(Nwords):
-                wordArr.append(self.__bytes2word(rData[2*idx:2*idx+2]))
-        else:
-            wordArr=rData
+        wordArr, f = self.__readWords(self._cHdlScr, idxRead, wFlag)
+        fRet += f
 
+        if metrics.enabled:
+            metrics.transaction('spi3', len(idxRead), wordSize, t1 - t0, t2 - t1, metrics.clock() - t2,
+                                fRet, cs=iCSB)
         return wordArr
 
     # --------------------------- ioReadSPI2() ---------------------------------
@@ -728,16 +1074,13 @@ class SPI(object):
             nWords (no. of registers) and the wordSize.  Clocks out nWordsxwordSize 0's
             and readback data into nWords registers of wordSize. Note LDB is not strobed
             so no data written to device
-            Returns list of register values'''
+            Returns list of register values, .status holds the 0/err code'''
             if self._lspi is None:
                 return []
-            fRet = 0
 
             # Generate wData: [ 0,0,0,...0  ]: just clock through 0's
             wData   = [(0) for idx in range(nWords)]
 
-            # Num of words to be transmitted
-            Nwords = nWords
             # Set wFlag: if wordSize=4-8 bits then no need to manage word conversion
             if wordSize<4 or wordSize>16:
                 return -1
@@ -746,77 +1089,15 @@ class SPI(object):
             else:
                 wFlag=1
 
-            # Reset script
-            fRet += self._lspi.ni845xSpiScriptReset(self._cHdlScr)
-            # Enable SPI
-            fRet += self._lspi.ni845xSpiScriptEnableSPI(self._cHdlScr)
-
-            # Configure polarity and phase
-            fRet += self._lspi.ni845xSpiScriptClockPolarityPhase(self._cHdlScr, 0, 0)
-            # Configure clock rate
-            fRet += self._lspi.ni845xSpiScriptClockRate(self._cHdlScr, self.spiClk)
-            # Set CS0 HIGH
-            fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(0))
-            # Set CS1 HIGH
-            fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(1))
-
-            # SET CS0 LOW
-            fRet += self._lspi.ni845xSpiScriptCSLow(self._cHdlScr, c.c_uint32(0))
-
-            # *** START WRITE LOOP ***
-            idxRead= []                 # Array for read pointers
-            c_IdxRead = c.c_uint32()    # ctype for read pointer
-
-            fRet += self._lspi.ni845xSpiScriptNumBitsPerSample(self._cHdlScr, c.c_uint16(wordSize))
-
-            if wFlag==1:
-                # Transmit data as WORDS (2 bytes per write)
-                cWdata = (c.c_uint8*2)()   # ctype for write data array
-                cNumBytes = c.c_uint32(2)  # 2 bytes
-                for idx in range(Nwords):
-                    cWdata[0:2] = self.__word2bytes(wData[idx])
-                    fRet += self._lspi.ni845xSpiScriptWriteRead(self._cHdlScr, cNumBytes, c.byref(cWdata), c.byref(c_IdxRead))
-                    idxRead.append(c_IdxRead.value)
-
-            else:
-                cNumBytes=c.c_uint32(1)
-                for idx in range(Nwords):
-                    cWdata = c.c_uint8(wData[idx])
-                    fRet += self._lspi.ni845xSpiScriptWriteRead(self._cHdlScr, cNumBytes, c.byref(cWdata), c.byref(c_IdxRead))
-                    idxRead.append(c_IdxRead.value)
-
-
-            # Set CS0 HIGH
-            fRet += self._lspi.ni845xSpiScriptCSHigh(self._cHdlScr, c.c_uint32(0))
-
-
-            # Run script
-            fRet += self._lspi.ni845xSpiScriptRun(self._cHdlScr, self._cHdl, 0)
-
-            nRead = c.c_uint32()
-
-            rData = []
-            for pIdx in idxRead:
-
-                fRet += self._lspi.ni845xSpiScriptExtractReadDataSize(self._cHdlScr, c.c_uint32(pIdx), c.byref(nRead))
-
-                cRdata = (c.c_uint8 * nRead.value)()
-                fRet = self._lspi.ni845xSpiScriptExtractReadData(self._cHdlScr,c.c_uint32(pIdx), c.byref(cRdata))
-
-                rData += cRdata[0:nRead.value]
-
-            # Handle word translation if wFlag True
-            if wFlag==1:
-                wordArr = []
-                for idx in range(Nwords):
-                    wordArr.append(self.__bytes2word(rData[2*idx:2*idx+2]))
-            else:
-                wordArr=rData
+            # Prepared (cached) script: payload is always 0's so re-runs are free
+            wordArr, fRet = self.__runPrepared('read2', wData, wordSize, wFlag)
+            self.status = fRet
+            if self.recorder is not None:
+                self.recorder.record(OP_READ2, 0, wordSize, (nWords,), wordArr, fRet)
 
             return wordArr
 
 
-
     # --------------------------------------------------------------------------
     def ioWriteFBSmerc(self, addr=0, fbsLine=4):
         '''FBS selection on Mercury awmf-0123/0125
@@ -845,11 +1126,11 @@ class SPI(object):
         # Configure clock rate
         f.append(self._lspi.ni845xSpiScriptClockRate(self._cHdlScr, self.spiClk))
         # Set DIO Dx FBSen line HIGH
-        f.append(self._lspi.ni845xSpiScriptDioWriteLine(self._cHdlScr, c.c_uint8(0), c.c_uint8(fbsLine), c.c_int32(1)))
+        f.append(self._lspi.ni845xSpiScriptDioWriteLine(self._cHdlScr, 0, fbsLine, 1))
         # Wait
-        f.append(self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(1)))
+        f.append(self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, 1))
         # Set chunk size
-        f.append(self._lspi.ni845xSpiScriptNumBitsPerSample(self._cHdlScr, c.c_uint16(Nclks)))
+        f.append(self._lspi.ni845xSpiScriptNumBitsPerSample(self._cHdlScr, Nclks))
         c_IdxRead = c.c_uint32()
         if Nclks>8:
             cWdata = (c.c_uint8*2)()
@@ -864,9 +1145,9 @@ class SPI(object):
 
 
         # Wait
-        f.append(self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(1)))
+        f.append(self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, 1))
         # Set DIO Dx FBSen line LOW
-        f.append(self._lspi.ni845xSpiScriptDioWriteLine(self._cHdlScr, c.c_uint8(0), c.c_uint8(fbsLine), c.c_int32(0)))
+        f.append(self._lspi.ni845xSpiScriptDioWriteLine(self._cHdlScr, 0, fbsLine, 0))
 
 
         # Run script
@@ -901,17 +1182,19 @@ class SPI(object):
         f.append(self._lspi.ni845xSpiScriptClockRate(self._cHdlScr, self.spiClk))
         for nP in range(nPulses):
             # Set DIO Dx FBSen line HIGH
-            f.append(self._lspi.ni845xSpiScriptDioWriteLine(self._cHdlScr, c.c_uint8(0), c.c_uint8(dioLine), c.c_int32(1)))
+            f.append(self._lspi.ni845xSpiScriptDioWriteLine(self._cHdlScr, 0, dioLine, 1))
             # Wait
-            f.append(self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(pWidth)))
+            f.append(self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, pWidth))
             # Set DIO Dx FBSen line LOW
-            f.append(self._lspi.ni845xSpiScriptDioWriteLine(self._cHdlScr, c.c_uint8(0), c.c_uint8(dioLine), c.c_int32(0)))
+            f.append(self._lspi.ni845xSpiScriptDioWriteLine(self._cHdlScr, 0, dioLine, 0))
             # Wait
-            f.append(self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, c.c_uint8(1)))
+            f.append(self._lspi.ni845xSpiScriptUsDelay(self._cHdlScr, 1))
 
         # Run script
         f.append(self._lspi.ni845xSpiScriptRun(self._cHdlScr, self._cHdl, 0))
 
+        if self.recorder is not None:
+            self.recorder.record(OP_PULSE, dioLine, 0, (nPulses, pWidth), (), sum(f))
         return sum(f)
 
 
@@ -956,7 +1239,7 @@ def main():
         for p in range(230):
             wArr=range(p,p+27)
             rData = spi.ioWriteSPI(wArr)
-            if wArr != rData:
+            if list(wArr) != rData:
                 print( 'MOSI/MISO Error @ {0}'.format(p))
                 print( rData)
         print( '***    COMPLETE   ***\n')
@@ -967,8 +1250,8 @@ def main():
         print( '*** SPI2 LOOP TEST: 4bit word ***')
         for p in range(10):
             wArr=range(p,p+7)
-            rData = spi.ioWriteSPI2(wArr, 4)
-            if wArr != rData:
+            rData, fRet = spi.ioWriteSPI2(wArr, 4)
+            if list(wArr) != rData:
                 print( 'MOSI/MISO Error @ {0}'.format(p))
                 print( rData)
         print( 'Last iter:\t', rData)
@@ -980,8 +1263,8 @@ def main():
         print( '*** SPI2 LOOP TEST: 8bit word ***')
         for p in range(247):
             wArr=range(p,p+10)
-            rData = spi.ioWriteSPI2(wArr, 8)
-            if wArr != rData:
+            rData, fRet = spi.ioWriteSPI2(wArr, 8)
+            if list(wArr) != rData:
                 print( 'MOSI/MISO Error @ {0}'.format(p))
                 print( rData)
         print( 'Last iter:\t', rData)
@@ -993,8 +1276,8 @@ def main():
         print( '*** SPI2 LOOP TEST: 10bit word ***')
         for p in range(1015):
             wArr=range(p,p+10)
-            rData = spi.ioWriteSPI2(wArr, 10)
-            if wArr != rData:
+            rData, fRet = spi.ioWriteSPI2(wArr, 10)
+            if list(wArr) != rData:
                 print( 'MOSI/MISO Error @ {0}'.format(p))
                 print( rData)
         print( 'Last iter:\t', rData)
@@ -1006,8 +1289,8 @@ def main():
         print( '*** SPI2 LOOP TEST: 12bit word ***')
         for p in range(4079):
             wArr=range(p,p+18)
-            rData = spi.ioWriteSPI2(wArr, 12)
-            if wArr != rData:
+            rData, fRet = spi.ioWriteSPI2(wArr, 12)
+            if list(wArr) != rData:
                 print( 'MOSI/MISO Error @ {0}'.format(p))
                 print( rData)
         print( 'Last iter:\t', rData)
@@ -0,0 +1,121 @@
+#-------------------------------------------------------------------------------
+# Name:        ni8452 transaction metrics
+# Purpose:     Counters, per-phase latency histograms and an optional trace
+#              sink for the SPI transactions of one session
+#
+# Authors:      astreet and  Daskalakispiros
+#
+# Created:     25/04/2020
+# Copyright:   (c) astreet 2020
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+
+
+#-------------------------------------------------------------------------------
+# Usage
+#
+#   spi.metrics.snapshot()          # counters + per-phase latency summary
+#   spi.metrics.histogram('run')    # [(upper bound s, count), ...]
+#   spi.metrics.trace = records.append   # one dict per transaction
+#   spi.metrics.enabled = False     # no timing at all
+#
+# Phases of a transaction:
+#   build     script build (or prepared script lookup)
+#   run       ni845xSpiScriptRun (USB round trip + SPI clocking)
+#   extract   read back extraction and word reassembly
+#-------------------------------------------------------------------------------
+import bisect
+import time
+
+PHASES = ('build', 'run', 'extract')
+
+# Latency histogram bin upper bounds (s): 1us .. 1s, 4 bins per decade
+LATENCY_BINS = tuple(round(10 ** (e / 4.0), 12) for e in range(-24, 1))
+
+
+class Metrics(object):
+    '''Transaction metrics of one SPI session
+
+    counters:   transactions, frames, words, bitsClocked, bytesClocked,
+                scriptsBuilt, scriptsReused, errors
+    latency:    per phase histogram over LATENCY_BINS (+ overflow bin),
+                count/total/max seconds
+    trace:      None or a callable receiving one dict per transaction
+    '''
+
+    def __init__(self, enabled=True, bins=LATENCY_BINS):
+        self.enabled = enabled
+        self.bins = tuple(bins)
+        self.trace = None
+        self.clock = time.perf_counter
+        self.reset()
+
+    def reset(self):
+        '''Zero all counters and histograms'''
+        self.counters = dict.fromkeys(('transactions', 'frames', 'words', 'bitsClocked',
+                                       'bytesClocked', 'scriptsBuilt', 'scriptsReused', 'errors'), 0)
+        self._hist = dict((phase, [0] * (len(self.bins) + 1)) for phase in PHASES)
+        self._total = dict.fromkeys(PHASES, 0.0)
+        self._max = dict.fromkeys(PHASES, 0.0)
+        self._count = dict.fromkeys(PHASES, 0)
+
+    def observe(self, phase, seconds):
+        '''Adds one latency sample (s) of phase'''
+        self._hist[phase][bisect.bisect_left(self.bins, seconds)] += 1
+        self._total[phase] += seconds
+        self._count[phase] += 1
+        if seconds > self._max[phase]:
+            self._max[phase] = seconds
+
+    def transaction(self, kind, nWords, wordSize, tBuild, tRun, tExtract, fRet=0,
+                    frames=1, built=True, cs=None):
+        '''Records one SPI transaction: its word count/size, the three
+        phase times (s) and the status; forwards it to the trace sink'''
+        cnt = self.counters
+        cnt['transactions'] += 1
+        cnt['frames'] += frames
+        cnt['words'] += nWords
+        cnt['bitsClocked'] += nWords * wordSize
+        cnt['bytesClocked'] += nWords * (2 if wordSize > 8 else 1)
+        cnt['scriptsBuilt' if built else 'scriptsReused'] += 1
+        if fRet != 0:
+            cnt['errors'] += 1
+        self.observe('build', tBuild)
+        self.observe('run', tRun)
+        self.observe('extract', tExtract)
+        if self.trace is not None:
+            self.trace({'t': time.time(), 'kind': kind, 'cs': cs, 'frames': frames,
+                        'words': nWords, 'wordSize': wordSize, 'build': tBuild,
+                        'run': tRun, 'extract': tExtract, 'fRet': fRet, 'built': built})
+
+    def histogram(self, phase):
+        '''Returns [(bin upper bound s, count)] of phase; the last bound is inf'''
+        return list(zip(self.bins + (float('inf'),), self._hist[phase]))
+
+    def percentile(self, phase, q):
+        '''Returns the upper bound (s) of the bin holding the q (0-100)
+        percentile of phase, None without samples'''
+        n = self._count[phase]
+        if n == 0:
+            return None
+        rank = q / 100.0 * n
+        acc = 0
+        for bound, count in self.histogram(phase):
+            acc += count
+            if acc >= rank and count:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        '''Returns a dict of the counters and per-phase count/mean/max/p50/p99 (s)'''
+        out = dict(self.counters)
+        for phase in PHASES:
+            n = self._count[phase]
+            out[phase] = {'count': n,
+                          'total': self._total[phase],
+                          'mean': self._total[phase] / n if n else 0.0,
+                          'max': self._max[phase],
+                          'p50': self.percentile(phase, 50),
+                          'p99': self.percentile(phase, 99)}
+        return out
@@ -0,0 +1,132 @@
+#-------------------------------------------------------------------------------
+# Name:        ni8452 device manager
+# Purpose:     Enumerates all NI-845x adapters and drives one AwmfCommander
+#              per adapter in parallel (one I/O thread per device)
+#
+# Authors:      astreet and  Daskalakispiros
+#
+# Created:     25/04/2020
+# Copyright:   (c) astreet 2020
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+
+
+#-------------------------------------------------------------------------------
+# Usage
+#
+#   with DeviceManager() as mgr:
+#       mgr.open()                                   # all adapters found
+#       mgr.broadcast('init_BF', RX_MODE)            # every panel in parallel
+#       mgr.dispatch({name: ('set_beam', (phases,), {}) for name in mgr.devices})
+#       mgr[name].set_channel_phase(ELEMENT_1_a, 12) # direct (caller's thread)
+#
+# Each device gets an AwmfCommander.bind() subclass (own SPI session, shadow
+# registers and CS map) and a DeviceWorker thread; calls of one device run in
+# order, calls of different devices overlap (ctypes releases the GIL during
+# the DLL calls).
+#-------------------------------------------------------------------------------
+from collections import OrderedDict
+
+from Example2.fake_spiwrite import AwmfCommander, SpiInitException
+from Example2.ni8452aio import DeviceWorker
+from Example2.ni8452io import SPI
+from Example2.ni845xlib import loadLibrary
+
+
+class DeviceManager(object):
+    '''Sessions to several NI-845x adapters
+
+    backend:    Ni845x library shared by all sessions, see ni845xlib.loadLibrary()
+    commander:  AwmfCommander class bound once per device
+    maxQueue:   bound of each device's command queue
+    '''
+
+    def __init__(self, backend=None, commander=AwmfCommander, maxQueue=64):
+        # Resolve once so every session uses the same library object
+        self.backend = loadLibrary(backend)
+        self.commander = commander
+        self.maxQueue = maxQueue
+        self.devices = OrderedDict()     # resource name -> bound commander
+        self._workers = {}               # resource name -> DeviceWorker
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excVal, tb):
+        self.close()
+
+    def __getitem__(self, name):
+        return self.devices[self.__key(name)]
+
+    def __key(self, name):
+        if isinstance(name, str):
+            name = name.encode()
+        return name
+
+    def discover(self):
+        '''Returns the resource names (bytes) of all connected adapters'''
+        names, fRet = SPI(self.backend).ioFindDevices()
+        if fRet != 0:
+            raise SpiInitException(fRet, "ioFindDevices()")
+        return names
+
+    def open(self, resources=None):
+        '''Opens and initialises a session per resource (default: all found),
+        in parallel. Returns the list of opened resource names'''
+        if resources is None:
+            resources = self.discover()
+        futures = []
+        for name in resources:
+            name = self.__key(name)
+            if name in self.devices:
+                continue
+            cmd = self.commander.bind(name="%s[%s]" % (self.commander.__name__, name.decode()))
+            worker = DeviceWorker('ni8452-io-%s' % name.decode(), self.maxQueue)
+            self.devices[name] = cmd
+            self._workers[name] = worker
+            futures.append((name, worker.submit(cmd.initSpi, name, self.backend)))
+
+        opened = []
+        errors = []
+        for name, f in futures:
+            try:
+                f.result()
+                opened.append(name)
+            except SpiInitException as e:
+                errors.append(e)
+                self._workers.pop(name).stop()
+                del self.devices[name]
+        if errors:
+            raise errors[0]
+        return opened
+
+    def submit(self, name, method, *args, **kwargs):
+        '''Queues a call on device name's I/O thread; returns a concurrent.futures.Future.
+        method: commander method name, or a callable called as method(commander, ...)'''
+        name = self.__key(name)
+        cmd = self.devices[name]
+        fn = getattr(cmd, method) if isinstance(method, str) else (lambda *a, **k: method(cmd, *a, **k))
+        return self._workers[name].submit(fn, *args, **kwargs)
+
+    def dispatch(self, jobs):
+        '''Runs one call per device in parallel and waits for all.
+        jobs: {name: (method, args, kwargs)}. Returns {name: result};
+        the first exception raised by a device is re-raised'''
+        futures = OrderedDict((self.__key(name), self.submit(name, method, *args, **kwargs))
+                              for name, (method, args, kwargs) in jobs.items())
+        return OrderedDict((name, f.result()) for name, f in futures.items())
+
+    def broadcast(self, method, *args, **kwargs):
+        '''Runs the same call on every device in parallel; returns {name: result}'''
+        return self.dispatch(OrderedDict((name, (method, args, kwargs)) for name in self.devices))
+
+    def close(self):
+        '''Stops the I/O threads and closes all sessions'''
+        for name in list(self.devices):
+            worker = self._workers.pop(name)
+            try:
+                worker.submit(self.devices[name].closeSPI).result()
+            finally:
+                worker.stop()
+                del self.devices[name]
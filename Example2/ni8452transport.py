@@ -0,0 +1,165 @@
+#-------------------------------------------------------------------------------
+# Name:        ni8452 SPI transports
+# Purpose:     One transfer interface over the two NI-845x SPI paths (script
+#              engine and ni845xSpiWriteRead), chosen per transaction
+#
+# Authors:      astreet and  Daskalakispiros
+#
+# Created:     25/04/2020
+# Copyright:   (c) astreet 2020
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+
+
+#-------------------------------------------------------------------------------
+# Usage
+#
+#   bus = AutoTransport(spi)                         # spi opened/initialised SPI()
+#   rData, fRet = bus.transfer(words, 10, cs=2, framing=FRAMING_PULSE)
+#   rData, fRet = bus.read(4, 8, cs=3)               # plain read: clocks 0's
+#   bus.costs()                                      # learned cost per path
+#
+# Framing of a transaction:
+#   FRAMING_PLAIN   one CS frame around the data
+#   FRAMING_PULSE   CS LOW/HIGH/LOW before the data (ioWriteSPI4, AWMF)
+#   FRAMING_LDB     CS0 frame then LDB strobe on CS1 (ioWriteSPI2)
+#
+# ScriptTransport does every framing (script build + run, one USB round trip
+# per run; prepared scripts make repeated payloads cheap). WriteReadTransport
+# only does plain frames, but needs no script (ni845xSpiWriteRead with a
+# cached configuration handle). Both send the same plain frame on the bus,
+# so a transaction does not depend on the path it is given to. AutoTransport keeps a moving average of the
+# measured time of each path per (word size, payload size class), tries an
+# unmeasured path first and re-measures the slower one now and then.
+#-------------------------------------------------------------------------------
+import abc
+import time
+
+FRAMING_PLAIN = 'plain'
+FRAMING_PULSE = 'pulse'
+FRAMING_LDB = 'ldb'
+
+
+class Transport(abc.ABC):
+    '''SPI transfer path of an opened SPI session (subclasses implement transfer)'''
+
+    name = ''
+    framings = ()
+
+    def __init__(self, spi):
+        self.spi = spi
+
+    def supports(self, nWords, wordSize, cs=0, framing=FRAMING_PLAIN):
+        '''True if this path can run the transaction'''
+        return framing in self.framings and 4 <= wordSize <= 16 and nWords > 0
+
+    @abc.abstractmethod
+    def transfer(self, wData, wordSize=10, cs=0, framing=FRAMING_PLAIN):
+        '''Clocks wData out on cs; returns (read back words, fRet)'''
+
+    def read(self, nWords, wordSize=8, cs=0):
+        '''Plain read: clocks out nWords 0's; returns (read back words, fRet)'''
+        return self.transfer([0] * nWords, wordSize, cs, FRAMING_PLAIN)
+
+
+class ScriptTransport(Transport):
+    '''Script engine path: ioWritePlain (plain framing), ioWriteSPI4 (CS
+    pulse framing) or ioWriteSPI2 (LDB framing, CS0 only)'''
+
+    name = 'script'
+    framings = (FRAMING_PLAIN, FRAMING_PULSE, FRAMING_LDB)
+
+    def supports(self, nWords, wordSize, cs=0, framing=FRAMING_PLAIN):
+        if framing == FRAMING_LDB and cs != 0:
+            return False
+        return Transport.supports(self, nWords, wordSize, cs, framing)
+
+    def transfer(self, wData, wordSize=10, cs=0, framing=FRAMING_PLAIN):
+        if framing == FRAMING_LDB:
+            return self.spi.ioWriteSPI2(wData, wordSize)
+        if framing == FRAMING_PULSE:
+            return self.spi.ioWriteSPI4(wData, wordSize, cs)
+        return self.spi.ioWritePlain(wData, wordSize, cs)
+
+
+class WriteReadTransport(Transport):
+    '''Configuration handle path: SPI.ioWriteRead() (ni845xSpiWriteRead)'''
+
+    name = 'writeread'
+    framings = (FRAMING_PLAIN,)
+
+    def transfer(self, wData, wordSize=10, cs=0, framing=FRAMING_PLAIN):
+        return self.spi.ioWriteRead(wData, wordSize, cs)
+
+
+class AutoTransport(Transport):
+    '''Runs each transaction on the cheapest capable path
+
+    transports:  candidate paths (default: script and writeread on spi)
+    alpha:       weight of a new measurement in the moving average
+    explore:     re-measure the other paths of a class every explore transactions
+    '''
+
+    name = 'auto'
+    framings = (FRAMING_PLAIN, FRAMING_PULSE, FRAMING_LDB)
+
+    def __init__(self, spi, transports=None, alpha=0.2, explore=64):
+        Transport.__init__(self, spi)
+        if transports is None:
+            transports = (ScriptTransport(spi), WriteReadTransport(spi))
+        self.transports = tuple(transports)
+        self.alpha = alpha
+        self.explore = explore
+        self.clock = time.perf_counter
+        self.reset()
+
+    def reset(self):
+        '''Forgets the measured costs'''
+        self._cost = {}         # (path, wordSize, size class) -> average s
+        self._seen = {}         # (wordSize, size class) -> transactions
+        self.counts = dict((t.name, 0) for t in self.transports)
+
+    def supports(self, nWords, wordSize, cs=0, framing=FRAMING_PLAIN):
+        return any(t.supports(nWords, wordSize, cs, framing) for t in self.transports)
+
+    def choose(self, nWords, wordSize, cs=0, framing=FRAMING_PLAIN):
+        '''Returns the transport the transaction would run on'''
+        paths = [t for t in self.transports if t.supports(nWords, wordSize, cs, framing)]
+        if not paths:
+            raise ValueError("No transport for %d x %d bit words, framing %s" % (nWords, wordSize, framing))
+        if len(paths) == 1:
+            return paths[0]
+
+        cls = (wordSize, nWords.bit_length())
+        costs = [self._cost.get((t.name,) + cls) for t in paths]
+        if None in costs:
+            return paths[costs.index(None)]
+        best = min(range(len(paths)), key=costs.__getitem__)
+        n = self._seen.get(cls, 0)
+        if self.explore and n % self.explore == self.explore - 1:
+            # Refresh one of the slower paths
+            others = [i for i in range(len(paths)) if i != best]
+            return paths[others[(n // self.explore) % len(others)]]
+        return paths[best]
+
+    def transfer(self, wData, wordSize=10, cs=0, framing=FRAMING_PLAIN):
+        nWords = len(wData)
+        path = self.choose(nWords, wordSize, cs, framing)
+        t0 = self.clock()
+        rData, fRet = path.transfer(wData, wordSize, cs, framing)
+        dt = self.clock() - t0
+
+        cls = (wordSize, nWords.bit_length())
+        self._seen[cls] = self._seen.get(cls, 0) + 1
+        self.counts[path.name] += 1
+        if fRet == 0:
+            key = (path.name,) + cls
+            old = self._cost.get(key)
+            self._cost[key] = dt if old is None else old + self.alpha * (dt - old)
+        return rData, fRet
+
+    def costs(self):
+        '''Returns {(path, wordSize, size class): average seconds}; size class
+        n covers payloads of 2**(n-1) .. 2**n - 1 words'''
+        return dict(self._cost)
@@ -0,0 +1,142 @@
+#-------------------------------------------------------------------------------
+# Name:        ni8452 SPI clock tuning
+# Purpose:     Finds the fastest error free SPI clock rate per word size and
+#              cable setup from MOSI/MISO loopback bit error rates
+#
+# Authors:      astreet and  Daskalakispiros
+#
+# Created:     25/04/2020
+# Copyright:   (c) astreet 2020
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+
+
+#-------------------------------------------------------------------------------
+# Usage (MISO jumpered to MOSI, CS line cs unused by any chip)
+#
+#   results = tune(spi, wordSizes=(8, 10), setup='panelA-2m', store=ClockStore())
+#   AwmfCommander.initSpi(spiClk=tuned_clock('panelA-2m', 10))
+#
+# For each word size the rates are tried in increasing order; every rate
+# clocks LOOPBACK patterns (walking ones/zeros, 0x55/0xAA, all ones, pseudo
+# random) `repeats` times and counts the bits read back wrong. The sweep of a
+# word size stops after `stopAfter` rates with errors; the fastest rate below
+# the first error is stored. The session clock is restored afterwards.
+#
+# Emulator: Ni845xEmulator(model=NoisyLoopbackModel(maxClock=4000))
+#-------------------------------------------------------------------------------
+import json
+import os
+import random
+import time
+
+# Candidate rates (kHz) of the NI USB-8452
+CLOCK_RATES = (1000, 2000, 3125, 4000, 5000, 6250, 8000, 10000, 12500, 16000,
+               20000, 25000, 33333, 50000)
+
+# Tuning results {setup: {wordSize: {...}}}
+CLOCK_STORE = os.path.join(os.path.expanduser('~'), '.ni8452_clock.json')
+
+
+def loopback_patterns(wordSize, nWords=64, seed=0x8452):
+    '''Returns the list of test patterns (lists of nWords wordSize words)'''
+    mask = (1 << wordSize) - 1
+    alt = int('01' * 8, 2) & mask
+    rng = random.Random(seed)
+    return [
+        [(1 << (i % wordSize)) for i in range(nWords)],              # walking one
+        [mask ^ (1 << (i % wordSize)) for i in range(nWords)],       # walking zero
+        [alt if i % 2 else mask ^ alt for i in range(nWords)],       # 0x55/0xAA
+        [mask] * nWords,                                              # all ones
+        [rng.getrandbits(wordSize) for i in range(nWords)],          # random
+    ]
+
+
+def measure(spi, spiClk, wordSize=8, cs=0, nWords=64, repeats=4, patterns=None):
+    '''Runs the loopback patterns at spiClk (kHz) on line cs
+    Returns dict: spiClk, wordSize, bits, bitErrors, ber, seconds,
+    throughput (payload bits/s, incl. USB overhead), fRet'''
+    if patterns is None:
+        patterns = loopback_patterns(wordSize, nWords)
+    spi.ioSetClock(spiClk)
+    bits = errors = fRet = 0
+    t0 = time.perf_counter()
+    for rep in range(repeats):
+        for wData in patterns:
+            rData, f = spi.ioWriteSPI4(wData, wordSize, cs)
+            fRet += f
+            bits += wordSize * len(wData)
+            if len(rData) != len(wData):
+                errors += wordSize * len(wData)
+                continue
+            for w, r in zip(wData, rData):
+                errors += bin(w ^ r).count('1')
+    seconds = time.perf_counter() - t0
+    return {'spiClk': spiClk, 'wordSize': wordSize, 'bits': bits, 'bitErrors': errors,
+            'ber': errors / float(bits) if bits else 0.0, 'seconds': seconds,
+            'throughput': bits / seconds if seconds > 0 else 0.0, 'fRet': fRet}
+
+
+def tune(spi, wordSizes=(8, 10), rates=CLOCK_RATES, setup='default', cs=0,
+         nWords=64, repeats=4, stopAfter=1, store=None):
+    '''Sweeps rates for each word size (see notes above)
+    store:  ClockStore the best rates are saved to (None: not saved)
+    Returns {wordSize: {'best': result of the fastest error free rate or None,
+                        'sweep': [measure() results]}}'''
+    spiClk = spi.spiClk
+    out = {}
+    try:
+        for wordSize in wordSizes:
+            patterns = loopback_patterns(wordSize, nWords)
+            sweep = []
+            best = None
+            failed = 0
+            for rate in sorted(rates):
+                res = measure(spi, rate, wordSize, cs, nWords, repeats, patterns)
+                sweep.append(res)
+                if res['bitErrors'] == 0 and res['fRet'] == 0 and failed == 0:
+                    best = res
+                elif res['bitErrors'] or res['fRet']:
+                    failed += 1
+                    if failed >= stopAfter:
+                        break
+            out[wordSize] = {'best': best, 'sweep': sweep}
+            if store is not None and best is not None:
+                store.set(setup, wordSize, best)
+    finally:
+        spi.ioSetClock(spiClk)
+    if store is not None:
+        store.save()
+    return out
+
+
+class ClockStore(object):
+    '''JSON file of the tuned clock rates per cable setup and word size'''
+
+    def __init__(self, fSpec=CLOCK_STORE):
+        self.fSpec = fSpec
+        self.data = {}
+        if fSpec and os.path.exists(fSpec):
+            with open(fSpec) as f:
+                self.data = json.load(f)
+
+    def get(self, setup='default', wordSize=10, default=1000):
+        '''Returns the tuned spiClk (kHz) of setup/wordSize, default if not tuned'''
+        entry = self.data.get(setup, {}).get(str(wordSize))
+        return default if entry is None else entry['spiClk']
+
+    def set(self, setup, wordSize, result):
+        '''Records a measure() result as the tuned rate of setup/wordSize'''
+        self.data.setdefault(setup, {})[str(wordSize)] = {
+            'spiClk': result['spiClk'], 'ber': result['ber'], 'bits': result['bits'],
+            'throughput': result['throughput'], 'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+    def save(self):
+        with open(self.fSpec, 'w') as f:
+            json.dump(self.data, f, indent=2, sort_keys=True)
+
+
+def tuned_clock(setup='default', wordSize=10, default=1000, fSpec=CLOCK_STORE):
+    '''Tuned spiClk (kHz) of setup/wordSize from the clock store, default if none'''
+    return ClockStore(fSpec).get(setup, wordSize, default)
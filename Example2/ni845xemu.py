@@ -0,0 +1,664 @@
+#-------------------------------------------------------------------------------
+# Name:        ni845x emulator
+# Purpose:     Pure-Python stand-in for Ni845x.dll so the SPI stack runs
+#              (and can be benchmarked) on hosts without the adapter
+#
+# Authors:      astreet and  Daskalakispiros
+#
+# Created:     25/04/2020
+# Copyright:   (c) astreet 2020
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+
+
+#-------------------------------------------------------------------------------
+# Emulator notes
+#
+# Ni845xEmulator exposes the ni845x* entry points used by SPI (ni8452io.py)
+# and NI8452Interface (NI845x.py) as python methods with the C argument
+# order.  Arguments may be ctypes instances, byref() objects or plain ints,
+# exactly as the callers pass them to the real DLL.
+#
+# MISO data comes from a bus model (LoopbackModel by default: MISO wired to
+# MOSI; NoisyLoopbackModel: loopback with bit errors above a clock rate;
+# AwmfModel: AWMF register files with read back).  Time is accounted
+# in a virtual clock (.elapsed, seconds) using a simple USB round-trip + SPI
+# clock model; realTime=True also sleeps for it.
+#-------------------------------------------------------------------------------
+import ctypes as c
+import random
+import time
+
+
+# Emulator status codes (negative = error, as the DLL)
+EMU_SUCCESS          = 0
+EMU_ERR_NO_DEVICE    = -301
+EMU_ERR_BAD_HANDLE   = -302
+EMU_ERR_BAD_PARAM    = -303
+EMU_ERR_BAD_SCRIPT   = -304
+
+_ERR_STRINGS = {
+    EMU_SUCCESS:        b'Success (emulator)',
+    EMU_ERR_NO_DEVICE:  b'No NI 845x device found (emulator)',
+    EMU_ERR_BAD_HANDLE: b'Invalid handle (emulator)',
+    EMU_ERR_BAD_PARAM:  b'Invalid parameter (emulator)',
+    EMU_ERR_BAD_SCRIPT: b'Invalid script read index (emulator)',
+}
+
+DEFAULT_RESOURCE = b'USB0::0x3923::0x7514::01EMU000::RAW'
+# realTime: time left to a _spend() deadline that is spun rather than slept (s)
+SPIN_TIME = 100e-6
+
+
+# ------------------------------------------------------------------------------
+# ctypes argument helpers
+# ------------------------------------------------------------------------------
+def _obj(arg):
+    '''Returns the ctypes object behind a byref() argument'''
+    return getattr(arg, '_obj', arg)
+
+
+def _val(arg):
+    '''Returns int value of a ctypes scalar (or int)'''
+    arg = _obj(arg)
+    if hasattr(arg, 'value'):
+        return arg.value
+    return int(arg)
+
+
+def _setVal(arg, value):
+    '''Stores value into the scalar (or first element) behind a pointer arg'''
+    o = _obj(arg)
+    if hasattr(o, 'value'):
+        o.value = value
+    else:
+        o[0] = value
+
+
+def _readBytes(arg, nBytes):
+    '''Returns nBytes (bytes) read from the buffer behind a pointer arg'''
+    if isinstance(arg, (bytes, bytearray)):
+        return bytes(arg[:nBytes])
+    return c.string_at(c.addressof(_obj(arg)), nBytes)
+
+
+def _writeBytes(arg, data):
+    '''Copies data (bytes) into the buffer behind a pointer arg'''
+    if len(data):
+        c.memmove(c.addressof(_obj(arg)), bytes(data), len(data))
+
+
+def _readString(arg):
+    '''Returns a NUL terminated resource name from a char buffer or bytes'''
+    if isinstance(arg, bytes):
+        return arg.split(b'\0', 1)[0]
+    return c.string_at(c.addressof(_obj(arg))).split(b'\0', 1)[0]
+
+
+# ------------------------------------------------------------------------------
+# BUS MODELS
+# ------------------------------------------------------------------------------
+class LoopbackModel(object):
+    '''MISO wired to MOSI: every sample reads back what was clocked out'''
+
+    def select(self, cs):
+        pass
+
+    def deselect(self, cs):
+        pass
+
+    def transfer(self, cs, numBits, value):
+        '''Clock numBits of value out on MOSI; returns the MISO value'''
+        return value
+
+
+class NoisyLoopbackModel(LoopbackModel):
+    '''Loopback with a clock dependent bit error model (e.g. a long cable):
+    error free up to maxClock (kHz), above it each bit is flipped with
+    probability berSlope * (clockRate / maxClock - 1), at most 0.5.
+    The emulator reports the clock rate of each transfer via setClock()'''
+
+    def __init__(self, maxClock=4000, berSlope=1e-3, seed=None):
+        self.maxClock  = maxClock
+        self.berSlope  = berSlope
+        self.clockRate = 1000
+        self._rng      = random.Random(seed)
+
+    def setClock(self, clockRate):
+        self.clockRate = clockRate
+
+    def ber(self, clockRate):
+        '''Bit error probability at clockRate (kHz)'''
+        if clockRate <= self.maxClock:
+            return 0.0
+        return min(0.5, self.berSlope * (clockRate / float(self.maxClock) - 1))
+
+    def transfer(self, cs, numBits, value):
+        p = self.ber(self.clockRate)
+        if p > 0:
+            rng = self._rng
+            for bit in range(numBits):
+                if rng.random() < p:
+                    value ^= 1 << bit
+        return value
+
+
+class AwmfModel(object):
+    '''One AWMF-0132/0133 register file per CS line (no daisy chains).
+    A 60 bit frame (address bits 48-55, data bits 0-47) is latched when CS
+    goes HIGH. A read request (address READ_ADDR, data = register address)
+    makes the NEXT frame shift out that register's data; other frames shift
+    out .telemetry[cs] (default 0). Several CS lines LOW = broadcast write,
+    MISO of the lowest line'''
+
+    READ_ADDR = 0x3D
+    FRAME_BITS = 60
+
+    def __init__(self):
+        self.regs      = {}         # cs -> {address: data}
+        self.telemetry = {}         # cs -> 60 bit MISO word of normal frames
+        self._pending  = {}         # cs -> register address to shift out
+        self._acc      = {}         # cs -> [shifted in value, bits, MISO value]
+
+    def select(self, cs):
+        if cs in self._pending:
+            out = self.regs.get(cs, {}).get(self._pending[cs], 0)
+        else:
+            out = self.telemetry.get(cs, 0)
+        self._acc[cs] = [0, 0, out]
+
+    def deselect(self, cs):
+        value, bits, out = self._acc.pop(cs, (0, 0, 0))
+        if bits == 0:
+            return
+        self._pending.pop(cs, None)
+        if bits != self.FRAME_BITS:
+            return
+        address = (value >> 48) & 0xff
+        data = value & ((1 << 48) - 1)
+        if address == self.READ_ADDR:
+            self._pending[cs] = data & 0xff
+        else:
+            self.regs.setdefault(cs, {})[address] = data
+
+    def transfer(self, cs, numBits, value):
+        rVal = None
+        for line in sorted(cs):
+            acc = self._acc.get(line)
+            if acc is None:
+                continue
+            acc[0] = (acc[0] << numBits) | value
+            acc[1] += numBits
+            shift = self.FRAME_BITS - acc[1]
+            word = (acc[2] >> shift) if shift >= 0 else 0
+            if rVal is None:
+                rVal = word & ((1 << numBits) - 1)
+        return rVal or 0
+
+
+class _Device(object):
+    def __init__(self, name):
+        self.name       = name
+        self.ioVoltage  = 33
+        self.timeout    = 30000
+        self.dioPort    = {}        # port -> value
+        self.dioDir     = {}        # port -> direction map
+        self.csLow      = set()     # CS lines currently asserted
+
+
+class _Script(object):
+    def __init__(self):
+        self.cmds     = []
+        self.readData = {}          # read index -> bytes
+
+
+class _Config(object):
+    def __init__(self):
+        self.chipSelect    = 0
+        self.clockPhase    = 0
+        self.clockPolarity = 0
+        self.clockRate     = 1000
+        self.numBits       = 8
+        self.port          = 0
+
+
+class _Find(object):
+    def __init__(self, names):
+        self.names = list(names)
+        self.pos   = 1
+
+
+# ------------------------------------------------------------------------------
+# EMULATOR
+# ------------------------------------------------------------------------------
+class Ni845xEmulator(object):
+    '''In-process emulation of Ni845x.dll
+
+    resources:   list of resource names reported by ni845xFindDevice
+    usbLatency:  seconds per USB round trip (script run, port write, ...)
+    cmdTime:     seconds of adapter time per script command
+    realTime:    also sleep for the modelled time (default: virtual only)
+    model:       bus model (select/deselect/transfer), default LoopbackModel
+    '''
+
+    def __init__(self, resources=None, usbLatency=500e-6, cmdTime=2e-6,
+                 realTime=False, model=None):
+        if resources is None:
+            resources = [DEFAULT_RESOURCE]
+        self.resources  = [r if isinstance(r, bytes) else r.encode() for r in resources]
+        self.usbLatency = usbLatency
+        self.cmdTime    = cmdTime
+        self.realTime   = realTime
+        self.model      = model if model is not None else LoopbackModel()
+
+        # Virtual clock (s) and counters
+        self.elapsed    = 0.0
+        self.nRuns      = 0
+        self.nBits      = 0
+
+        self._handles    = {}
+        self._nextHandle = 0x1000
+
+    # --------------------------------------------------------------------------
+    # HELPERS
+    # --------------------------------------------------------------------------
+    def _newHandle(self, obj, pHandle):
+        hdl = self._nextHandle
+        self._nextHandle += 1
+        self._handles[hdl] = obj
+        _setVal(pHandle, hdl)
+        return EMU_SUCCESS
+
+    def _get(self, handle, cls):
+        obj = self._handles.get(_val(handle))
+        if isinstance(obj, cls):
+            return obj
+        return None
+
+    def _spend(self, seconds):
+        '''Advance the virtual clock (and sleep when realTime: time.sleep()
+        releases the GIL for other device threads, only the last
+        SPIN_TIME is spun for precision)'''
+        self.elapsed += seconds
+        if self.realTime and seconds > 0:
+            tEnd = time.perf_counter() + seconds
+            if seconds > SPIN_TIME:
+                time.sleep(seconds - SPIN_TIME)
+            while time.perf_counter() < tEnd:
+                pass
+
+    def _clock(self, numBits, clockRate):
+        '''Returns seconds to clock numBits at clockRate (kHz)'''
+        self.nBits += numBits
+        return numBits / (clockRate * 1e3)
+
+    def resetClock(self):
+        '''Zero the virtual clock and counters'''
+        self.elapsed = 0.0
+        self.nRuns   = 0
+        self.nBits   = 0
+
+    # --------------------------------------------------------------------------
+    # DEVICE
+    # --------------------------------------------------------------------------
+    def ni845xFindDevice(self, pFirstDevice, pFindDeviceHandle, pNumberFound):
+        _setVal(pNumberFound, len(self.resources))
+        if not self.resources:
+            return EMU_ERR_NO_DEVICE
+        _writeBytes(pFirstDevice, self.resources[0] + b'\0')
+        return self._newHandle(_Find(self.resources), pFindDeviceHandle)
+
+    def ni845xFindDeviceNext(self, FindDeviceHandle, pNextDevice):
+        find = self._get(FindDeviceHandle, _Find)
+        if find is None:
+            return EMU_ERR_BAD_HANDLE
+        if find.pos >= len(find.names):
+            return EMU_ERR_NO_DEVICE
+        _writeBytes(pNextDevice, find.names[find.pos] + b'\0')
+        find.pos += 1
+        return EMU_SUCCESS
+
+    def ni845xCloseFindDeviceHandle(self, FindDeviceHandle):
+        if self._get(FindDeviceHandle, _Find) is None:
+            return EMU_ERR_BAD_HANDLE
+        del self._handles[_val(FindDeviceHandle)]
+        return EMU_SUCCESS
+
+    def ni845xOpen(self, pResourceName, pDeviceHandle):
+        name = _readString(pResourceName)
+        if name not in self.resources:
+            return EMU_ERR_NO_DEVICE
+        self._spend(self.usbLatency)
+        return self._newHandle(_Device(name), pDeviceHandle)
+
+    def ni845xClose(self, DeviceHandle):
+        if self._get(DeviceHandle, _Device) is None:
+            return EMU_ERR_BAD_HANDLE
+        del self._handles[_val(DeviceHandle)]
+        return EMU_SUCCESS
+
+    def ni845xSetIoVoltageLevel(self, DeviceHandle, VoltageLevel):
+        dev = self._get(DeviceHandle, _Device)
+        if dev is None:
+            return EMU_ERR_BAD_HANDLE
+        dev.ioVoltage = _val(VoltageLevel)
+        self._spend(self.usbLatency)
+        return EMU_SUCCESS
+
+    def ni845xSetTimeout(self, DeviceHandle, Timeout):
+        dev = self._get(DeviceHandle, _Device)
+        if dev is None:
+            return EMU_ERR_BAD_HANDLE
+        dev.timeout = _val(Timeout)
+        return EMU_SUCCESS
+
+    def ni845xStatusToString(self, StatusCode, MaxSize, pStatusString):
+        msg = _ERR_STRINGS.get(_val(StatusCode), b'Unknown status (emulator)')
+        msg = msg[:max(_val(MaxSize) - 1, 0)]
+        _writeBytes(pStatusString, msg + b'\0')
+
+    # --------------------------------------------------------------------------
+    # DIO
+    # --------------------------------------------------------------------------
+    def ni845xDioSetPortLineDirectionMap(self, DeviceHandle, PortNumber, Map):
+        dev = self._get(DeviceHandle, _Device)
+        if dev is None:
+            return EMU_ERR_BAD_HANDLE
+        dev.dioDir[_val(PortNumber)] = _val(Map)
+        self._spend(self.usbLatency)
+        return EMU_SUCCESS
+
+    def ni845xDioWritePort(self, DeviceHandle, PortNumber, WriteData):
+        dev = self._get(DeviceHandle, _Device)
+        if dev is None:
+            return EMU_ERR_BAD_HANDLE
+        dev.dioPort[_val(PortNumber)] = _val(WriteData) & 0xff
+        self._spend(self.usbLatency)
+        return EMU_SUCCESS
+
+    def ni845xDioReadPort(self, DeviceHandle, PortNumber, pReadData):
+        dev = self._get(DeviceHandle, _Device)
+        if dev is None:
+            return EMU_ERR_BAD_HANDLE
+        _setVal(pReadData, dev.dioPort.get(_val(PortNumber), 0))
+        self._spend(self.usbLatency)
+        return EMU_SUCCESS
+
+    def ni845xDioWriteLine(self, DeviceHandle, PortNumber, LineNumber, WriteData):
+        dev = self._get(DeviceHandle, _Device)
+        if dev is None:
+            return EMU_ERR_BAD_HANDLE
+        self._dioLine(dev, _val(PortNumber), _val(LineNumber), _val(WriteData))
+        self._spend(self.usbLatency)
+        return EMU_SUCCESS
+
+    def ni845xDioReadLine(self, DeviceHandle, PortNumber, LineNumber, pReadData):
+        dev = self._get(DeviceHandle, _Device)
+        if dev is None:
+            return EMU_ERR_BAD_HANDLE
+        port = dev.dioPort.get(_val(PortNumber), 0)
+        _setVal(pReadData, (port >> _val(LineNumber)) & 1)
+        self._spend(self.usbLatency)
+        return EMU_SUCCESS
+
+    @staticmethod
+    def _dioLine(dev, port, line, value):
+        pVal = dev.dioPort.get(port, 0)
+        if value:
+            pVal |= (1 << line)
+        else:
+            pVal &= ~(1 << line)
+        dev.dioPort[port] = pVal & 0xff
+
+    # --------------------------------------------------------------------------
+    # SPI SCRIPT
+    # --------------------------------------------------------------------------
+    def ni845xSpiScriptOpen(self, pScriptHandle):
+        return self._newHandle(_Script(), pScriptHandle)
+
+    def ni845xSpiScriptClose(self, ScriptHandle):
+        if self._get(ScriptHandle, _Script) is None:
+            return EMU_ERR_BAD_HANDLE
+        del self._handles[_val(ScriptHandle)]
+        return EMU_SUCCESS
+
+    def _addCmd(self, ScriptHandle, *cmd):
+        scr = self._get(ScriptHandle, _Script)
+        if scr is None:
+            return EMU_ERR_BAD_HANDLE
+        scr.cmds.append(cmd)
+        return EMU_SUCCESS
+
+    def ni845xSpiScriptReset(self, ScriptHandle):
+        scr = self._get(ScriptHandle, _Script)
+        if scr is None:
+            return EMU_ERR_BAD_HANDLE
+        scr.cmds = []
+        scr.readData = {}
+        return EMU_SUCCESS
+
+    def ni845xSpiScriptEnableSPI(self, ScriptHandle):
+        return self._addCmd(ScriptHandle, 'enable')
+
+    def ni845xSpiScriptDisableSPI(self, ScriptHandle):
+        return self._addCmd(ScriptHandle, 'disable')
+
+    def ni845xSpiScriptClockPolarityPhase(self, ScriptHandle, ClockPolarity, ClockPhase):
+        return self._addCmd(ScriptHandle, 'polpha', _val(ClockPolarity), _val(ClockPhase))
+
+    def ni845xSpiScriptClockRate(self, ScriptHandle, ClockRate):
+        rate = _val(ClockRate)
+        if rate <= 0:
+            return EMU_ERR_BAD_PARAM
+        return self._addCmd(ScriptHandle, 'clk', rate)
+
+    def ni845xSpiScriptCSHigh(self, ScriptHandle, ChipSelectNum):
+        return self._addCmd(ScriptHandle, 'cshigh', _val(ChipSelectNum))
+
+    def ni845xSpiScriptCSLow(self, ScriptHandle, ChipSelectNum):
+        return self._addCmd(ScriptHandle, 'cslow', _val(ChipSelectNum))
+
+    def ni845xSpiScriptNumBitsPerSample(self, ScriptHandle, NumBitsPerSample):
+        nBits = _val(NumBitsPerSample)
+        if nBits < 1 or nBits > 64:
+            return EMU_ERR_BAD_PARAM
+        return self._addCmd(ScriptHandle, 'bits', nBits)
+
+    def ni845xSpiScriptUsDelay(self, ScriptHandle, Delay):
+        return self._addCmd(ScriptHandle, 'delay', _val(Delay) * 1e-6)
+
+    def ni845xSpiScriptMsDelay(self, ScriptHandle, Delay):
+        return self._addCmd(ScriptHandle, 'delay', _val(Delay) * 1e-3)
+
+    def ni845xSpiScriptDioConfigureLine(self, ScriptHandle, PortNumber, LineNumber, ConfigurationValue):
+        return self._addCmd(ScriptHandle, 'dioconf', _val(PortNumber), _val(LineNumber),
+                            _val(ConfigurationValue))
+
+    def ni845xSpiScriptDioWriteLine(self, ScriptHandle, PortNumber, LineNumber, WriteData):
+        return self._addCmd(ScriptHandle, 'dioline', _val(PortNumber), _val(LineNumber),
+                            _val(WriteData))
+
+    def ni845xSpiScriptDioWritePort(self, ScriptHandle, PortNumber, WriteData):
+        return self._addCmd(ScriptHandle, 'dioport', _val(PortNumber), _val(WriteData))
+
+    def ni845xSpiScriptWriteRead(self, ScriptHandle, WriteSize, pWriteData, pScriptReadIndex):
+        scr = self._get(ScriptHandle, _Script)
+        if scr is None:
+            return EMU_ERR_BAD_HANDLE
+        nBytes = _val(WriteSize)
+        if nBytes < 1:
+            return EMU_ERR_BAD_PARAM
+        idx = len(scr.readData)
+        scr.readData[idx] = b''
+        scr.cmds.append(('wr', idx, _readBytes(pWriteData, nBytes)))
+        _setVal(pScriptReadIndex, idx)
+        return EMU_SUCCESS
+
+    def ni845xSpiScriptRun(self, ScriptHandle, DeviceHandle, PortNumber):
+        scr = self._get(ScriptHandle, _Script)
+        dev = self._get(DeviceHandle, _Device)
+        if scr is None or dev is None:
+            return EMU_ERR_BAD_HANDLE
+
+        t = self.usbLatency + self.cmdTime * len(scr.cmds)
+        clockRate = 1000
+        nBits = 8
+        for cmd in scr.cmds:
+            op = cmd[0]
+            if op == 'clk':
+                clockRate = cmd[1]
+            elif op == 'bits':
+                nBits = cmd[1]
+            elif op == 'cslow':
+                if cmd[1] not in dev.csLow:
+                    dev.csLow.add(cmd[1])
+                    self.model.select(cmd[1])
+            elif op == 'cshigh':
+                if cmd[1] in dev.csLow:
+                    dev.csLow.discard(cmd[1])
+                    self.model.deselect(cmd[1])
+            elif op == 'delay':
+                t += cmd[1]
+            elif op == 'dioline':
+                self._dioLine(dev, cmd[1], cmd[2], cmd[3])
+            elif op == 'dioport':
+                dev.dioPort[cmd[1]] = cmd[2] & 0xff
+            elif op == 'wr':
+                scr.readData[cmd[1]] = self._transfer(dev, cmd[2], nBits, clockRate)
+                t += self._clock(nBits * self._nSamples(len(cmd[2]), nBits), clockRate)
+
+        self.nRuns += 1
+        self._spend(t)
+        return EMU_SUCCESS
+
+    @staticmethod
+    def _nSamples(nBytes, nBits):
+        return max(nBytes // ((nBits + 7) // 8), 1)
+
+    def _transfer(self, dev, data, nBits, clockRate=1000):
+        '''Clock data (bytes, MSB first per sample) through the bus model
+        at clockRate (kHz, passed to models with a setClock() hook)'''
+        setClock = getattr(self.model, 'setClock', None)
+        if setClock is not None:
+            setClock(clockRate)
+        bps = (nBits + 7) // 8
+        mask = (1 << nBits) - 1
+        cs = frozenset(dev.csLow)
+        out = bytearray()
+        for pos in range(0, len(data) - bps + 1, bps):
+            value = int.from_bytes(data[pos:pos + bps], 'big') & mask
+            rVal = self.model.transfer(cs, nBits, value) & mask
+            out += rVal.to_bytes(bps, 'big')
+        return bytes(out)
+
+    def ni845xSpiScriptExtractReadDataSize(self, ScriptHandle, ScriptReadIndex, pReadDataSize):
+        scr = self._get(ScriptHandle, _Script)
+        if scr is None:
+            return EMU_ERR_BAD_HANDLE
+        data = scr.readData.get(_val(ScriptReadIndex))
+        if data is None:
+            return EMU_ERR_BAD_SCRIPT
+        _setVal(pReadDataSize, len(data))
+        return EMU_SUCCESS
+
+    def ni845xSpiScriptExtractReadData(self, ScriptHandle, ScriptReadIndex, pReadData):
+        scr = self._get(ScriptHandle, _Script)
+        if scr is None:
+            return EMU_ERR_BAD_HANDLE
+        data = scr.readData.get(_val(ScriptReadIndex))
+        if data is None:
+            return EMU_ERR_BAD_SCRIPT
+        _writeBytes(pReadData, data)
+        return EMU_SUCCESS
+
+    # --------------------------------------------------------------------------
+    # SPI CONFIGURATION (ni845xSpiWriteRead path)
+    # --------------------------------------------------------------------------
+    def ni845xSpiConfigurationOpen(self, pConfigurationHandle):
+        return self._newHandle(_Config(), pConfigurationHandle)
+
+    def ni845xSpiConfigurationClose(self, ConfigurationHandle):
+        if self._get(ConfigurationHandle, _Config) is None:
+            return EMU_ERR_BAD_HANDLE
+        del self._handles[_val(ConfigurationHandle)]
+        return EMU_SUCCESS
+
+    def _setCfg(self, ConfigurationHandle, attr, value):
+        cfg = self._get(ConfigurationHandle, _Config)
+        if cfg is None:
+            return EMU_ERR_BAD_HANDLE
+        setattr(cfg, attr, _val(value))
+        return EMU_SUCCESS
+
+    def _getCfg(self, ConfigurationHandle, attr, pValue):
+        cfg = self._get(ConfigurationHandle, _Config)
+        if cfg is None:
+            return EMU_ERR_BAD_HANDLE
+        _setVal(pValue, getattr(cfg, attr))
+        return EMU_SUCCESS
+
+    def ni845xSpiConfigurationSetChipSelect(self, ConfigurationHandle, ChipSelect):
+        return self._setCfg(ConfigurationHandle, 'chipSelect', ChipSelect)
+
+    def ni845xSpiConfigurationGetChipSelect(self, ConfigurationHandle, pChipSelect):
+        return self._getCfg(ConfigurationHandle, 'chipSelect', pChipSelect)
+
+    def ni845xSpiConfigurationSetClockPhase(self, ConfigurationHandle, ClockPhase):
+        return self._setCfg(ConfigurationHandle, 'clockPhase', ClockPhase)
+
+    def ni845xSpiConfigurationGetClockPhase(self, ConfigurationHandle, pClockPhase):
+        return self._getCfg(ConfigurationHandle, 'clockPhase', pClockPhase)
+
+    def ni845xSpiConfigurationSetClockPolarity(self, ConfigurationHandle, ClockPolarity):
+        return self._setCfg(ConfigurationHandle, 'clockPolarity', ClockPolarity)
+
+    def ni845xSpiConfigurationGetClockPolarity(self, ConfigurationHandle, pClockPolarity):
+        return self._getCfg(ConfigurationHandle, 'clockPolarity', pClockPolarity)
+
+    def ni845xSpiConfigurationSetClockRate(self, ConfigurationHandle, ClockRate):
+        if _val(ClockRate) <= 0:
+            return EMU_ERR_BAD_PARAM
+        return self._setCfg(ConfigurationHandle, 'clockRate', ClockRate)
+
+    def ni845xSpiConfigurationGetClockRate(self, ConfigurationHandle, pClockRate):
+        return self._getCfg(ConfigurationHandle, 'clockRate', pClockRate)
+
+    def ni845xSpiConfigurationSetNumBitsPerSample(self, ConfigurationHandle, NumBitsPerSample):
+        nBits = _val(NumBitsPerSample)
+        if nBits < 4 or nBits > 16:
+            return EMU_ERR_BAD_PARAM
+        return self._setCfg(ConfigurationHandle, 'numBits', nBits)
+
+    def ni845xSpiConfigurationGetNumBitsPerSample(self, ConfigurationHandle, pNumBitsPerSample):
+        return self._getCfg(ConfigurationHandle, 'numBits', pNumBitsPerSample)
+
+    def ni845xSpiConfigurationSetPort(self, ConfigurationHandle, Port):
+        return self._setCfg(ConfigurationHandle, 'port', Port)
+
+    def ni845xSpiConfigurationGetPort(self, ConfigurationHandle, pPort):
+        return self._getCfg(ConfigurationHandle, 'port', pPort)
+
+    def ni845xSpiWriteRead(self, DeviceHandle, ConfigurationHandle, WriteSize, pWriteData,
+                           pReadSize, pReadData):
+        dev = self._get(DeviceHandle, _Device)
+        cfg = self._get(ConfigurationHandle, _Config)
+        if dev is None or cfg is None:
+            return EMU_ERR_BAD_HANDLE
+        nBytes = _val(WriteSize)
+        if nBytes < 1:
+            return EMU_ERR_BAD_PARAM
+        data = _readBytes(pWriteData, nBytes)
+
+        dev.csLow.add(cfg.chipSelect)
+        self.model.select(cfg.chipSelect)
+        rData = self._transfer(dev, data, cfg.numBits, cfg.clockRate)
+        dev.csLow.discard(cfg.chipSelect)
+        self.model.deselect(cfg.chipSelect)
+
+        _setVal(pReadSize, len(rData))
+        _writeBytes(pReadData, rData)
+        self.nRuns += 1
+        self._spend(self.usbLatency +
+                    self._clock(cfg.numBits * self._nSamples(nBytes, cfg.numBits), cfg.clockRate))
+        return EMU_SUCCESS
@@ -0,0 +1,178 @@
+#-------------------------------------------------------------------------------
+# Name:        ni845x backend loader
+# Purpose:     Selects the Ni845x.dll backend (real DLL or emulator) used by
+#              SPI (ni8452io.py) and NI8452Interface (NI845x.py)
+#
+# Authors:      astreet and  Daskalakispiros
+#
+# Created:     25/04/2020
+# Copyright:   (c) astreet 2020
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+
+
+#-------------------------------------------------------------------------------
+# Backend selection
+#
+#   None       NI845X_BACKEND environment variable if set, else the DLL
+#   'dll'      c:/windows/system32/Ni845x.dll
+#   'emu'      in-process Ni845xEmulator (ni845xemu.py)
+#   '<path>'   any other string is loaded as a DLL path
+#   object     used as-is (e.g. a configured Ni845xEmulator instance)
+#
+# DLLs are wrapped in a typed Ni845xBinding (prototypes below): scalar
+# arguments are passed as plain ints, pointer arguments as byref(x), ctypes
+# arrays or string buffers.
+#-------------------------------------------------------------------------------
+import ctypes as c
+import os
+import sys
+
+DLL_PATH    = 'c:/windows/system32/Ni845x.dll'
+BACKEND_ENV = 'NI845X_BACKEND'
+
+#For whatever reason, when using python3, it uses 64 bit pointers
+# but for python2, these functions use 32 bit pointers. (on my comp at least)
+NiHandle = c.c_ulonglong if sys.version_info[0] == 3 else c.c_ulong
+
+_P = c.c_void_p     # out-parameters and buffers
+
+
+#-------------------------------------------------------------------------------
+# Prototypes: name -> (restype, argtypes), as in ni845x.h
+#-------------------------------------------------------------------------------
+PROTOTYPES = {
+    # Device
+    'ni845xFindDevice':                          (c.c_int32, (_P, _P, _P)),
+    'ni845xFindDeviceNext':                      (c.c_int32, (NiHandle, _P)),
+    'ni845xCloseFindDeviceHandle':               (c.c_int32, (NiHandle,)),
+    'ni845xOpen':                                (c.c_int32, (c.c_char_p, _P)),
+    'ni845xClose':                               (c.c_int32, (NiHandle,)),
+    'ni845xSetIoVoltageLevel':                   (c.c_int32, (NiHandle, c.c_uint8)),
+    'ni845xSetTimeout':                          (c.c_int32, (NiHandle, c.c_uint32)),
+    'ni845xStatusToString':                      (None,      (c.c_int32, c.c_uint32, _P)),
+
+    # DIO
+    'ni845xDioSetPortLineDirectionMap':          (c.c_int32, (NiHandle, c.c_uint8, c.c_uint8)),
+    'ni845xDioWritePort':                        (c.c_int32, (NiHandle, c.c_uint8, c.c_uint8)),
+    'ni845xDioReadPort':                         (c.c_int32, (NiHandle, c.c_uint8, _P)),
+    'ni845xDioWriteLine':                        (c.c_int32, (NiHandle, c.c_uint8, c.c_uint8, c.c_int32)),
+    'ni845xDioReadLine':                         (c.c_int32, (NiHandle, c.c_uint8, c.c_uint8, _P)),
+
+    # SPI basic API
+    'ni845xSpiConfigurationOpen':                (c.c_int32, (_P,)),
+    'ni845xSpiConfigurationClose':               (c.c_int32, (NiHandle,)),
+    'ni845xSpiConfigurationSetChipSelect':       (c.c_int32, (NiHandle, c.c_uint32)),
+    'ni845xSpiConfigurationSetClockPhase':       (c.c_int32, (NiHandle, c.c_int32)),
+    'ni845xSpiConfigurationSetClockPolarity':    (c.c_int32, (NiHandle, c.c_int32)),
+    'ni845xSpiConfigurationSetClockRate':        (c.c_int32, (NiHandle, c.c_uint16)),
+    'ni845xSpiConfigurationSetNumBitsPerSample': (c.c_int32, (NiHandle, c.c_uint16)),
+    'ni845xSpiConfigurationSetPort':             (c.c_int32, (NiHandle, c.c_uint8)),
+    'ni845xSpiConfigurationGetChipSelect':       (c.c_int32, (NiHandle, _P)),
+    'ni845xSpiConfigurationGetClockPhase':       (c.c_int32, (NiHandle, _P)),
+    'ni845xSpiConfigurationGetClockPolarity':    (c.c_int32, (NiHandle, _P)),
+    'ni845xSpiConfigurationGetClockRate':        (c.c_int32, (NiHandle, _P)),
+    'ni845xSpiConfigurationGetNumBitsPerSample': (c.c_int32, (NiHandle, _P)),
+    'ni845xSpiConfigurationGetPort':             (c.c_int32, (NiHandle, _P)),
+    'ni845xSpiWriteRead':                        (c.c_int32, (NiHandle, NiHandle, c.c_uint32, _P, _P, _P)),
+
+    # SPI scripting
+    'ni845xSpiScriptOpen':                       (c.c_int32, (_P,)),
+    'ni845xSpiScriptClose':                      (c.c_int32, (NiHandle,)),
+    'ni845xSpiScriptReset':                      (c.c_int32, (NiHandle,)),
+    'ni845xSpiScriptEnableSPI':                  (c.c_int32, (NiHandle,)),
+    'ni845xSpiScriptDisableSPI':                 (c.c_int32, (NiHandle,)),
+    'ni845xSpiScriptClockPolarityPhase':         (c.c_int32, (NiHandle, c.c_int32, c.c_int32)),
+    'ni845xSpiScriptClockRate':                  (c.c_int32, (NiHandle, c.c_uint16)),
+    'ni845xSpiScriptCSHigh':                     (c.c_int32, (NiHandle, c.c_uint32)),
+    'ni845xSpiScriptCSLow':                      (c.c_int32, (NiHandle, c.c_uint32)),
+    'ni845xSpiScriptNumBitsPerSample':           (c.c_int32, (NiHandle, c.c_uint16)),
+    'ni845xSpiScriptUsDelay':                    (c.c_int32, (NiHandle, c.c_uint16)),
+    'ni845xSpiScriptMsDelay':                    (c.c_int32, (NiHandle, c.c_uint16)),
+    'ni845xSpiScriptDioConfigureLine':           (c.c_int32, (NiHandle, c.c_uint8, c.c_uint8, c.c_int32)),
+    'ni845xSpiScriptDioWriteLine':               (c.c_int32, (NiHandle, c.c_uint8, c.c_uint8, c.c_int32)),
+    'ni845xSpiScriptDioWritePort':               (c.c_int32, (NiHandle, c.c_uint8, c.c_uint8)),
+    'ni845xSpiScriptWriteRead':                  (c.c_int32, (NiHandle, c.c_uint32, _P, _P)),
+    'ni845xSpiScriptRun':                        (c.c_int32, (NiHandle, NiHandle, c.c_uint8)),
+    'ni845xSpiScriptExtractReadDataSize':        (c.c_int32, (NiHandle, c.c_uint32, _P)),
+    'ni845xSpiScriptExtractReadData':            (c.c_int32, (NiHandle, c.c_uint32, _P)),
+}
+
+
+class Ni845xError(Exception):
+    """Error status returned by a checked ni845x call"""
+
+    def __init__(self, status, func=""):
+        Exception.__init__(self, "%s returned %d" % (func, status))
+        self.status = status
+        self.func = func
+
+
+def _errcheck(result, func, args):
+    '''errcheck of checked bindings: raises Ni845xError on a negative (error)
+    status, warnings (positive) are returned'''
+    if result is not None and result < 0:
+        raise Ni845xError(result, func.__name__)
+    return result
+
+
+class Ni845xBinding(object):
+    '''Typed entry points of a loaded Ni845x.dll.
+    Each PROTOTYPES function is built once (argtypes/restype) and kept as an
+    attribute, so calls skip the DLL attribute lookup and convert scalar
+    arguments in C. Names not in PROTOTYPES fall back to the untyped DLL.
+    check=True adds errcheck: error status raises Ni845xError'''
+
+    def __init__(self, lib, callConv='windll', check=False):
+        self._lib = lib
+        if callConv == 'windll' and hasattr(c, 'WINFUNCTYPE'):
+            factory = c.WINFUNCTYPE
+        else:
+            factory = c.CFUNCTYPE
+        for name, (restype, argtypes) in PROTOTYPES.items():
+            try:
+                func = factory(restype, *argtypes)((name, lib))
+            except AttributeError:
+                # Not exported by this driver version
+                continue
+            func.__name__ = name
+            if check:
+                func.errcheck = _errcheck
+            setattr(self, name, func)
+
+    def __getattr__(self, name):
+        return getattr(self._lib, name)
+
+
+def bindLibrary(lib, callConv='windll', check=False):
+    '''Returns the typed binding of a loaded DLL. Other backends (bindings,
+    the emulator: takes ints and ctypes objects alike) are returned as-is'''
+    if isinstance(lib, c.CDLL):
+        return Ni845xBinding(lib, callConv, check)
+    return lib
+
+
+def loadLibrary(backend=None, callConv='windll'):
+    '''Returns the ni845x library object for backend (see notes above).
+    callConv selects ctypes windll/cdll for DLL backends (cdll off Windows).
+    Raises OSError if the DLL can not be loaded'''
+    if backend is None:
+        backend = os.environ.get(BACKEND_ENV, 'dll')
+
+    if not isinstance(backend, str):
+        return bindLibrary(backend, callConv)
+
+    if backend.lower() == 'emu':
+        try:
+            from Example2.ni845xemu import Ni845xEmulator
+        except ImportError:
+            from ni845xemu import Ni845xEmulator
+        return Ni845xEmulator()
+
+    fSpec = DLL_PATH if backend.lower() == 'dll' else backend
+    loader = getattr(c, callConv, None)
+    if loader is None:
+        loader = c.cdll
+        callConv = 'cdll'
+    return Ni845xBinding(loader.LoadLibrary(fSpec), callConv)